@@ -0,0 +1,73 @@
+"""
+Per-callback cost of utils.callback_codec: encode, decode and dispatch.
+
+    python benchmarks/bench_callback_codec.py [-n 200000]
+
+"dispatch" is decode + handler table lookup, the work sos_button_router does
+before a handler runs. The legacy row is the old split(":") + if/elif chain.
+decode() is LRU-cached; the "uncached" row is the cost of a first tap.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import callback_codec  # noqa: E402
+
+EVENT_ID = "-1001234567890_123456"
+
+TABLE = {action: (lambda cb: None) for action in callback_codec._ACTION_CODES}
+
+
+def legacy_dispatch(data: str) -> None:
+    parts = data.split(":")
+    action = parts[1] if len(parts) > 1 else None
+    if action == "req":
+        if len(parts) != 4 or not parts[3]:
+            return
+    elif action == "optin":
+        if len(parts) != 3 or not parts[2]:
+            return
+    elif action == "view_helpers":
+        if len(parts) != 3 or not parts[2]:
+            return
+    elif action == "resolved":
+        if len(parts) != 3 or not parts[2]:
+            return
+
+
+def table_dispatch(data: str) -> None:
+    callback = callback_codec.decode(data)
+    TABLE[callback.action](callback)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200_000)
+    args = parser.parse_args()
+
+    v1_req = callback_codec.encode(callback_codec.REQ, EVENT_ID, "medicine")
+    v1_optin = callback_codec.encode(callback_codec.OPTIN, EVENT_ID)
+    legacy_req = f"sos:req:medicine:{EVENT_ID}"
+
+    cases = [
+        ("encode req", lambda: callback_codec.encode(callback_codec.REQ, EVENT_ID, "medicine")),
+        ("decode v1 req", lambda: callback_codec.decode(v1_req)),
+        ("decode v1 optin", lambda: callback_codec.decode(v1_optin)),
+        ("decode v1 req (uncached)", lambda: callback_codec.decode.__wrapped__(v1_req)),
+        ("decode legacy req", lambda: callback_codec.decode(legacy_req)),
+        ("dispatch v1 req", lambda: table_dispatch(v1_req)),
+        ("dispatch legacy (split + if/elif)", lambda: legacy_dispatch(legacy_req)),
+    ]
+
+    print(f"payload sizes: v1={len(v1_req.encode())}B legacy={len(legacy_req.encode())}B "
+          f"(limit {callback_codec.MAX_CALLBACK_DATA}B)")
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=args.n, repeat=5))
+        print(f"{name:<36} {best / args.n * 1e9:8.0f} ns/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Nearest-helper lookup cost of storage.location_index.LocationIndex.
+
+    python benchmarks/bench_location_index.py --users 10000,50000,200000 -k 10
+
+Users are scattered around a city centre (normal distribution, ~15 km
+sigma); SOS points are drawn the same way. The "scan" row is the brute
+force alternative: distance to every registered user, then sort.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.location_index import LocationIndex, distance_km  # noqa: E402
+
+CENTRE = (35.70, 51.40)
+
+
+def point(rng: random.Random) -> tuple:
+    return CENTRE[0] + rng.gauss(0, 0.14), CENTRE[1] + rng.gauss(0, 0.17)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="10000,50000,200000")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--max-km", type=float, default=25.0)
+    parser.add_argument("--cell-km", type=float, default=1.0)
+    parser.add_argument("-n", type=int, default=2000, help="queries per size")
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'cells':>7} {'grid us/query':>14} {'scan us/query':>14}")
+    for size in (int(x) for x in args.users.split(",")):
+        rng = random.Random(size)
+        index = LocationIndex(cell_km=args.cell_km, max_km=args.max_km, k=args.k)
+        points = {user_id: point(rng) for user_id in range(size)}
+        for user_id, (lat, lon) in points.items():
+            index.update(user_id, lat, lon)
+        queries = [point(rng) for _ in range(args.n)]
+
+        started = time.perf_counter()
+        for lat, lon in queries:
+            index.nearest(lat, lon)
+        grid = (time.perf_counter() - started) / len(queries)
+
+        scan_queries = queries[: max(1, args.n // 100)]
+        started = time.perf_counter()
+        for lat, lon in scan_queries:
+            sorted(
+                (distance_km(lat, lon, p[0], p[1]), u) for u, p in points.items()
+            )[: args.k]
+        scan = (time.perf_counter() - started) / len(scan_queries)
+
+        print(f"{size:>8} {len(index._cells):>7} {grid * 1e6:>14.1f} {scan * 1e6:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
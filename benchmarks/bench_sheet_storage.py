@@ -0,0 +1,178 @@
+"""
+How SheetStorage operations scale with worksheet size.
+
+    python benchmarks/bench_sheet_storage.py --rows 10000,100000,500000 \\
+        --latency 0.15 --per-row-latency 0.000002 --read-per-minute 300
+
+Every worksheet is seeded with N rows in benchmarks/sheets_emulator.py and
+each operation runs --repeat times against it. Per operation the table shows
+wall time, API calls and rows transferred per invocation, so a storage
+change can be compared with the numbers before it. With quota limits set,
+a rejected call waits and retries like the production backoff; the wait is
+part of the time and the retries are reported.
+
+Rough memory: ~1 GB at 500k rows (five worksheets held in process).
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.sheets_emulator import EmulatedSpreadsheet, QuotaExceeded  # noqa: E402
+from storage.sheet_storage import SheetStorage  # noqa: E402
+
+RESOURCES = ("water", "medicine", "power", "food")
+MEDICAL_LABELS = ("blood_type", "allergies", "conditions")
+
+
+def seed(spreadsheet: EmulatedSpreadsheet, rows: int, active_every: int) -> None:
+    """
+    N rows per worksheet; one session in `active_every` is still ACTIVE.
+    """
+    chat_id = "-1001234567890"
+    sessions, helpers, resources, medical, registrations = [], [], [], [], []
+    for i in range(rows):
+        event_id = f"{chat_id}_{i}"
+        user_id = str(10_000 + i)
+        status = "ACTIVE" if i % active_every == 0 else "CLOSED"
+        sessions.append([event_id, chat_id, user_id, status, "" if status == "ACTIVE" else user_id])
+        # helpers / requests spread over the most recent sessions
+        target = f"{chat_id}_{i - i % 10}"
+        helpers.append([target, str(20_000 + i)])
+        resources.append([target, user_id, RESOURCES[i % len(RESOURCES)], "1"])
+        medical.append([str(10_000 + i // len(MEDICAL_LABELS)), MEDICAL_LABELS[i % len(MEDICAL_LABELS)], "x"])
+        registrations.append([user_id, f"u{i}", f"first{i}", "", user_id])
+
+    spreadsheet.worksheet("sos_sessions").seed(sessions)
+    spreadsheet.worksheet("helpers").seed(helpers)
+    spreadsheet.worksheet("resource_requests").seed(resources)
+    spreadsheet.worksheet("medical").seed(medical)
+    spreadsheet.worksheet("registrations").seed(registrations)
+
+
+class Runner:
+    def __init__(self, storage: SheetStorage, spreadsheet: EmulatedSpreadsheet, repeat: int) -> None:
+        self.storage = storage
+        self.spreadsheet = spreadsheet
+        self.repeat = repeat
+        self.retries = 0
+
+    def _call(self, fn: Callable[[], Any]) -> None:
+        while True:
+            try:
+                fn()
+                return
+            except QuotaExceeded:
+                # production backs off in QuotaScheduler; here: wait and retry
+                self.retries += 1
+                time.sleep(1.0)
+
+    def measure(self, setups: List[Tuple[Callable[[], None], Callable[[], Any]]]) -> Dict[str, float]:
+        """
+        setups: (prepare, op) per repetition; prepare is not measured.
+        """
+        stats = self.spreadsheet.stats
+        elapsed = 0.0
+        calls = rows = 0
+        retries_before = self.retries
+        for prepare, op in setups:
+            prepare()
+            stats.reset()
+            started = time.perf_counter()
+            self._call(op)
+            elapsed += time.perf_counter() - started
+            calls += stats.total_calls()
+            rows += stats.total_rows()
+        n = len(setups)
+        return {
+            "ms": elapsed / n * 1000,
+            "calls": calls / n,
+            "rows": rows / n,
+            "retries": (self.retries - retries_before) / n,
+        }
+
+
+def run_size(rows: int, args: argparse.Namespace) -> List[Tuple[str, Dict[str, float]]]:
+    spreadsheet = EmulatedSpreadsheet(
+        latency=args.latency,
+        per_row_latency=args.per_row_latency,
+        read_per_minute=args.read_per_minute,
+        write_per_minute=args.write_per_minute,
+    )
+    seed(spreadsheet, rows, args.active_every)
+    storage = SheetStorage(sheet_id="bench", credentials_json="{}")
+    storage._attach(spreadsheet)
+    runner = Runner(storage, spreadsheet, args.repeat)
+
+    chat_id = -1001234567890
+    # newest active sessions, like a close right after an SOS
+    active = [i for i in range(rows - 1, -1, -1) if i % args.active_every == 0][: args.repeat * 2]
+    warm_ids = [f"{chat_id}_{i}" for i in active[: args.repeat]]
+    cold_ids = [f"{chat_id}_{i}" for i in active[args.repeat:]] or warm_ids
+    user_ids = [10_000 + (rows - 1 - k) // len(MEDICAL_LABELS) for k in range(args.repeat)]
+
+    def noop() -> None:
+        pass
+
+    def forget_index() -> None:
+        storage._session_rows = {}
+
+    storage.load_session_index()
+    storage.load_registration_index()
+
+    results = [
+        (
+            "close_sos_session (indexed)",
+            runner.measure([(noop, lambda e=e: storage.close_sos_session(e, 1)) for e in warm_ids]),
+        ),
+        (
+            "close_sos_session (index miss)",
+            runner.measure([(forget_index, lambda e=e: storage.close_sos_session(e, 1)) for e in cold_ids]),
+        ),
+        ("load_session_index", runner.measure([(noop, storage.load_session_index)] * args.repeat)),
+        ("get_active_sos_sessions", runner.measure([(noop, storage.get_active_sos_sessions)] * args.repeat)),
+        (
+            "get_user_medical_info",
+            runner.measure([(noop, lambda u=u: storage.get_user_medical_info(u)) for u in user_ids]),
+        ),
+        ("get_all_medical_info", runner.measure([(noop, storage.get_all_medical_info)] * args.repeat)),
+        ("get_all_registrations", runner.measure([(noop, storage.get_all_registrations)] * args.repeat)),
+        (
+            "update_registration (indexed)",
+            runner.measure(
+                [
+                    (noop, lambda u=u: storage.update_registration(u, "renamed", "x", "", u))
+                    for u in range(10_000 + rows - args.repeat, 10_000 + rows)
+                ]
+            ),
+        ),
+    ]
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000", help="comma-separated worksheet sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="invocations per operation")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per API call")
+    parser.add_argument("--per-row-latency", type=float, default=0.0, help="extra seconds per row transferred")
+    parser.add_argument("--read-per-minute", type=float, default=None)
+    parser.add_argument("--write-per-minute", type=float, default=None)
+    parser.add_argument("--active-every", type=int, default=50, help="1 in N sessions is ACTIVE")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.rows.split(",") if x.strip()]
+    print(f"latency={args.latency}s per_row={args.per_row_latency}s "
+          f"quota read={args.read_per_minute} write={args.write_per_minute}/min repeat={args.repeat}")
+    print(f"{'rows':>8}  {'operation':<32} {'ms/op':>10} {'calls/op':>9} {'rows/op':>10} {'retries':>8}")
+    for size in sizes:
+        for name, r in run_size(size, args):
+            print(f"{size:>8}  {name:<32} {r['ms']:>10.1f} {r['calls']:>9.1f} "
+                  f"{r['rows']:>10.0f} {r['retries']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
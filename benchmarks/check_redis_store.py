@@ -0,0 +1,213 @@
+"""
+Race check of handlers.sos.session_store.RedisSessionStore: two store
+instances (two replicas) on one server hammer the same SOS.
+
+    pip install "fakeredis[lua]" redis
+    python benchmarks/check_redis_store.py --rounds 200 --helpers 40
+    python benchmarks/check_redis_store.py --redis-url redis://localhost:6379/15
+
+Per round both replicas create the same session, every helper opts in
+through both, resource taps go to either one, and both try to close it
+at random points in between. Checked afterwards: one create and one
+close win, every helper is added at most once and exactly the winners
+are stored, each tally equals the taps that were accepted, nothing is
+accepted after the close, and a close racing a later opt-in (expiry's
+last_activity check) is refused.
+
+Runs on an in-process fakeredis server (Lua scripts need lupa) unless
+--redis-url points at a real one; keys go under a throwaway prefix and
+are deleted at the end. Exits 1 on the first round that breaks a rule.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.sos.session_registry import SOSSession  # noqa: E402
+from handlers.sos.session_store import RedisSessionStore  # noqa: E402
+
+RESOURCES = ("water", "medicine", "power")
+
+
+class RaceFailed(Exception):
+    pass
+
+
+def check(ok: bool, message: str) -> None:
+    if not ok:
+        raise RaceFailed(message)
+
+
+def build_stores(args: argparse.Namespace, prefix: str) -> Tuple[RedisSessionStore, RedisSessionStore]:
+    if args.redis_url:
+        return (
+            RedisSessionStore(args.redis_url, prefix=prefix),
+            RedisSessionStore(args.redis_url, prefix=prefix),
+        )
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit('fakeredis is not installed: pip install "fakeredis[lua]" (or pass --redis-url)')
+
+    server = fakeredis.FakeServer()
+    return tuple(
+        RedisSessionStore(prefix=prefix, client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        for _ in range(2)
+    )
+
+
+async def jittered(rng: random.Random, jitter: float, call: Any) -> Any:
+    await asyncio.sleep(rng.random() * jitter)
+    return await call
+
+
+async def race_round(
+    stores: Tuple[RedisSessionStore, RedisSessionStore],
+    event_id: str,
+    rng: random.Random,
+    helpers: int,
+    taps: int,
+    jitter: float,
+) -> Dict[str, int]:
+    a, b = stores
+    created = await asyncio.gather(
+        *(store.create(SOSSession(event_id, -100, 1, message_id=1)) for store in stores)
+    )
+    check(sorted(created) == [False, True], f"{event_id}: create() won {created.count(True)} times")
+
+    # (kind, key, store index) in random order, two closes somewhere in the middle
+    ops: List[Tuple[str, Any, int]] = [("helper", 1000 + h, i) for h in range(helpers) for i in (0, 1)]
+    ops += [("resource", rng.choice(RESOURCES), rng.randrange(2)) for _ in range(taps)]
+    rng.shuffle(ops)
+    for closer in (0, 1):
+        ops.insert(rng.randrange(len(ops) // 4, len(ops) + 1), ("close", 10 + closer, closer))
+
+    def call(kind: str, key: Any, i: int) -> Any:
+        store = stores[i]
+        if kind == "helper":
+            return store.add_helper(event_id, key, f"h{key}")
+        if kind == "resource":
+            return store.add_resource_request(event_id, key)
+        return store.close(event_id, key)
+
+    results = await asyncio.gather(*(jittered(rng, jitter, call(*op)) for op in ops))
+
+    closes = [(key, res) for (kind, key, _), res in zip(ops, results) if kind == "close"]
+    winners = [key for key, res in closes if res]
+    check(len(winners) == 1, f"{event_id}: close() won {len(winners)} times")
+
+    added = collections.Counter(key for (kind, key, _), res in zip(ops, results) if kind == "helper" and res)
+    check(all(n == 1 for n in added.values()), f"{event_id}: a helper was added twice")
+    tallies: Dict[str, List[int]] = collections.defaultdict(list)
+    for (kind, key, _), res in zip(ops, results):
+        if kind == "resource" and res is not None:
+            tallies[key].append(res)
+
+    session_key, helpers_key, order_key, resources_key = a._keys(event_id)
+    raw = a._redis
+    fields = await raw.hgetall(session_key)
+    check(fields.get("status") == "CLOSED", f"{event_id}: status {fields.get('status')!r}")
+    check(fields.get("closed_by") == str(winners[0]), f"{event_id}: closed_by is not the winning close")
+    stored = [int(user_id) for user_id in await raw.lrange(order_key, 0, -1)]
+    check(len(stored) == len(set(stored)), f"{event_id}: duplicate helper in opt-in order")
+    check(set(stored) == set(added), f"{event_id}: stored helpers differ from accepted opt-ins")
+    check(
+        set(map(int, await raw.hkeys(helpers_key))) == set(added),
+        f"{event_id}: helper names hash differs from accepted opt-ins",
+    )
+    stored_tallies = {k: int(v) for k, v in (await raw.hgetall(resources_key)).items()}
+    for resource_type, values in tallies.items():
+        check(
+            sorted(values) == list(range(1, len(values) + 1)),
+            f"{event_id}: {resource_type} tallies {sorted(values)} are not 1..n",
+        )
+        check(
+            stored_tallies.get(resource_type) == len(values),
+            f"{event_id}: {resource_type} stored {stored_tallies.get(resource_type)}, accepted {len(values)}",
+        )
+
+    # closed: nothing gets in any more, through either replica
+    for store in stores:
+        check(await store.get(event_id) is None, f"{event_id}: get() returns a closed session")
+        check(await store.add_helper(event_id, 1, "late") is None, f"{event_id}: opt-in after close")
+        check(await store.add_resource_request(event_id, "water") is None, f"{event_id}: request after close")
+        check(not await store.close(event_id, 99), f"{event_id}: second close succeeded")
+    check(not await raw.sismember(a._active_key, event_id), f"{event_id}: still in the active set")
+    for key in a._keys(event_id):
+        # -1: kept forever (-2: never created, e.g. closed before any opt-in)
+        check(await raw.ttl(key) != -1, f"{event_id}: {key} has no expiry after close")
+
+    return {"helpers": len(added), "taps": sum(len(v) for v in tallies.values()), "closer": winners[0]}
+
+
+async def expiry_round(stores: Tuple[RedisSessionStore, RedisSessionStore], event_id: str) -> None:
+    """
+    Replica A read the session as idle; an opt-in then lands on replica B.
+    A's close with the stale last_activity must be refused.
+    """
+    a, b = stores
+    await a.create(SOSSession(event_id, -100, 1, message_id=1, created_at=time.time() - 600))
+    seen = await a.get(event_id)
+    check(await b.add_helper(event_id, 7, "h7"), f"{event_id}: opt-in on replica B refused")
+    check(
+        not await a.close(event_id, 0, last_activity=seen.last_activity),
+        f"{event_id}: expiry closed a session with newer activity",
+    )
+    fresh = await a.get(event_id)
+    check(fresh is not None and fresh.last_activity > seen.last_activity, f"{event_id}: last_activity not shared")
+    check(await a.close(event_id, 0, last_activity=fresh.last_activity), f"{event_id}: up-to-date close refused")
+
+
+async def run(args: argparse.Namespace) -> int:
+    prefix = f"sos-check-{os.getpid()}"
+    stores = build_stores(args, prefix)
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    totals: Dict[str, int] = collections.Counter()
+    closers: Dict[int, int] = collections.Counter()
+    try:
+        for n in range(args.rounds):
+            result = await race_round(stores, f"race{n}", rng, args.helpers, args.taps, args.jitter)
+            totals["helpers"] += result["helpers"]
+            totals["taps"] += result["taps"]
+            closers[result["closer"]] += 1
+            await expiry_round(stores, f"expiry{n}")
+    except RaceFailed as e:
+        print(f"FAILED: {e}")
+        return 1
+    finally:
+        raw = stores[0]._redis
+        keys = [key async for key in raw.scan_iter(match=f"{{{prefix}}}:*")]
+        if keys:
+            await raw.delete(*keys)
+        for store in stores:
+            await store.aclose()
+
+    print(
+        f"OK: {args.rounds} rounds in {time.perf_counter() - started:.2f}s, "
+        f"{totals['helpers']} opt-ins and {totals['taps']} resource taps accepted before the close; "
+        f"close won by replica A {closers[10]}x, B {closers[11]}x"
+    )
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Two RedisSessionStore replicas racing on the same SOS.")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--helpers", type=int, default=30, help="helpers opting in per round (through both replicas)")
+    parser.add_argument("--taps", type=int, default=60, help="resource taps per round")
+    parser.add_argument("--jitter", type=float, default=0.002, help="max random delay before each call, seconds")
+    parser.add_argument("--redis-url", default="", help="real server instead of fakeredis")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+End-to-end load harness: synthetic SOS storms through the real handlers.
+
+    python benchmarks/load_harness.py --groups 50 --helpers 400 \\
+        --tg-latency 0.05 --sheets-latency 0.2
+
+Updates are built as Telegram JSON and fed to Application.process_update,
+so routing, callback decoding and every handler run exactly as in
+production. The Bot talks to FakeRequest (records each API method, adds
+--tg-latency per call) and storage is the real SheetStorage/AsyncSheetWriter
+stack attached to an in-process worksheet emulator.
+
+Phases: SOS storm (one /sos per group) -> helper storm (opt-ins, resource
+taps with repeats, helper lists) -> resolve -> drain. Per phase it reports
+throughput, p50/p95/p99 handler latency, event-loop blocking, and the
+Telegram and Sheets calls made.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, ApplicationBuilder  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+import main as bot_main  # noqa: E402
+from benchmarks.sheets_emulator import EmulatedSpreadsheet  # noqa: E402
+from handlers.sos.request_debouncer import ResourceRequestDebouncer  # noqa: E402
+from handlers.sos.session_locks import SessionLocks  # noqa: E402
+from handlers.sos.session_registry import SessionRegistry  # noqa: E402
+from handlers.sos.session_store import InMemorySessionStore  # noqa: E402
+from handlers.sos.status_message import StatusMessageUpdater  # noqa: E402
+from storage.async_writer import AsyncSheetWriter  # noqa: E402
+from storage.medical_index import MedicalIndex  # noqa: E402
+from storage.registration_index import RegistrationIndex  # noqa: E402
+from storage.sheet_storage import SheetStorage  # noqa: E402
+from storage.sheet_writer import SheetWriter  # noqa: E402
+from utils import callback_codec  # noqa: E402
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "SOS", "username": "sos_bench_bot"}
+RESOURCES = ("water", "medicine", "power")
+
+
+# -------- Fake Telegram API --------
+
+
+class FakeRequest(BaseRequest):
+    """
+    Answers Bot API calls locally after `latency` seconds and counts them.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1000)
+        # chat_id -> last message_id sent there
+        self.last_message: Dict[int, int] = {}
+        # chat_id -> SOS event_id on the keyboard of the last message sent there
+        self.last_event: Dict[int, str] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: Any = None,
+        write_timeout: Any = None,
+        connect_timeout: Any = None,
+        pool_timeout: Any = None,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+        if self.latency and api_method != "getMe":
+            await asyncio.sleep(self.latency)
+
+        if api_method == "getMe":
+            result: Any = dict(BOT_USER, can_join_groups=True, supports_inline_queries=False)
+        elif api_method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            message_id = next(self._message_ids)
+            self.last_message[chat_id] = message_id
+            event_id = _keyboard_event_id(params.get("reply_markup"))
+            if event_id is not None:
+                self.last_event[chat_id] = event_id
+            result = _message(chat_id, message_id, params.get("text", ""))
+        elif api_method in ("editMessageText", "editMessageReplyMarkup"):
+            result = _message(int(params["chat_id"]), int(params["message_id"]), params.get("text", ""))
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def _chat(chat_id: int) -> Dict[str, Any]:
+    if chat_id < 0:
+        return {"id": chat_id, "type": "supergroup", "title": f"group {chat_id}"}
+    return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"u{user_id}"}
+
+
+def _keyboard_event_id(reply_markup: Any) -> Optional[str]:
+    if isinstance(reply_markup, str):
+        reply_markup = json.loads(reply_markup)
+    for row in (reply_markup or {}).get("inline_keyboard", ()):
+        for button in row:
+            try:
+                return callback_codec.decode(button.get("callback_data", "")).event_id
+            except callback_codec.InvalidCallback:
+                continue
+    return None
+
+
+def _message(chat_id: int, message_id: int, text: str, **extra: Any) -> Dict[str, Any]:
+    return dict(
+        message_id=message_id, date=int(time.time()), chat=_chat(chat_id), text=text, **extra
+    )
+
+
+# -------- Update factory --------
+
+
+class UpdateFactory:
+    def __init__(self, bot: Any) -> None:
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._query_ids = itertools.count(1)
+
+    def command(self, chat_id: int, user_id: int, command: str) -> Update:
+        message = _message(
+            chat_id,
+            next(self._update_ids),
+            command,
+            entities=[{"type": "bot_command", "offset": 0, "length": len(command)}],
+        )
+        message["from"] = _user(user_id)
+        return Update.de_json({"update_id": next(self._update_ids), "message": message}, self.bot)
+
+    def button(self, chat_id: int, message_id: int, user_id: int, data: str) -> Update:
+        query = {
+            "id": str(next(self._query_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": _message(chat_id, message_id, "SOS", **{"from": BOT_USER}),
+        }
+        return Update.de_json({"update_id": next(self._update_ids), "callback_query": query}, self.bot)
+
+
+# -------- Measurement --------
+
+
+class LoopMonitor:
+    """
+    Samples event-loop lag: a 1 ms sleep that wakes up late means something
+    held the loop for the difference.
+    """
+
+    def __init__(self, interval: float = 0.001, threshold: float = 0.005) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self.blocked = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.max_lag = self.blocked = 0.0
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.blocked += lag
+
+
+def _pct(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+class Phase:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.tg_calls: Counter = Counter()
+        self.sheets_calls: Counter = Counter()
+        self.sheets_rows = 0
+        self.max_lag = 0.0
+        self.blocked = 0.0
+
+    def report(self) -> str:
+        ms = [x * 1000 for x in self.latencies]
+        n = len(ms)
+        lines = [
+            f"== {self.name}: {n} updates in {self.elapsed:.2f}s "
+            f"({n / self.elapsed if self.elapsed else 0:.0f}/s), {self.errors} errors",
+        ]
+        if ms:
+            lines.append(
+                f"   latency ms  mean={statistics.mean(ms):.1f} p50={_pct(ms, 50):.1f} "
+                f"p95={_pct(ms, 95):.1f} p99={_pct(ms, 99):.1f} max={max(ms):.1f}"
+            )
+        lines.append(f"   loop        max lag={self.max_lag * 1000:.1f}ms blocked={self.blocked * 1000:.0f}ms")
+        lines.append(
+            f"   telegram    {sum(self.tg_calls.values())} calls  "
+            + ", ".join(f"{k}={v}" for k, v in self.tg_calls.most_common())
+        )
+        lines.append(
+            f"   sheets      {sum(self.sheets_calls.values())} calls, {self.sheets_rows} rows  "
+            + ", ".join(f"{s}.{op}={v}" for (s, op), v in self.sheets_calls.most_common())
+        )
+        return "\n".join(lines)
+
+
+class Harness:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.request = FakeRequest(latency=args.tg_latency)
+        self.spreadsheet = EmulatedSpreadsheet(
+            latency=args.sheets_latency,
+            read_per_minute=args.sheets_reads_per_minute,
+            write_per_minute=args.sheets_writes_per_minute,
+        )
+        self.monitor = LoopMonitor()
+        self.phases: List[Phase] = []
+
+    def build(self) -> Application:
+        app = (
+            ApplicationBuilder()
+            .token("123456:BENCHMARK")
+            .request(self.request)
+            .get_updates_request(FakeRequest())
+            .concurrent_updates(True)
+            .build()
+        )
+        bot_main.register_handlers(app)
+        self.app = app
+        self.updates = UpdateFactory(app.bot)
+        return app
+
+    async def setup_storage(self) -> None:
+        """
+        Same bot_data wiring as main.on_startup, on the emulator.
+        """
+        args = self.args
+        medical = self.spreadsheet.worksheet("medical")
+        medical.seed(
+            [[self.requester(g), "blood_type", "O+"] for g in range(args.groups)]
+        )
+
+        storage = SheetStorage(sheet_id="bench", credentials_json="{}")
+        storage._attach(self.spreadsheet)
+        writer = AsyncSheetWriter(
+            SheetWriter(storage),
+            flush_interval=args.flush_interval,
+            read_per_minute=args.sheets_reads_per_minute or 1e9,
+            write_per_minute=args.sheets_writes_per_minute or 1e9,
+        )
+        await writer.connect()
+
+        bot_data = self.app.bot_data
+        bot_data["sheet_storage"] = storage
+        bot_data["sheet_writer"] = writer
+        bot_data["medical_index"] = MedicalIndex(
+            loader=writer.get_all_medical_info, fallback=writer.get_user_medical_info
+        )
+        await bot_data["medical_index"].refresh()
+        bot_data["registration_index"] = RegistrationIndex()
+        bot_data["registration_index"].load({})
+        store = InMemorySessionStore(SessionRegistry())
+        store.rehydrated = True
+        bot_data["sos_store"] = store
+        bot_data["sos_status_updater"] = StatusMessageUpdater(
+            interval=args.edit_interval, loader=store.get
+        )
+        bot_data["sos_locks"] = SessionLocks()
+        bot_data["resource_request_debouncer"] = ResourceRequestDebouncer(
+            writer.log_resource_request, window=args.debounce
+        )
+        self.spreadsheet.stats.reset()
+
+    @staticmethod
+    def group(g: int) -> int:
+        return -1_000_000_000_000 - g
+
+    @staticmethod
+    def requester(g: int) -> int:
+        return 10_000 + g
+
+    async def run_phase(self, name: str, updates: List[Update]) -> Phase:
+        phase = Phase(name)
+        tg_before = Counter(self.request.calls)
+        self.spreadsheet.stats.reset()
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def one(update: Update) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await self.app.process_update(update)
+                except Exception:
+                    phase.errors += 1
+                    logging.getLogger("load_harness").exception("update failed")
+                phase.latencies.append(time.perf_counter() - started)
+
+        self.monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(u) for u in updates))
+        phase.elapsed = time.perf_counter() - started
+        if name == "drain":
+            # debounced edits and buffered rows land in this phase
+            await asyncio.sleep(self.args.edit_interval + 0.1)
+            await self.app.bot_data["resource_request_debouncer"].aclose()
+            # spawned close / expire writes too, or they land in aclose() uncounted
+            await self.app.bot_data["sheet_writer"].drain()
+            phase.elapsed = time.perf_counter() - started
+        await self.monitor.stop()
+
+        phase.max_lag, phase.blocked = self.monitor.max_lag, self.monitor.blocked
+        phase.tg_calls = Counter(self.request.calls) - tg_before
+        stats = self.spreadsheet.stats
+        phase.sheets_calls = Counter(dict(stats.calls))
+        phase.sheets_rows = stats.total_rows()
+        self.phases.append(phase)
+        return phase
+
+    async def run(self) -> None:
+        args = self.args
+        rng = random.Random(args.seed)
+        self.build()
+        async with self.app:
+            await self.setup_storage()
+
+            # 1. every group fires /sos at once
+            sos = [self.updates.command(self.group(g), self.requester(g), "/sos") for g in range(args.groups)]
+            print((await self.run_phase("sos storm", sos)).report())
+            messages = {
+                g: self.request.last_message[self.group(g)] for g in range(args.groups)
+            }
+            events = {
+                g: self.request.last_event[self.group(g)] for g in range(args.groups)
+            }
+
+            # 2. helpers pile in: opt-ins, mashed resource buttons, helper lists
+            taps = []
+            for h in range(args.helpers):
+                user_id = 100_000 + h
+                g = rng.randrange(args.groups)
+                event_id = events[g]
+                button = lambda data: self.updates.button(self.group(g), messages[g], user_id, data)  # noqa: E731
+                taps.append(button(callback_codec.encode(callback_codec.OPTIN, event_id)))
+                for _ in range(args.taps_per_helper):
+                    resource = rng.choice(RESOURCES)
+                    taps.append(button(callback_codec.encode(callback_codec.REQ, event_id, resource)))
+                if rng.random() < 0.2:
+                    taps.append(button(callback_codec.encode(callback_codec.VIEW_HELPERS, event_id)))
+            rng.shuffle(taps)
+            print((await self.run_phase("helper storm", taps)).report())
+
+            # 3. requesters resolve
+            resolves = [
+                self.updates.button(
+                    self.group(g),
+                    messages[g],
+                    self.requester(g),
+                    callback_codec.encode(callback_codec.RESOLVED, events[g]),
+                )
+                for g in range(args.groups)
+            ]
+            print((await self.run_phase("resolve", resolves)).report())
+            print((await self.run_phase("drain", [])).report())
+
+            await self.app.bot_data["sos_status_updater"].aclose()
+            await self.app.bot_data["medical_index"].aclose()
+            await self.app.bot_data["sheet_writer"].aclose()
+
+        total = sum(len(p.latencies) for p in self.phases)
+        print(
+            f"== total: {total} updates, "
+            f"{sum(sum(p.tg_calls.values()) for p in self.phases)} Telegram calls, "
+            f"{sum(sum(p.sheets_calls.values()) for p in self.phases)} Sheets calls"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--helpers", type=int, default=300)
+    parser.add_argument("--taps-per-helper", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=256, help="updates in flight (PTB default)")
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="seconds per Sheets call")
+    parser.add_argument("--sheets-reads-per-minute", type=float, default=None)
+    parser.add_argument("--sheets-writes-per-minute", type=float, default=None)
+    parser.add_argument("--flush-interval", type=float, default=0.5)
+    parser.add_argument("--edit-interval", type=float, default=1.0)
+    parser.add_argument("--debounce", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    asyncio.run(Harness(args).run())
+
+
+if __name__ == "__main__":
+    main()
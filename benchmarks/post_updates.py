@@ -0,0 +1,97 @@
+"""
+Replay recorded Telegram updates against the bot's webhook endpoint and
+report request latency.
+
+    BOT_MODE=webhook WEBHOOK_URL=https://bot.example.org \\
+    WEBHOOK_SECRET_TOKEN=... WEBHOOK_LISTEN=127.0.0.1 python main.py
+
+    python benchmarks/post_updates.py --url http://127.0.0.1:8443/telegram \\
+        --secret "$WEBHOOK_SECRET_TOKEN" benchmarks/data/sample_updates.jsonl -n 500
+
+The input is JSON lines, one Update object per line (e.g. copied from
+getUpdates or from logs). update_id is rewritten so every POST is unique.
+The webhook answers once the update is queued, so the numbers are the
+ingest latency; with polling the same update additionally waits for the
+next getUpdates round-trip.
+"""
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def post(url: str, secret: str, update: Dict[str, Any]) -> float:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={
+            "Content-Type": "application/json",
+            "X-Telegram-Bot-Api-Secret-Token": secret,
+        },
+        method="POST",
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("updates", help="JSON lines file of recorded updates")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("-n", type=int, default=100, help="total POSTs (updates are cycled)")
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates)
+    if not updates:
+        sys.exit("no updates in input")
+
+    update_ids = itertools.count(int(time.time()))
+    batch = []
+    for update in itertools.islice(itertools.cycle(updates), args.n):
+        batch.append(dict(update, update_id=next(update_ids)))
+
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(post, args.url, args.secret, u) for u in batch]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except (urllib.error.URLError, OSError) as e:
+                errors += 1
+                if errors == 1:
+                    print(f"first error: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        sys.exit(f"all {errors} requests failed")
+    ms = [x * 1000 for x in latencies]
+    print(f"posted {len(latencies)} updates ({errors} errors) in {elapsed:.2f}s "
+          f"-> {len(latencies) / elapsed:.0f} updates/s")
+    print(f"latency ms: mean={statistics.mean(ms):.2f} p50={percentile(ms, 50):.2f} "
+          f"p95={percentile(ms, 95):.2f} p99={percentile(ms, 99):.2f} max={max(ms):.2f}")
+
+
+if __name__ == "__main__":
+    main()
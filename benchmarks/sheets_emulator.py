@@ -0,0 +1,330 @@
+"""
+In-process stand-in for the parts of gspread that SheetStorage uses.
+
+    spreadsheet = EmulatedSpreadsheet(latency=0.2, read_per_minute=300)
+    storage = SheetStorage(sheet_id="bench", credentials_json="{}")
+    storage._attach(spreadsheet)
+
+Every call sleeps `latency` seconds (plus `per_row_latency` per row moved),
+is counted per (worksheet, op) together with the rows it transferred, and
+consumes read/write quota. Over quota it raises QuotaExceeded, which looks
+like gspread's APIError (response.status_code == 429), so QuotaScheduler's
+backoff is exercised as in production.
+"""
+import itertools
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_WORKSHEETS = {
+    "registrations": ["user_id", "username", "first_name", "last_name", "chat_id"],
+    "sos_sessions": ["event_id", "chat_id", "requester_user_id", "status", "closed_by", "message_id"],
+    "resource_requests": ["event_id", "user_id", "resource_type", "count"],
+    "helpers": ["event_id", "helper_user_id"],
+    "medical": ["user_id", "label", "value"],
+}
+
+# gid of every emulated worksheet, unique like on Sheets
+_SHEET_IDS = itertools.count()
+
+_A1_CELL = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+def _col_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + (ord(ch) - 64)
+    return index
+
+
+def _parse_range(a1: str) -> Tuple[int, int, int, int]:
+    """
+    "B2:E2" / "A7" -> (first_row, first_col, last_row, last_col), 1-based.
+    """
+    a1 = a1.split("!")[-1]
+    start, _, end = a1.partition(":")
+    m1 = _A1_CELL.match(start)
+    m2 = _A1_CELL.match(end or start)
+    if not m1 or not m2:
+        raise ValueError(f"Unsupported range {a1!r}")
+    return int(m1.group(2)), _col_index(m1.group(1)), int(m2.group(2)), _col_index(m2.group(1))
+
+
+class _Response:
+    status_code = 429
+
+
+class QuotaExceeded(Exception):
+    """
+    Shaped like gspread.exceptions.APIError for a 429.
+    """
+
+    def __init__(self, kind: str) -> None:
+        super().__init__(f"Quota exceeded for {kind} requests")
+        self.response = _Response()
+
+
+class _Quota:
+    """
+    Sliding one-minute window, like the Sheets per-minute quotas.
+    """
+
+    def __init__(self, per_minute: Optional[float]) -> None:
+        self.per_minute = per_minute
+        self._calls: List[float] = []
+
+    def take(self, kind: str) -> None:
+        if not self.per_minute:
+            return
+        now = time.monotonic()
+        self._calls = [t for t in self._calls if now - t < 60.0]
+        if len(self._calls) >= self.per_minute:
+            raise QuotaExceeded(kind)
+        self._calls.append(now)
+
+
+class _Cell:
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+
+class CallStats:
+    def __init__(self) -> None:
+        self.calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.rows: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.rejected = 0
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def total_rows(self) -> int:
+        return sum(self.rows.values())
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.rows.clear()
+        self.seconds.clear()
+        self.rejected = 0
+
+
+class EmulatedWorksheet:
+    def __init__(self, spreadsheet: "EmulatedSpreadsheet", title: str, header: List[str]) -> None:
+        self._spreadsheet = spreadsheet
+        self.title = title
+        self.id = next(_SHEET_IDS)
+        # a new worksheet added without a header is empty, like on Sheets
+        self._rows: List[List[str]] = [list(header)] if header else []
+
+    # -------- test setup (free, not counted) --------
+
+    def seed(self, rows: List[List[Any]]) -> None:
+        self._rows.extend([str(v) for v in row] for row in rows)
+
+    @property
+    def row_count(self) -> int:
+        return len(self._rows)
+
+    # -------- reads --------
+
+    def get_all_values(self, *args: Any, **kwargs: Any) -> List[List[str]]:
+        with self._spreadsheet._call(self.title, "get_all_values", "read") as call:
+            values = self._padded()
+            call.rows = len(values)
+            return values
+
+    def col_values(self, col: int, *args: Any, **kwargs: Any) -> List[str]:
+        with self._spreadsheet._call(self.title, "col_values", "read") as call:
+            values = [row[col - 1] if len(row) >= col else "" for row in self._rows]
+            while values and not values[-1]:
+                values.pop()
+            call.rows = len(values)
+            return values
+
+    def acell(self, label: str, *args: Any, **kwargs: Any) -> _Cell:
+        with self._spreadsheet._call(self.title, "acell", "read") as call:
+            row, col, _, _ = _parse_range(label)
+            call.rows = 1
+            values = self._rows[row - 1] if row <= len(self._rows) else []
+            return _Cell(values[col - 1] if len(values) >= col else "")
+
+    def batch_get(self, ranges: List[str], *args: Any, **kwargs: Any) -> List[List[List[str]]]:
+        with self._spreadsheet._call(self.title, "batch_get", "read") as call:
+            result = []
+            for name in ranges:
+                first_row, first_col, last_row, last_col = _parse_range(name)
+                values = [
+                    self._rows[r - 1][first_col - 1:last_col] if r <= len(self._rows) else []
+                    for r in range(first_row, last_row + 1)
+                ]
+                call.rows += len(values)
+                result.append(values)
+            return result
+
+    # -------- writes --------
+
+    def append_row(self, values: List[Any], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return self._append([values], "append_row")
+
+    def append_rows(self, values: List[List[Any]], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return self._append(values, "append_rows")
+
+    def update(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        # gspread 6: update(values, range_name); older: update(range_name, values)
+        first, second = (list(args) + [None, None])[:2]
+        range_name = kwargs.get("range_name", first if isinstance(first, str) else second)
+        values = kwargs.get("values", second if isinstance(first, str) else first)
+        with self._spreadsheet._call(self.title, "update", "write") as call:
+            call.rows = len(values)
+            self._write_range(range_name, values)
+            return {"updatedRange": f"{self.title}!{range_name}"}
+
+    def batch_update(self, data: List[Dict[str, Any]], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        with self._spreadsheet._call(self.title, "batch_update", "write") as call:
+            for item in data:
+                self._write_range(item["range"], item["values"])
+                call.rows += len(item["values"])
+            return {"totalUpdatedRows": call.rows}
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> Dict[str, Any]:
+        end_index = start_index if end_index is None else end_index
+        with self._spreadsheet._call(self.title, "delete_rows", "write") as call:
+            del self._rows[start_index - 1:end_index]
+            call.rows = end_index - start_index + 1
+            return {}
+
+    def clear(self) -> Dict[str, Any]:
+        with self._spreadsheet._call(self.title, "clear", "write") as call:
+            call.rows = len(self._rows)
+            self._rows = []
+            return {}
+
+    # -------- internals --------
+
+    def _padded(self) -> List[List[str]]:
+        width = max((len(r) for r in self._rows), default=0)
+        return [row + [""] * (width - len(row)) for row in self._rows]
+
+    def _append(self, rows: List[List[Any]], op: str) -> Dict[str, Any]:
+        with self._spreadsheet._call(self.title, op, "write") as call:
+            first = len(self._rows) + 1
+            self._rows.extend([str(v) for v in row] for row in rows)
+            call.rows = len(rows)
+            last = len(self._rows)
+            return {"updates": {"updatedRange": f"{self.title}!A{first}:Z{last}"}}
+
+    def _write_range(self, range_name: str, values: List[List[Any]]) -> None:
+        first_row, first_col, _, _ = _parse_range(range_name)
+        for r_offset, row_values in enumerate(values):
+            index = first_row - 1 + r_offset
+            while len(self._rows) <= index:
+                self._rows.append([])
+            row = self._rows[index]
+            for c_offset, value in enumerate(row_values):
+                col = first_col - 1 + c_offset
+                while len(row) <= col:
+                    row.append("")
+                row[col] = str(value)
+
+
+class _Call:
+    __slots__ = ("rows",)
+
+    def __init__(self) -> None:
+        self.rows = 0
+
+
+class _CallContext:
+    def __init__(self, spreadsheet: "EmulatedSpreadsheet", sheet: str, op: str, kind: str) -> None:
+        self._spreadsheet = spreadsheet
+        self._key = (sheet, op)
+        self._kind = kind
+        self._call = _Call()
+
+    def __enter__(self) -> _Call:
+        ss = self._spreadsheet
+        with ss._lock:
+            try:
+                ss._quotas[self._kind].take(self._kind)
+            except QuotaExceeded:
+                ss.stats.rejected += 1
+                raise
+        self._started = time.perf_counter()
+        ss._lock.acquire()
+        return self._call
+
+    def __exit__(self, *exc: Any) -> None:
+        ss = self._spreadsheet
+        ss._lock.release()
+        if ss.latency or ss.per_row_latency:
+            # network + transfer time, outside the lock like a real round-trip
+            time.sleep(ss.latency + ss.per_row_latency * self._call.rows)
+        with ss._lock:
+            ss.stats.calls[self._key] += 1
+            ss.stats.rows[self._key] += self._call.rows
+            ss.stats.seconds[self._key] += time.perf_counter() - self._started
+
+
+class EmulatedSpreadsheet:
+    """
+    gspread.Spreadsheet look-alike holding the worksheets SheetStorage needs.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        per_row_latency: float = 0.0,
+        read_per_minute: Optional[float] = None,
+        write_per_minute: Optional[float] = None,
+        worksheets: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        self.title = "emulated"
+        self.latency = latency
+        self.per_row_latency = per_row_latency
+        self.stats = CallStats()
+        self._lock = threading.RLock()
+        self._quotas = {"read": _Quota(read_per_minute), "write": _Quota(write_per_minute)}
+        self._worksheets = {
+            title: EmulatedWorksheet(self, title, header)
+            for title, header in (worksheets or DEFAULT_WORKSHEETS).items()
+        }
+
+    def _call(self, sheet: str, op: str, kind: str) -> _CallContext:
+        return _CallContext(self, sheet, op, kind)
+
+    def worksheet(self, title: str) -> EmulatedWorksheet:
+        return self._worksheets[title]
+
+    def worksheets(self, *args: Any, **kwargs: Any) -> List[EmulatedWorksheet]:
+        with self._call("spreadsheet", "worksheets", "read"):
+            return list(self._worksheets.values())
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs: Any) -> EmulatedWorksheet:
+        with self._call("spreadsheet", "add_worksheet", "write"):
+            worksheet = self._worksheets[title] = EmulatedWorksheet(self, title, [])
+            return worksheet
+
+    def batch_update(self, body: Dict[str, Any], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        spreadsheets.batchUpdate; only deleteDimension (ROWS) is emulated.
+        """
+        by_id = {ws.id: ws for ws in self._worksheets.values()}
+        with self._call("spreadsheet", "batch_update", "write") as call:
+            for request in body.get("requests", []):
+                target = request["deleteDimension"]["range"]
+                worksheet = by_id[target["sheetId"]]
+                del worksheet._rows[target["startIndex"]:target["endIndex"]]
+                call.rows += target["endIndex"] - target["startIndex"]
+            return {"replies": [{} for _ in body.get("requests", [])]}
+
+    def values_batch_get(self, ranges: List[str], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        with self._call("spreadsheet", "values_batch_get", "read") as call:
+            value_ranges = []
+            for name in ranges:
+                worksheet = self._worksheets[name.strip("'").replace("''", "'")]
+                values = worksheet._padded()
+                call.rows += len(values)
+                value_ranges.append({"range": name, "values": values})
+            return {"valueRanges": value_ranges}
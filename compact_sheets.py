@@ -0,0 +1,65 @@
+"""
+Archive finished SOS sessions out of the live worksheets.
+
+    python compact_sheets.py              # archive into *_archive_<this month>
+    python compact_sheets.py --dry-run    # only count what would move
+    python compact_sheets.py --month 2024-05
+
+CLOSED / EXPIRED rows of sos_sessions, with their helpers and
+resource_requests rows, are appended to "<worksheet>_archive_YYYY_MM"
+and deleted from the live worksheets, so the bot's startup read and row
+lookups only pay for open sessions.
+
+Runs under a lease kept in the sos_sessions header row (cell H1): bots
+wait with their close / expire writes while it is held, and a second
+compaction (another CLI run, or a bot's SHEETS_COMPACT_INTERVAL_HOURS
+job) backs off. Bots older than the lease do not check it; stop those
+first. Taking the lease adds a ~30s pause before anything is read.
+"""
+import argparse
+import datetime
+import logging
+
+from main import get_required_env, load_env
+from storage.sheet_storage import CompactionInProgress, SheetStorage
+
+logger = logging.getLogger("sos_compact")
+
+
+def parse_month(value: str) -> datetime.date:
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got {value!r}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive closed SOS sessions out of the live worksheets.")
+    parser.add_argument("--dry-run", action="store_true", help="count rows to archive, change nothing")
+    parser.add_argument(
+        "--month",
+        type=parse_month,
+        default=None,
+        help="archive worksheets to write to, YYYY-MM (default: current month)",
+    )
+    args = parser.parse_args()
+
+    load_env()
+    storage = SheetStorage(
+        sheet_id=get_required_env("GOOGLE_SHEET_ID"),
+        credentials_json=get_required_env("GOOGLE_SERVICE_ACCOUNT_JSON"),
+    )
+    storage.connect()
+
+    try:
+        archived = storage.compact_closed_sessions(archive_date=args.month, dry_run=args.dry_run)
+    except CompactionInProgress as e:
+        logger.error("Not compacted: %s", e)
+        raise SystemExit(1)
+    action = "Would archive" if args.dry_run else "Archived"
+    for name, count in archived.items():
+        logger.info("%s %d rows from %s", action, count, name)
+
+
+if __name__ == "__main__":
+    main()
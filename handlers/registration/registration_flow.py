@@ -1,40 +1,126 @@
 import logging
-from telegram import Update
+from typing import Optional
+
+from telegram import ReplyKeyboardRemove, Update
 from telegram.ext import ContextTypes
 
-from storage.sheet_writer import SheetWriter
+from storage.async_writer import AsyncSheetWriter
+from storage.location_index import LocationIndex
+from storage.registration_index import KNOWN, NEW, RegistrationIndex, profile_fingerprint
+from utils import metrics
+from utils.keyboards import share_location_keyboard
 
 logger = logging.getLogger(__name__)
 
 
+@metrics.track_handler("start")
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     /start – simple registration: store user basic profile to Google Sheet.
-    Silent registration, no multi-step state.
+    Silent registration, no multi-step state. Known users with an unchanged
+    profile cost no storage write; a changed profile updates their row.
     """
     user = update.effective_user
     chat = update.effective_chat
 
-    writer: SheetWriter = context.application.bot_data.get("sheet_writer")
-    if writer is None:
-        logger.error("SheetWriter not found in bot_data; registration skipped")
+    index: Optional[RegistrationIndex] = context.application.bot_data.get("registration_index")
+    if chat.type == "private":
+        chat_id: Optional[int] = chat.id
+    else:
+        # a group /start says nothing about the user's private chat (the
+        # alert target): keep the stored one
+        chat_id = index.dm_chat_id(user.id) if index is not None else None
+        if chat_id is None and index is not None and index.loaded:
+            # none known; a legacy row may hold a group id instead
+            chat_id = 0
+    fingerprint = profile_fingerprint(user.username, user.first_name, user.last_name, chat_id or 0)
+    status = index.check(user.id, fingerprint) if index is not None else NEW
+
+    writer: AsyncSheetWriter = context.application.bot_data.get("sheet_writer")
+    if status == KNOWN:
+        logger.debug("user_id=%s already registered; write skipped", user.id)
+    elif writer is None:
+        logger.error("AsyncSheetWriter not found in bot_data; registration skipped")
     else:
+        profile = dict(
+            user_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            chat_id=chat_id,
+        )
         try:
-            writer.append_registration_row(
-                user_id=user.id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                chat_id=chat.id,
-            )
-            logger.info("Registered user_id=%s to sheet", user.id)
+            if status == NEW and index is not None and index.loaded:
+                await writer.append_registration_row(**profile)
+                logger.info("Registered user_id=%s to sheet", user.id)
+            else:
+                # profile changed, or index not loaded yet (user may have a row):
+                # targeted update, which appends if the row is missing
+                await writer.update_registration_row(**profile)
+                logger.info("Updated registration of user_id=%s", user.id)
+            if index is not None:
+                index.remember(user.id, fingerprint, chat_id)
         except Exception:
-            logger.exception("Failed to append registration row for user_id=%s", user.id)
+            logger.exception("Failed to store registration for user_id=%s", user.id)
 
+    if status == KNOWN:
+        registered = "ثبت‌نام شما قبلاً انجام شده است.\n"
+    else:
+        registered = "ثبت‌نام اولیه شما انجام شد.\n"
     text = (
         "سلام 👋\n"
-        "ثبت‌نام اولیه شما انجام شد.\n"
+        f"{registered}"
         "هر زمان در برنامه به کمک نیاز داشتی، دستور /sos رو بفرست."
     )
-    await update.effective_chat.send_message(text=text)
+    reply_markup = None
+    if chat.type == "private" and "location_index" in context.application.bot_data:
+        # nearest-helper alerts need a location; sharing is optional
+        text += (
+            "\n\n📍 اگر موقعیتت را بفرستی، در شرایط اضطراری نزدیک‌ترین افراد زودتر خبردار می‌شوند.\n"
+            "بعد از /sos هم می‌توانی موقعیتت را در پاسخ به پیام SOS بفرستی."
+        )
+        reply_markup = share_location_keyboard()
+    await update.effective_chat.send_message(text=text, reply_markup=reply_markup)
+
+
+@metrics.track_handler("registration_location")
+async def handle_registration_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Location shared in the private chat: kept in memory for nearest-helper
+    matching and stored next to the user's registration row.
+    """
+    user = update.effective_user
+    location = update.effective_message.location
+
+    locations: Optional[LocationIndex] = context.application.bot_data.get("location_index")
+    if locations is None:
+        return
+
+    index: Optional[RegistrationIndex] = context.application.bot_data.get("registration_index")
+    if index is not None and index.loaded and user.id not in index:
+        await update.effective_chat.send_message(
+            "ابتدا با دستور /start ثبت‌نام کن، بعد موقعیتت را بفرست.",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
+
+    locations.update(user.id, location.latitude, location.longitude)
+    if index is not None:
+        # a private chat: this user can be alerted directly
+        index.remember_dm_chat(user.id, update.effective_chat.id)
+
+    writer: Optional[AsyncSheetWriter] = context.application.bot_data.get("sheet_writer")
+    if writer is not None:
+        try:
+            await writer.update_registration_location(
+                user_id=user.id,
+                latitude=location.latitude,
+                longitude=location.longitude,
+            )
+        except Exception:
+            logger.exception("Failed to store location of user_id=%s", user.id)
 
+    await update.effective_chat.send_message(
+        "📍 موقعیت شما ثبت شد. اگر نزدیک شما درخواست کمکی ثبت شود، خبردار می‌شوید.",
+        reply_markup=ReplyKeyboardRemove(),
+    )
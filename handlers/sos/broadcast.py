@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from storage.quota_scheduler import TokenBucket
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# finished jobs kept for inspection
+MAX_FINISHED_JOBS = 50
+
+
+class BroadcastJob:
+    """
+    Progress of one SOS alert fan-out.
+    """
+
+    __slots__ = ("event_id", "total", "sent", "blocked", "failed", "retried", "started", "finished")
+
+    def __init__(self, event_id: str, total: int) -> None:
+        self.event_id = event_id
+        self.total = total
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.retried = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    def summary(self) -> str:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return (
+            f"{self.sent}/{self.total} sent, {self.blocked} blocked, {self.failed} failed, "
+            f"{self.retried} retries in {elapsed:.1f}s"
+        )
+
+
+def _retry_seconds(e: RetryAfter) -> float:
+    retry_after = e.retry_after
+    if not isinstance(retry_after, (int, float)):
+        retry_after = retry_after.total_seconds()
+    return float(retry_after)
+
+
+class AlertBroadcaster:
+    """
+    Sends one SOS alert to many private chats in the background.
+
+    - at most `max_concurrency` sendMessage calls in flight;
+    - a token bucket keeps the bot under `per_second` messages overall
+      (Telegram allows ~30/s for bulk notifications);
+    - a chat gets at most one message per `per_chat_interval` seconds,
+      even when several SOS alerts overlap;
+    - RetryAfter pauses the whole bucket for the time Telegram asks and
+      requeues the message; timeouts / network errors are retried up to
+      `max_attempts`; users who blocked the bot are skipped from then on.
+
+    A chat is alerted at most once per SOS, however many broadcasts the
+    session triggers (e.g. a location shared after /sos). `alert_all`
+    is the SOS_BROADCAST switch: alert every registered user, not only
+    the helpers nearest to the SOS.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 20,
+        per_second: float = 25.0,
+        per_chat_interval: float = 1.0,
+        max_attempts: int = 3,
+        alert_all: bool = False,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.alert_all = alert_all
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self._bucket = TokenBucket(per_second * 60.0, burst=max(1, int(per_second)))
+        # chat_id -> monotonic time it may receive the next message
+        self._next_send: Dict[int, float] = {}
+        self._unreachable: Set[int] = set()
+        # event_id -> chats already alerted (or queued) for it
+        self._notified: Dict[str, Set[int]] = {}
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+        self.jobs: Dict[str, BroadcastJob] = {}
+
+    @property
+    def unreachable(self) -> Set[int]:
+        """
+        Chats that refused a message (blocked the bot).
+        """
+        return self._unreachable
+
+    def broadcast(
+        self,
+        bot: Bot,
+        event_id: str,
+        chat_ids: Iterable[int],
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        first: Optional[Dict[int, str]] = None,
+    ) -> Optional[BroadcastJob]:
+        """
+        Start the fan-out and return at once; progress is on the job.
+        `first` maps chat_id -> its own text; those chats are sent to
+        before the rest, in the given order. None if nobody is left to alert.
+        """
+        first = first or {}
+        notified = self._notified.setdefault(event_id, set())
+        targets = []
+        for chat_id in list(first) + list(chat_ids):
+            if chat_id in notified or chat_id in self._unreachable:
+                continue
+            notified.add(chat_id)
+            targets.append(chat_id)
+        if not targets:
+            return None
+
+        job = BroadcastJob(event_id, len(targets))
+        self.jobs[event_id] = job
+        task = asyncio.create_task(
+            self._run(bot, job, targets, text, reply_markup, first),
+            name=f"sos-broadcast-{event_id}",
+        )
+        self._tasks.setdefault(event_id, set()).add(task)
+        return job
+
+    def cancel(self, event_id: str) -> None:
+        """
+        Stop alerting for a session that is no longer open.
+        """
+        self._notified.pop(event_id, None)
+        for task in self._tasks.pop(event_id, ()):
+            task.cancel()
+
+    async def aclose(self) -> None:
+        tasks = [task for tasks in self._tasks.values() for task in tasks]
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # -------- internals --------
+
+    async def _run(
+        self,
+        bot: Bot,
+        job: BroadcastJob,
+        targets: List[int],
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup],
+        texts: Dict[int, str],
+    ) -> None:
+        # (chat_id, attempts so far)
+        pending: Deque[Tuple[int, int]] = deque((chat_id, 0) for chat_id in targets)
+
+        async def worker() -> None:
+            while pending:
+                chat_id, attempts = pending.popleft()
+                await self._acquire(chat_id)
+                try:
+                    await bot.send_message(
+                        chat_id=chat_id,
+                        text=texts.get(chat_id, text),
+                        reply_markup=reply_markup,
+                    )
+                except RetryAfter as e:
+                    # flood control is per bot: everyone waits, nobody is dropped
+                    self._bucket.pause(_retry_seconds(e))
+                    job.retried += 1
+                    pending.append((chat_id, attempts))
+                    continue
+                except Forbidden:
+                    # blocked the bot / never opened the private chat
+                    self._unreachable.add(chat_id)
+                    job.blocked += 1
+                    metrics.BROADCAST_MESSAGES.inc(outcome="blocked")
+                    continue
+                except BadRequest:
+                    logger.warning("Alert to chat_id=%s rejected", chat_id, exc_info=True)
+                    job.failed += 1
+                    metrics.BROADCAST_MESSAGES.inc(outcome="failed")
+                    continue
+                except NetworkError:
+                    if attempts + 1 < self.max_attempts:
+                        job.retried += 1
+                        pending.append((chat_id, attempts + 1))
+                    else:
+                        job.failed += 1
+                        metrics.BROADCAST_MESSAGES.inc(outcome="failed")
+                    continue
+                except Exception:
+                    logger.exception("Alert to chat_id=%s failed", chat_id)
+                    job.failed += 1
+                    metrics.BROADCAST_MESSAGES.inc(outcome="failed")
+                    continue
+                job.sent += 1
+                metrics.BROADCAST_MESSAGES.inc(outcome="sent")
+
+        try:
+            workers = min(self.max_concurrency, len(targets))
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            job.finished = time.monotonic()
+            tasks = self._tasks.get(job.event_id)
+            if tasks is not None:
+                tasks.discard(asyncio.current_task())
+                if not tasks:
+                    del self._tasks[job.event_id]
+            self._forget_finished()
+            logger.info("SOS alert broadcast event_id=%s: %s", job.event_id, job.summary())
+
+    async def _acquire(self, chat_id: int) -> None:
+        now = time.monotonic()
+        ready_at = self._next_send.get(chat_id, 0.0)
+        self._next_send[chat_id] = max(now, ready_at) + self.per_chat_interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+        while True:
+            wait = self._bucket.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _forget_finished(self) -> None:
+        now = time.monotonic()
+        self._next_send = {c: t for c, t in self._next_send.items() if t > now}
+        finished = [e for e, job in self.jobs.items() if job.finished is not None]
+        for event_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[event_id]
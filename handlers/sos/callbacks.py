@@ -1,13 +1,25 @@
 import logging
-from typing import Dict, Any, Optional
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 
-from telegram import Update
+from telegram import Message, Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
-from utils.keyboards import sos_main_keyboard
-from storage.sheet_writer import SheetWriter
+from utils import callback_codec, metrics
+from utils.callback_codec import InvalidCallback, SOSCallback
+from utils.keyboards import sos_alert_keyboard, sos_main_keyboard
+from storage.async_writer import AsyncSheetWriter
+from storage.location_index import LocationIndex
+from storage.registration_index import RegistrationIndex
+from handlers.sos.broadcast import AlertBroadcaster
 from handlers.sos.send_medical import send_responder_medical_message
+from handlers.sos.request_debouncer import ResourceRequestDebouncer
+from handlers.sos.session_expiry import SessionExpiry
+from handlers.sos.session_locks import SessionLocks
+from handlers.sos.session_registry import EventIdGenerator, SOSSession, make_event_id
+from handlers.sos.session_store import InMemorySessionStore, SessionStore
+from handlers.sos.status_message import StatusMessageUpdater, render_sos_text, resource_label
 
 logger = logging.getLogger(__name__)
 
@@ -15,10 +27,12 @@ logger = logging.getLogger(__name__)
 # ---------- /sos command ----------
 
 
+@metrics.track_handler("sos_command")
 async def handle_sos_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     /sos – must be used in a group/supergroup.
-    Creates a new SOS "session" where the group message is the SSOT.
+    Creates a new SOS "session" where the group message is the SSOT;
+    the message carries a live summary of helpers and resource requests.
     """
     chat = update.effective_chat
     user = update.effective_user
@@ -27,100 +41,219 @@ async def handle_sos_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await chat.send_message("دستور /sos فقط در گروه/سوپرگروه قابل استفاده است.")
         return
 
-    text = (
-        f"🚨 *درخواست کمک اضطراری*\n\n"
-        f"درخواست‌کننده: [{user.full_name}](tg://user?id={user.id})\n"
-        f"اگر می‌توانید کمک کنید، روی «کمک می‌کنم» بزنید.\n"
-        f"و در صورت نیاز نوع کمک (آب / دارو / نیرو) را انتخاب کنید."
+    # the id is made before sending: the first message already has the
+    # final keyboard (one round-trip, no window with dead buttons)
+    event_id = _get_event_ids(context).next_id()
+    session = SOSSession(
+        event_id=event_id,
+        chat_id=chat.id,
+        requester_user_id=user.id,
+        requester_name=user.full_name,
     )
 
     msg = await chat.send_message(
-        text=text,
-        reply_markup=sos_main_keyboard(event_id=0),  # event_id بعد از ارسال تنظیم می‌شود
+        text=render_sos_text(session),
+        reply_markup=sos_main_keyboard(event_id=event_id),
         parse_mode=ParseMode.MARKDOWN,
     )
+    session.message_id = msg.message_id
 
-    event_id = msg.message_id
+    # نگهداری در session store (bot_data یا Redis مشترک)
+    await _get_store(context).create(session)
+    expiry = _get_expiry(context)
+    if expiry is not None:
+        expiry.track(event_id, session.created_at)
 
-    # به‌روز کردن کیبورد با event_id واقعی
-    try:
-        await msg.edit_reply_markup(reply_markup=sos_main_keyboard(event_id=event_id))
-    except Exception:
-        logger.exception("Failed to update SOS keyboard with real event_id=%s", event_id)
-
-    # نگهداری در bot_data
-    session = {
-        "event_id": event_id,
-        "chat_id": chat.id,
-        "requester_user_id": user.id,
-        "is_active": True,
-        "helpers": set(),
-    }
-
-    active_sos: Dict[int, Dict[str, Any]] = context.application.bot_data.setdefault(
-        "active_sos_sessions", {}
-    )
-    active_sos[event_id] = session
-
-    writer: Optional[SheetWriter] = context.application.bot_data.get("sheet_writer")
+    writer: Optional[AsyncSheetWriter] = context.application.bot_data.get("sheet_writer")
     if writer:
         try:
-            writer.log_new_sos_session(
+            await writer.log_new_sos_session(
                 event_id=event_id,
                 chat_id=chat.id,
                 requester_user_id=user.id,
+                message_id=msg.message_id,
             )
         except Exception:
             logger.exception("Failed to log new SOS session to sheet")
 
+    # the requester's registered location, if they shared one
+    locations: Optional[LocationIndex] = context.application.bot_data.get("location_index")
+    location = locations.get(user.id) if locations is not None else None
+    _broadcast_alert(context, session, chat.title or "", msg.link, location)
+
     logger.info("New SOS started: event_id=%s by user_id=%s", event_id, user.id)
 
 
+def _broadcast_alert(
+    context: ContextTypes.DEFAULT_TYPE,
+    session: SOSSession,
+    group_title: str,
+    link: Optional[str],
+    location: Optional[Tuple[float, float]] = None,
+) -> None:
+    """
+    DM the SOS to the registered users nearest to `location` first, then
+    (SOS_BROADCAST=on) to everyone else registered. Runs in the
+    background; the handler does not wait for it.
+    """
+    broadcaster: Optional[AlertBroadcaster] = context.application.bot_data.get("sos_broadcaster")
+    index: Optional[RegistrationIndex] = context.application.bot_data.get("registration_index")
+    if broadcaster is None or index is None:
+        return
+
+    who = f"{session.requester_name or 'یک کاربر'} در گروه «{group_title}» درخواست کمک کرده است."
+    exclude = {session.requester_user_id, *session.helpers} | broadcaster.unreachable
+
+    nearby: Dict[int, str] = {}
+    locations: Optional[LocationIndex] = context.application.bot_data.get("location_index")
+    if locations is not None and location is not None:
+        for user_id, km in locations.nearest(location[0], location[1], exclude=exclude):
+            chat_id = index.dm_chat_id(user_id)
+            if chat_id is not None:
+                nearby[chat_id] = f"🚨 درخواست کمک اضطراری در حدود {km:.1f} کیلومتری شما\n{who}"
+
+    others = index.dm_chat_ids(exclude=exclude) if broadcaster.alert_all else []
+    if not nearby and not others:
+        return
+
+    text = f"🚨 درخواست کمک اضطراری\n{who}"
+    # basic groups have no message links; the group name has to do
+    reply_markup = sos_alert_keyboard(link) if link else None
+    job = broadcaster.broadcast(
+        context.bot, session.event_id, others, text, reply_markup, first=nearby
+    )
+    if job is not None and nearby:
+        logger.info("SOS event_id=%s: alerting %d nearest helpers", session.event_id, len(nearby))
+
+
+@metrics.track_handler("sos_location")
+async def handle_sos_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    The requester replies to their SOS message with a location: the
+    nearest registered helpers (not alerted yet for this SOS) get a DM.
+    Any other location in a group is ignored.
+    """
+    message = update.effective_message
+    replied = message.reply_to_message
+    user = update.effective_user
+    if replied is None or replied.from_user is None or replied.from_user.id != context.bot.id:
+        return
+
+    session = await _get_session(context, _event_id_of_message(replied))
+    if session is None or not session.is_active or session.requester_user_id != user.id:
+        return
+
+    location = (message.location.latitude, message.location.longitude)
+    _broadcast_alert(context, session, message.chat.title or "", replied.link, location)
+
+
 # ---------- Callback router ----------
 
 
+@metrics.track_handler("sos_button_router")
 async def sos_button_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Single entry for all sos:* callback_data.
+    Single entry for all SOS callback_data.
+    The payload is decoded (and validated) once, then dispatched by action.
+    Every handler answers the callback query exactly once.
+    Handlers that change a session hold its lock (SessionLocks) around
+    check + mutation + storage write, so taps on one SOS apply in order.
     """
     query = update.callback_query
     if not query or not query.data:
         return
 
-    data = query.data
-    if not data.startswith("sos:"):
-        # Not ours
+    try:
+        callback = callback_codec.decode(query.data)
+    except InvalidCallback:
+        logger.warning("Invalid SOS callback_data=%s", query.data)
+        await query.answer()
         return
 
-    await query.answer()  # small feedback
-
-    parts = data.split(":")
-    action = parts[1] if len(parts) > 1 else None
-
-    if action == "req":
-        # sos:req:<resource>:<event_id>
-        await _handle_resource_request(update, context, parts)
-    elif action == "optin":
-        # sos:optin:<event_id>
-        await _handle_optin(update, context, parts)
-    elif action == "view_helpers":
-        # sos:view_helpers:<event_id>
-        await _handle_view_helpers(update, context, parts)
-    elif action == "resolved":
-        # sos:resolved:<event_id>
-        await _handle_resolved(update, context, parts)
-    elif action == "back":
-        # sos:back:<event_id>  (reserved – فعلاً نادیده می‌گیریم)
+    store = _get_store(context)
+    if not store.rehydrated and await store.get(callback.event_id) is None:
+        # storage still connecting: the session may exist but is not loaded yet
+        await query.answer(
+            "⏳ ربات در حال راه‌اندازی است، چند لحظه دیگر دوباره امتحان کنید.",
+            show_alert=True,
+        )
         return
-    else:
-        logger.warning("Unknown SOS callback action: %s", data)
 
+    with metrics.CALLBACK_SECONDS.time(action=callback.action):
+        await _HANDLERS[callback.action](update, context, callback)
 
-def _get_session(context: ContextTypes.DEFAULT_TYPE, event_id: int) -> Optional[Dict[str, Any]]:
-    sessions: Dict[int, Dict[str, Any]] = context.application.bot_data.get(
-        "active_sos_sessions", {}
-    )
-    return sessions.get(event_id)
+
+def _event_id_of_message(message: Message) -> str:
+    """
+    The SOS a bot message belongs to, read from its keyboard; messages of
+    SOS created before generated ids fall back to the legacy composite id.
+    """
+    if message.reply_markup is not None:
+        for row in message.reply_markup.inline_keyboard:
+            for button in row:
+                try:
+                    return callback_codec.decode(button.callback_data or "").event_id
+                except InvalidCallback:
+                    continue
+    return make_event_id(message.chat_id, message.message_id)
+
+
+def _get_store(context: ContextTypes.DEFAULT_TYPE) -> SessionStore:
+    store = context.application.bot_data.get("sos_store")
+    if store is None:
+        store = context.application.bot_data["sos_store"] = InMemorySessionStore()
+    return store
+
+
+async def _get_session(context: ContextTypes.DEFAULT_TYPE, event_id: str) -> Optional[SOSSession]:
+    return await _get_store(context).get(event_id)
+
+
+def _get_status_updater(context: ContextTypes.DEFAULT_TYPE) -> StatusMessageUpdater:
+    updater = context.application.bot_data.get("sos_status_updater")
+    if updater is None:
+        updater = context.application.bot_data["sos_status_updater"] = StatusMessageUpdater()
+    return updater
+
+
+def _get_request_debouncer(
+    context: ContextTypes.DEFAULT_TYPE,
+) -> Optional[ResourceRequestDebouncer]:
+    debouncer = context.application.bot_data.get("resource_request_debouncer")
+    if debouncer is None:
+        writer: Optional[AsyncSheetWriter] = context.application.bot_data.get("sheet_writer")
+        if writer is None:
+            return None
+        debouncer = context.application.bot_data["resource_request_debouncer"] = (
+            ResourceRequestDebouncer(writer.log_resource_request)
+        )
+    return debouncer
+
+
+def _get_expiry(context: ContextTypes.DEFAULT_TYPE) -> Optional[SessionExpiry]:
+    return context.application.bot_data.get("sos_expiry")
+
+
+def _get_event_ids(context: ContextTypes.DEFAULT_TYPE) -> EventIdGenerator:
+    event_ids = context.application.bot_data.get("event_ids")
+    if event_ids is None:
+        event_ids = context.application.bot_data["event_ids"] = EventIdGenerator()
+    return event_ids
+
+
+def _get_session_locks(context: ContextTypes.DEFAULT_TYPE) -> SessionLocks:
+    locks = context.application.bot_data.get("sos_locks")
+    if locks is None:
+        locks = context.application.bot_data["sos_locks"] = SessionLocks()
+    return locks
+
+
+async def _reject_inactive(query) -> None:
+    await query.answer("این SOS دیگر فعال نیست.", show_alert=True)
+    try:
+        await query.edit_message_reply_markup(reply_markup=None)
+    except Exception:
+        logger.exception("Failed to remove keyboard of inactive SOS")
 
 
 # ---------- Resource request (آب/دارو/نیرو) ----------
@@ -129,55 +262,42 @@ def _get_session(context: ContextTypes.DEFAULT_TYPE, event_id: int) -> Optional[
 async def _handle_resource_request(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
-    parts: list[str],
+    callback: SOSCallback,
 ) -> None:
     query = update.callback_query
     user = update.effective_user
 
-    if len(parts) != 4:
-        logger.warning("Invalid resource request callback_data=%s", query.data)
+    resource_type = callback.resource
+    event_id = callback.event_id
+
+    # check + tally in order with other mutations of this SOS (e.g. a close);
+    # replies are sent after the lock is released
+    taps = 1
+    async with _get_session_locks(context).hold(event_id):
+        session = await _get_session(context, event_id)
+        active = session is not None and session.is_active
+        if active:
+            # Repeated taps inside the debounce window collapse into one logged request
+            debouncer = _get_request_debouncer(context)
+            taps = debouncer.tap(event_id, user.id, resource_type) if debouncer else 1
+        if active and taps == 1:
+            # None: closed on another replica meanwhile
+            tally = await _get_store(context).add_resource_request(event_id, resource_type)
+            active = tally is not None
+            expiry = _get_expiry(context)
+            if active and expiry is not None:
+                expiry.touch(event_id)
+
+    if not active:
+        await _reject_inactive(query)
         return
-
-    resource_type = parts[2]
-    try:
-        event_id = int(parts[3])
-    except ValueError:
-        logger.warning("Invalid event_id in callback_data=%s", query.data)
+    if taps > 1:
+        await query.answer(f"درخواست {resource_label(resource_type)} شما قبلاً ثبت شده است.")
         return
 
-    session = _get_session(context, event_id)
-    if not session or not session.get("is_active", False):
-        await query.edit_message_reply_markup(reply_markup=None)
-        await query.message.reply_text("این SOS دیگر فعال نیست.")
-        return
-
-    # Log to sheet
-    writer: Optional[SheetWriter] = context.application.bot_data.get("sheet_writer")
-    if writer:
-        try:
-            writer.log_resource_request(
-                event_id=event_id,
-                user_id=user.id,
-                resource_type=resource_type,
-            )
-        except Exception:
-            logger.exception("Failed to log resource request")
-
-    # Reply in group (not flooding)
-    await query.message.reply_text(
-        f"✅ درخواست *{_resource_label(resource_type)}* ثبت شد.",
-        parse_mode=ParseMode.MARKDOWN,
-    )
-
-
-def _resource_label(resource_type: str) -> str:
-    if resource_type == "water":
-        return "آب"
-    if resource_type == "medicine":
-        return "دارو"
-    if resource_type == "power":
-        return "نیروی فیزیکی"
-    return resource_type
+    # Feedback to the clicker only; the group sees the tally in the SOS message
+    await query.answer(f"✅ درخواست {resource_label(resource_type)} ثبت شد.")
+    _get_status_updater(context).schedule(context.bot, session)
 
 
 # ---------- Opt-in (کمک می‌کنم) ----------
@@ -186,55 +306,56 @@ def _resource_label(resource_type: str) -> str:
 async def _handle_optin(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
-    parts: list[str],
+    callback: SOSCallback,
 ) -> None:
     query = update.callback_query
     user = update.effective_user
-    chat = update.effective_chat
 
-    if len(parts) != 3:
-        logger.warning("Invalid optin callback_data=%s", query.data)
+    event_id = callback.event_id
+
+    # the helper row is queued before any close of this SOS can be;
+    # replies are sent after the lock is released
+    added: Optional[bool] = None
+    async with _get_session_locks(context).hold(event_id):
+        session = await _get_session(context, event_id)
+        if session is not None and session.is_active:
+            first_helper = not session.helpers
+            added = await _get_store(context).add_helper(event_id, user.id, user.full_name)
+        if added:
+            if first_helper:
+                metrics.TIME_TO_FIRST_HELPER.observe(time.time() - session.created_at)
+            expiry = _get_expiry(context)
+            if expiry is not None:
+                expiry.touch(event_id)
+
+            writer: Optional[AsyncSheetWriter] = context.application.bot_data.get("sheet_writer")
+            if writer:
+                try:
+                    await writer.log_helper_optin(
+                        event_id=event_id,
+                        helper_user_id=user.id,
+                    )
+                except Exception:
+                    logger.exception("Failed to log helper opt-in")
+
+    if added is None:
+        await _reject_inactive(query)
         return
-
-    try:
-        event_id = int(parts[2])
-    except ValueError:
-        logger.warning("Invalid event_id in optin callback_data=%s", query.data)
+    if not added:
+        # idempotent: no second row, no second medical DM
+        await query.answer("شما قبلاً اعلام کمک کرده‌اید. 🙏")
         return
 
-    session = _get_session(context, event_id)
-    if not session or not session.get("is_active", False):
-        await query.edit_message_reply_markup(reply_markup=None)
-        await query.message.reply_text("این SOS دیگر فعال نیست.")
-        return
-
-    helpers: set[int] = session.setdefault("helpers", set())
-    if user.id not in helpers:
-        helpers.add(user.id)
-
-    writer: Optional[SheetWriter] = context.application.bot_data.get("sheet_writer")
-    if writer:
-        try:
-            writer.log_helper_optin(
-                event_id=event_id,
-                helper_user_id=user.id,
-            )
-        except Exception:
-            logger.exception("Failed to log helper opt-in")
-
     await query.answer("ثبت شد، لطفاً منتظر هماهنگی بمانید.", show_alert=False)
 
-    # پیام کوتاه برای گروه
-    await query.message.reply_text(
-        f"🙋‍♂️ [{user.full_name}](tg://user?id={user.id}) اعلام کرد که کمک می‌کند.",
-        parse_mode=ParseMode.MARKDOWN,
-    )
+    # لیست یاری‌دهندگان در خود پیام SOS به‌روز می‌شود (بدون پیام جدید در گروه)
+    _get_status_updater(context).schedule(context.bot, session)
 
     # ارسال اطلاعات پزشکی درخواست‌کننده به PV یاری‌دهنده (در صورت وجود)
     await send_responder_medical_message(
         update=update,
         context=context,
-        requester_user_id=session["requester_user_id"],
+        requester_user_id=session.requester_user_id,
         responder_chat_id=user.id,
     )
 
@@ -245,35 +366,30 @@ async def _handle_optin(
 async def _handle_view_helpers(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
-    parts: list[str],
+    callback: SOSCallback,
 ) -> None:
     query = update.callback_query
 
-    if len(parts) != 3:
-        logger.warning("Invalid view_helpers callback_data=%s", query.data)
-        return
-
-    try:
-        event_id = int(parts[2])
-    except ValueError:
-        logger.warning("Invalid event_id in view_helpers callback_data=%s", query.data)
-        return
+    event_id = callback.event_id
 
-    session = _get_session(context, event_id)
+    session = await _get_session(context, event_id)
     if not session:
         await query.answer("این SOS دیگر فعال نیست.", show_alert=True)
         return
 
-    helpers: set[int] = session.get("helpers", set())
+    helpers = session.helper_items()
 
     if not helpers:
         await query.answer("هنوز کسی اعلام کمک نکرده.", show_alert=True)
         return
 
-    mention_list = [f"[کاربر](tg://user?id={hid})" for hid in helpers]
-    text = "👥 یاری‌دهندگان تا این لحظه:\n" + "\n".join(f"• {m}" for m in mention_list)
-
-    await query.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+    # Private alert instead of a group message (alerts are capped at 200 chars)
+    text = f"👥 یاری‌دهندگان تا این لحظه ({len(helpers)}):\n" + "\n".join(
+        f"• {name or 'کاربر'}" for _, name in helpers
+    )
+    if len(text) > 200:
+        text = text[:199] + "…"
+    await query.answer(text, show_alert=True)
 
 
 # ---------- Resolved (خطر رفع شد) ----------
@@ -282,52 +398,52 @@ async def _handle_view_helpers(
 async def _handle_resolved(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
-    parts: list[str],
+    callback: SOSCallback,
 ) -> None:
     query = update.callback_query
     user = update.effective_user
 
-    if len(parts) != 3:
-        logger.warning("Invalid resolved callback_data=%s", query.data)
-        return
-
-    try:
-        event_id = int(parts[2])
-    except ValueError:
-        logger.warning("Invalid event_id in resolved callback_data=%s", query.data)
-        return
-
-    session = _get_session(context, event_id)
-    if not session:
-        await query.answer("این SOS پیدا نشد.", show_alert=True)
+    event_id = callback.event_id
+
+    # waits for opt-ins / requests of this SOS already in progress; a
+    # second tap on "resolved" then finds the session closed.
+    # Replies are sent after the lock is released.
+    refusal: Optional[str] = None
+    async with _get_session_locks(context).hold(event_id):
+        session = await _get_session(context, event_id)
+        if not session:
+            refusal = "این SOS پیدا نشد یا قبلاً بسته شده."
+        # فقط درخواست‌کننده (یا بعداً ادمین) اجازه بستن دارد
+        elif user.id != session.requester_user_id:
+            refusal = "فقط درخواست‌کننده می‌تواند خطر را رفع‌شده اعلام کند."
+        # بستن و حذف از لیست فعال (اتمیک: فقط اولین درخواست موفق می‌شود)
+        elif not await _get_store(context).close(event_id, user.id):
+            refusal = "این SOS قبلاً بسته شده."
+        else:
+            await _get_status_updater(context).cancel(event_id)
+            expiry = _get_expiry(context)
+            if expiry is not None:
+                expiry.forget(event_id)
+            broadcaster: Optional[AlertBroadcaster] = context.application.bot_data.get("sos_broadcaster")
+            if broadcaster is not None:
+                # nobody needs to be alerted about a resolved SOS
+                broadcaster.cancel(event_id)
+
+            writer: Optional[AsyncSheetWriter] = context.application.bot_data.get("sheet_writer")
+            if writer:
+                debouncer = _get_request_debouncer(context)
+                if debouncer is not None:
+                    # open request windows are logged before the close
+                    await debouncer.flush_event(event_id)
+                try:
+                    await writer.close_sos_session(event_id=event_id, closed_by_user_id=user.id)
+                except Exception:
+                    logger.exception("Failed to close SOS session in sheet")
+
+    if refusal is not None:
+        await query.answer(refusal, show_alert=True)
         return
 
-    if not session.get("is_active", False):
-        await query.answer("این SOS قبلاً بسته شده.", show_alert=True)
-        return
-
-    requester_id = session["requester_user_id"]
-
-    # فقط درخواست‌کننده (یا بعداً ادمین) اجازه بستن دارد
-    if user.id != requester_id:
-        await query.answer("فقط درخواست‌کننده می‌تواند خطر را رفع‌شده اعلام کند.", show_alert=True)
-        return
-
-    session["is_active"] = False
-
-    # حذف از لیست فعال
-    active_sos: Dict[int, Dict[str, Any]] = context.application.bot_data.get(
-        "active_sos_sessions", {}
-    )
-    active_sos.pop(event_id, None)
-
-    writer: Optional[SheetWriter] = context.application.bot_data.get("sheet_writer")
-    if writer:
-        try:
-            writer.close_sos_session(event_id=event_id, closed_by_user_id=user.id)
-        except Exception:
-            logger.exception("Failed to close SOS session in sheet")
-
     # بروزرسانی پیام گروهی
     try:
         await query.message.edit_text(
@@ -339,3 +455,24 @@ async def _handle_resolved(
 
     await query.answer("SOS بسته شد.", show_alert=False)
     logger.info("SOS resolved: event_id=%s by user_id=%s", event_id, user.id)
+
+
+# ---------- Back (reserved) ----------
+
+
+async def _handle_back(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    callback: SOSCallback,
+) -> None:
+    await update.callback_query.answer()
+
+
+# action -> handler; decode() only yields actions listed here
+_HANDLERS: Dict[str, Callable[..., Awaitable[None]]] = {
+    callback_codec.REQ: _handle_resource_request,
+    callback_codec.OPTIN: _handle_optin,
+    callback_codec.VIEW_HELPERS: _handle_view_helpers,
+    callback_codec.RESOLVED: _handle_resolved,
+    callback_codec.BACK: _handle_back,
+}
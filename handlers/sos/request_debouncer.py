@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (event_id, user_id, resource_type)
+RequestKey = Tuple[str, int, str]
+
+LogFn = Callable[[str, int, str, int], Awaitable[None]]
+
+
+class ResourceRequestDebouncer:
+    """
+    Collapses repeated taps of the same resource button.
+
+    The first tap of (event, user, resource) opens a `window`-second window;
+    taps inside it only bump a counter. When the window ends, one request is
+    logged with the number of taps it absorbed. window=0 logs every tap.
+    """
+
+    def __init__(self, log_fn: LogFn, window: float = 10.0) -> None:
+        self._log_fn = log_fn
+        self.window = window
+        self._counts: Dict[RequestKey, int] = {}
+        self._tasks: Dict[RequestKey, asyncio.Task] = {}
+
+    def tap(self, event_id: str, user_id: int, resource_type: str) -> int:
+        """
+        Register a tap; returns the taps seen in the current window
+        (1 means a new request).
+        """
+        key = (event_id, user_id, resource_type)
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+        if count == 1:
+            self._tasks[key] = asyncio.create_task(self._log_later(key, self.window))
+        return count
+
+    async def flush_event(self, event_id: str) -> None:
+        """
+        Log the open windows of one session now (session is closing).
+        """
+        await self._flush([key for key in self._counts if key[0] == event_id])
+
+    async def aclose(self) -> None:
+        await self._flush(list(self._counts))
+
+    async def _flush(self, keys: list) -> None:
+        for key in keys:
+            task = self._tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(self._log_later(key, 0.0) for key in keys))
+
+    async def _log_later(self, key: RequestKey, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        self._tasks.pop(key, None)
+        count = self._counts.pop(key, 0)
+        if not count:
+            return
+        event_id, user_id, resource_type = key
+        try:
+            await self._log_fn(event_id, user_id, resource_type, count)
+        except Exception:
+            logger.exception("Failed to log resource request event_id=%s", event_id)
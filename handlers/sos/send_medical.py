@@ -2,7 +2,8 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from storage.sheet_storage import SheetStorage
+from storage.async_writer import AsyncSheetWriter
+from storage.medical_index import MedicalIndex
 
 logger = logging.getLogger(__name__)
 
@@ -19,13 +20,17 @@ async def send_responder_medical_message(
 
     این تابع هرگز اطلاعات پزشکی را در گروه عمومی نمایش نمی‌دهد.
     """
-    storage: SheetStorage = context.application.bot_data.get("sheet_storage")
-    if storage is None:
-        logger.error("SheetStorage not found in bot_data; cannot send medical info")
+    medical_index: MedicalIndex = context.application.bot_data.get("medical_index")
+    writer: AsyncSheetWriter = context.application.bot_data.get("sheet_writer")
+    if medical_index is None and writer is None:
+        logger.error("No medical source in bot_data; cannot send medical info")
         return
 
     try:
-        medical_info = storage.get_user_medical_info(requester_user_id)
+        if medical_index is not None:
+            medical_info = await medical_index.get(requester_user_id)
+        else:
+            medical_info = await writer.get_user_medical_info(requester_user_id)
     except Exception:
         logger.exception("Failed to read medical info for user_id=%s", requester_user_id)
         medical_info = None
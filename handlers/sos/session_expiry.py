@@ -0,0 +1,136 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ExpireFn = Callable[[List[str]], Awaitable[None]]
+
+
+class SessionExpiry:
+    """
+    Deadlines of all open SOS sessions in one min-heap, drained by one
+    sweeper task every `sweep_interval` seconds.
+
+    A session expires `inactivity_ttl` seconds after its last activity
+    (creation, opt-in, resource request) or `max_ttl` seconds after it
+    was created, whichever comes first; 0 disables either limit.
+
+    Each session has a single heap entry. Activity only moves a deadline
+    later, so touch() just records the time; when the stale entry reaches
+    the top of the heap it is pushed back with the real deadline.
+    Everything due in one sweep is handed to `on_expire` together.
+
+    touch() only sees this process. With a store shared by replicas,
+    `on_expire` re-reads the session's last_activity from the store and
+    hands still-busy sessions back to track().
+    """
+
+    def __init__(
+        self,
+        on_expire: ExpireFn,
+        inactivity_ttl: float = 6 * 3600.0,
+        max_ttl: float = 48 * 3600.0,
+        sweep_interval: float = 60.0,
+    ) -> None:
+        self._on_expire = on_expire
+        self.inactivity_ttl = inactivity_ttl
+        self.max_ttl = max_ttl
+        self.sweep_interval = sweep_interval
+        self._heap: List[Tuple[float, str]] = []
+        # event_id -> (created_at, last activity), wall-clock seconds
+        self._times: Dict[str, Tuple[float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.inactivity_ttl or self.max_ttl)
+
+    def track(
+        self,
+        event_id: str,
+        created_at: Optional[float] = None,
+        last_activity: Optional[float] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        created_at = created_at if created_at is not None else now
+        last_activity = last_activity if last_activity is not None else now
+        already = event_id in self._times
+        self._times[event_id] = (created_at, last_activity)
+        if not already:
+            heapq.heappush(self._heap, (self.deadline(created_at, last_activity), event_id))
+
+    def touch(self, event_id: str) -> None:
+        times = self._times.get(event_id)
+        if times is not None:
+            self._times[event_id] = (times[0], time.time())
+
+    def forget(self, event_id: str) -> None:
+        """
+        Session closed: its heap entry is skipped when it comes up.
+        """
+        self._times.pop(event_id, None)
+
+    def deadline(self, created_at: float, last_activity: float) -> float:
+        deadlines = []
+        if self.inactivity_ttl:
+            deadlines.append(last_activity + self.inactivity_ttl)
+        if self.max_ttl:
+            deadlines.append(created_at + self.max_ttl)
+        return min(deadlines)
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """
+        Pop every session whose deadline has passed.
+        """
+        now = time.time() if now is None else now
+        expired: List[str] = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, event_id = heapq.heappop(heap)
+            times = self._times.get(event_id)
+            if times is None:
+                # forgotten (closed) meanwhile
+                continue
+            deadline = self.deadline(*times)
+            if deadline > now:
+                heapq.heappush(heap, (deadline, event_id))
+                continue
+            del self._times[event_id]
+            expired.append(event_id)
+        if len(heap) > 2 * len(self._times) + 64:
+            # many closed sessions left dead entries behind
+            self._heap = [(d, e) for d, e in heap if e in self._times]
+            heapq.heapify(self._heap)
+        return expired
+
+    async def sweep(self) -> int:
+        expired = self.due()
+        if expired:
+            try:
+                await self._on_expire(expired)
+            except Exception:
+                logger.exception("Failed to expire %d SOS sessions", len(expired))
+        return len(expired)
+
+    def start(self) -> None:
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run(), name="sos-expiry")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.sweep()
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
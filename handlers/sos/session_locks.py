@@ -0,0 +1,52 @@
+import asyncio
+import contextlib
+from typing import AsyncIterator, Dict
+
+
+class _Entry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        # holder + waiters
+        self.users = 0
+
+
+class SessionLocks:
+    """
+    One asyncio.Lock per SOS event, so callbacks of the same session
+    (opt-in, resource request, resolve, TTL expiry) apply their check,
+    mutation and storage write in order, while different sessions never
+    wait on each other.
+
+    A lock is created on first use and dropped as soon as nobody holds or
+    waits for it: the table is as large as the current contention, and a
+    closed session leaves nothing behind.
+
+    Per process: replicas sharing a Redis store still rely on its atomic
+    scripts.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, _Entry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def locked(self, event_id: str) -> bool:
+        entry = self._entries.get(event_id)
+        return entry is not None and entry.lock.locked()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, event_id: str) -> AsyncIterator[None]:
+        entry = self._entries.get(event_id)
+        if entry is None:
+            entry = self._entries[event_id] = _Entry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._entries[event_id]
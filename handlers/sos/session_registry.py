@@ -0,0 +1,260 @@
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+# -------- Event ids --------
+
+# snowflake layout: milliseconds since EVENT_ID_EPOCH | worker | sequence
+EVENT_ID_EPOCH_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+_WORKER_BITS = 10
+_SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << _WORKER_BITS) - 1
+_MAX_SEQUENCE = (1 << _SEQUENCE_BITS) - 1
+# 63-bit ids are at most 13 base36 digits; the fixed width also tells them
+# apart from legacy ids ("<chat_id>_<message_id>" or a bare message_id)
+EVENT_ID_LENGTH = 13
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class EventIdGenerator:
+    """
+    Snowflake-style SOS ids, made locally before the SOS message is sent,
+    so its first keyboard already carries the final id.
+
+    Ids are unique across chats, and across restarts as long as the clock
+    does not go back past the previous run; replicas sharing one session
+    store need distinct `worker_id`s (0..MAX_WORKER_ID). Within a process
+    ids are strictly increasing, even if the clock steps back.
+    """
+
+    def __init__(self, worker_id: int = 0) -> None:
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be in 0..{MAX_WORKER_ID}, got {worker_id}")
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self) -> str:
+        now_ms = max(int(time.time() * 1000) - EVENT_ID_EPOCH_MS, self._last_ms)
+        if now_ms == self._last_ms:
+            self._sequence = (self._sequence + 1) & _MAX_SEQUENCE
+            if self._sequence == 0:
+                # sequence exhausted within one millisecond: borrow the next
+                now_ms += 1
+        else:
+            self._sequence = 0
+        self._last_ms = now_ms
+
+        value = (
+            (now_ms << (_WORKER_BITS + _SEQUENCE_BITS))
+            | (self.worker_id << _SEQUENCE_BITS)
+            | self._sequence
+        )
+        digits = []
+        while value:
+            value, digit = divmod(value, 36)
+            digits.append(_BASE36[digit])
+        return "".join(reversed(digits)).rjust(EVENT_ID_LENGTH, "0")
+
+
+def event_id_time(event_id: str) -> Optional[float]:
+    """
+    Creation time (epoch seconds) of a snowflake id; None for legacy ids.
+    """
+    if len(event_id) != EVENT_ID_LENGTH or not event_id.isalnum():
+        return None
+    try:
+        value = int(event_id, 36)
+    except ValueError:
+        return None
+    return ((value >> (_WORKER_BITS + _SEQUENCE_BITS)) + EVENT_ID_EPOCH_MS) / 1000.0
+
+
+def make_event_id(chat_id: int, message_id: int) -> str:
+    """
+    Legacy composite id, from before ids were generated ahead of the send.
+    """
+    return f"{chat_id}_{message_id}"
+
+
+def message_id_of(event_id: str) -> Optional[int]:
+    # only legacy ids embed the message_id: "<chat_id>_<message_id>", or
+    # the bare message_id before composite keys
+    if event_id_time(event_id) is not None:
+        return None
+    try:
+        return int(event_id.rsplit("_", 1)[-1])
+    except ValueError:
+        return None
+
+
+class SOSSession:
+    """
+    One live SOS. Slotted and with helpers packed in an int64 array,
+    so thousands of open sessions stay small. Resource tallies are only
+    allocated once something was requested.
+    """
+
+    __slots__ = (
+        "event_id",
+        "chat_id",
+        "message_id",
+        "requester_user_id",
+        "requester_name",
+        "is_active",
+        "created_at",
+        "last_activity",
+        "_helpers",
+        "_helper_names",
+        "_resources",
+    )
+
+    def __init__(
+        self,
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+        requester_name: str = "",
+        is_active: bool = True,
+        created_at: Optional[float] = None,
+    ) -> None:
+        self.event_id = event_id
+        self.chat_id = chat_id
+        self.message_id = message_id if message_id is not None else message_id_of(event_id)
+        self.requester_user_id = requester_user_id
+        self.requester_name = requester_name
+        self.is_active = is_active
+        self.created_at = created_at if created_at is not None else time.time()
+        # last opt-in / resource request, as recorded by the session store
+        self.last_activity = self.created_at
+        self._helpers = array("q")
+        # display names, index-aligned with _helpers ("" if unknown)
+        self._helper_names: List[str] = []
+        self._resources: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "SOSSession":
+        """
+        Build from a storage row as returned by get_active_sos_sessions().
+        """
+        event_id = str(record["event_id"])
+        # snowflake ids carry the creation time; storage may only know when
+        # it first saw the session (Sheets rows have no creation time at all)
+        created_at = event_id_time(event_id)
+        if created_at is None:
+            created_at = record.get("created_at")
+        session = cls(
+            event_id=event_id,
+            chat_id=record["chat_id"],
+            requester_user_id=record["requester_user_id"],
+            message_id=record.get("message_id"),
+            is_active=record.get("is_active", True),
+            created_at=created_at,
+        )
+        for helper_id in record.get("helpers", ()):
+            session.add_helper(helper_id)
+        for resource_type, count in record.get("resources", {}).items():
+            session.add_resource_request(resource_type, count)
+        return session
+
+    @property
+    def helpers(self) -> List[int]:
+        return list(self._helpers)
+
+    def helper_items(self) -> List[Tuple[int, str]]:
+        """
+        (user_id, display name) in opt-in order.
+        """
+        return list(zip(self._helpers, self._helper_names))
+
+    def add_helper(self, user_id: int, name: str = "") -> bool:
+        """
+        Returns False if the user had already opted in.
+        """
+        if user_id in self._helpers:
+            return False
+        self._helpers.append(user_id)
+        self._helper_names.append(name)
+        return True
+
+    def has_helper(self, user_id: int) -> bool:
+        return user_id in self._helpers
+
+    @property
+    def resources(self) -> Dict[str, int]:
+        return dict(self._resources or {})
+
+    def add_resource_request(self, resource_type: str, count: int = 1) -> int:
+        """
+        Returns the new tally for this resource type.
+        """
+        if self._resources is None:
+            self._resources = {}
+        self._resources[resource_type] = self._resources.get(resource_type, 0) + count
+        return self._resources[resource_type]
+
+
+class SessionRegistry:
+    """
+    Active SOS sessions keyed by event_id, with secondary indexes by
+    chat_id and requester_user_id. All lookups are dict hits.
+    `rehydrated` stays False until sessions from storage have been loaded.
+    """
+
+    def __init__(self) -> None:
+        self.rehydrated = False
+        self._sessions: Dict[str, SOSSession] = {}
+        self._by_chat: Dict[int, Set[str]] = {}
+        self._by_requester: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[SOSSession]:
+        return iter(list(self._sessions.values()))
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self._sessions
+
+    def add(self, session: SOSSession) -> None:
+        self.remove(session.event_id)
+        self._sessions[session.event_id] = session
+        self._by_chat.setdefault(session.chat_id, set()).add(session.event_id)
+        self._by_requester.setdefault(session.requester_user_id, set()).add(session.event_id)
+
+    def get(self, event_id: str) -> Optional[SOSSession]:
+        return self._sessions.get(event_id)
+
+    def remove(self, event_id: str) -> Optional[SOSSession]:
+        session = self._sessions.pop(event_id, None)
+        if session is None:
+            return None
+        _discard(self._by_chat, session.chat_id, event_id)
+        _discard(self._by_requester, session.requester_user_id, event_id)
+        return session
+
+    def close(self, event_id: str) -> Optional[SOSSession]:
+        """
+        Mark inactive and drop from the registry. None if it was not active.
+        """
+        session = self.remove(event_id)
+        if session is not None:
+            session.is_active = False
+        return session
+
+    def by_chat(self, chat_id: int) -> List[SOSSession]:
+        return [self._sessions[e] for e in self._by_chat.get(chat_id, ())]
+
+    def by_requester(self, user_id: int) -> List[SOSSession]:
+        return [self._sessions[e] for e in self._by_requester.get(user_id, ())]
+
+
+def _discard(index: Dict[int, Set[str]], key: int, event_id: str) -> None:
+    ids = index.get(key)
+    if ids is None:
+        return
+    ids.discard(event_id)
+    if not ids:
+        del index[key]
@@ -0,0 +1,340 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional, Protocol
+
+from handlers.sos.session_registry import SOSSession, SessionRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(Protocol):
+    """
+    Live SOS state shared by the handlers.
+
+    Mutations are atomic per session, so several bot replicas behind one
+    webhook can serve the same SOS without disagreeing on who opted in or
+    whether it is closed. `rehydrated` is False until sessions from storage
+    have been loaded (or when the store is shared and already holds them).
+    """
+
+    rehydrated: bool
+
+    async def create(self, session: SOSSession) -> bool:
+        """
+        Add a session unless one with this event_id exists. True if added.
+        """
+        ...
+
+    async def get(self, event_id: str) -> Optional[SOSSession]:
+        """
+        Snapshot of an active session; None if unknown or closed.
+        """
+        ...
+
+    async def add_helper(self, event_id: str, user_id: int, name: str = "") -> Optional[bool]:
+        """
+        True if added, False if already a helper, None if not active.
+        A new helper moves the session's last_activity to now.
+        """
+        ...
+
+    async def add_resource_request(
+        self, event_id: str, resource_type: str, count: int = 1
+    ) -> Optional[int]:
+        """
+        New tally for this resource type, None if not active.
+        Moves the session's last_activity to now.
+        """
+        ...
+
+    async def close(
+        self, event_id: str, closed_by_user_id: int, last_activity: Optional[float] = None
+    ) -> bool:
+        """
+        Close an active session. Only the first caller gets True.
+        With `last_activity`, only if nothing happened in the session since
+        (expiry closing a session that looked idle when it was read).
+        """
+        ...
+
+    async def count(self) -> int: ...
+
+    async def helper_count(self) -> int:
+        """
+        Helpers across all active sessions (metrics).
+        """
+        ...
+
+    async def aclose(self) -> None: ...
+
+
+# -------- In-process --------
+
+
+class InMemorySessionStore:
+    """
+    SessionStore over a SessionRegistry (single process). Every method
+    completes without yielding, which makes it atomic on the event loop.
+    """
+
+    def __init__(self, registry: Optional[SessionRegistry] = None) -> None:
+        self.registry = registry if registry is not None else SessionRegistry()
+
+    @property
+    def rehydrated(self) -> bool:
+        return self.registry.rehydrated
+
+    @rehydrated.setter
+    def rehydrated(self, value: bool) -> None:
+        self.registry.rehydrated = value
+
+    async def create(self, session: SOSSession) -> bool:
+        if session.event_id in self.registry:
+            return False
+        self.registry.add(session)
+        return True
+
+    async def get(self, event_id: str) -> Optional[SOSSession]:
+        return self.registry.get(event_id)
+
+    async def add_helper(self, event_id: str, user_id: int, name: str = "") -> Optional[bool]:
+        session = self.registry.get(event_id)
+        if session is None or not session.is_active:
+            return None
+        added = session.add_helper(user_id, name)
+        if added:
+            session.last_activity = time.time()
+        return added
+
+    async def add_resource_request(
+        self, event_id: str, resource_type: str, count: int = 1
+    ) -> Optional[int]:
+        session = self.registry.get(event_id)
+        if session is None or not session.is_active:
+            return None
+        session.last_activity = time.time()
+        return session.add_resource_request(resource_type, count)
+
+    async def close(
+        self, event_id: str, closed_by_user_id: int, last_activity: Optional[float] = None
+    ) -> bool:
+        session = self.registry.get(event_id)
+        if session is not None and last_activity is not None and session.last_activity > last_activity:
+            return False
+        return self.registry.close(event_id) is not None
+
+    async def count(self) -> int:
+        return len(self.registry)
+
+    async def helper_count(self) -> int:
+        return sum(len(session.helpers) for session in self.registry)
+
+    async def aclose(self) -> None:
+        return None
+
+
+# -------- Redis --------
+
+# KEYS: session, helpers, helper_order  ARGV: user_id, name, now
+_ADD_HELPER = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'ACTIVE' then return -1 end
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2]) == 0 then return 0 end
+redis.call('RPUSH', KEYS[3], ARGV[1])
+redis.call('HSET', KEYS[1], 'last_activity', ARGV[3])
+return 1
+"""
+
+# KEYS: session, resources  ARGV: resource_type, count, now
+_ADD_RESOURCE = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'ACTIVE' then return -1 end
+redis.call('HSET', KEYS[1], 'last_activity', ARGV[3])
+return redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+"""
+
+# KEYS: session, helpers, helper_order, resources, active
+# ARGV: closed_by, ttl, last_activity seen by the caller ("" = close anyway), event_id
+_CLOSE = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'ACTIVE' then return 0 end
+if ARGV[3] ~= '' then
+    local last = tonumber(redis.call('HGET', KEYS[1], 'last_activity') or '0')
+    if last and last > tonumber(ARGV[3]) then return 0 end
+end
+redis.call('HSET', KEYS[1], 'status', 'CLOSED', 'closed_by', ARGV[1])
+for i = 1, 4 do redis.call('EXPIRE', KEYS[i], ARGV[2]) end
+redis.call('SREM', KEYS[5], ARGV[4])
+return 1
+"""
+
+# KEYS: session, helpers, helper_order, resources, active
+# ARGV: event_id, #field args, #helper args, #resource args,
+#       field/value pairs, user_id/name pairs, resource_type/tally pairs
+_CREATE = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+local first = 5
+local last = first + tonumber(ARGV[2]) - 1
+redis.call('HSET', KEYS[1], unpack(ARGV, first, last))
+first, last = last + 1, last + tonumber(ARGV[3])
+for i = first, last, 2 do
+    if redis.call('HSETNX', KEYS[2], ARGV[i], ARGV[i + 1]) == 1 then
+        redis.call('RPUSH', KEYS[3], ARGV[i])
+    end
+end
+first, last = last + 1, last + tonumber(ARGV[4])
+for i = first, last, 2 do redis.call('HINCRBY', KEYS[4], ARGV[i], ARGV[i + 1]) end
+if redis.call('HGET', KEYS[1], 'status') == 'ACTIVE' then
+    redis.call('SADD', KEYS[5], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisSessionStore:
+    """
+    SessionStore on Redis (or any server speaking its protocol), shared by
+    all replicas. Per session:
+
+        {<prefix>}:<event_id>               hash  requester, status, ...
+        {<prefix>}:<event_id>:helpers       hash  user_id -> name (HSETNX)
+        {<prefix>}:<event_id>:helper_order  list  user_ids in opt-in order
+        {<prefix>}:<event_id>:resources     hash  resource_type -> tally
+        {<prefix>}:active                   set   active event_ids
+
+    Create, helper-add, resource-add and close are Lua scripts that check
+    and write a session (and the active set) in one step. The braces keep
+    every key in one Redis Cluster slot, which the scripts need; the store
+    therefore lives on one node of a cluster. Closed sessions expire after
+    `closed_ttl` seconds.
+
+    The redis package is imported lazily; only needed with SESSION_STORE=redis.
+    `client` replaces the connection made from `url` with a ready
+    redis.asyncio-compatible client (decode_responses=True), e.g. the
+    fakeredis server of benchmarks/check_redis_store.py.
+    """
+
+    def __init__(
+        self,
+        url: str = "",
+        prefix: str = "sos",
+        closed_ttl: int = 86_400,
+        client: Any = None,
+    ) -> None:
+        if client is None:
+            import redis.asyncio as redis
+
+            client = redis.from_url(url, decode_responses=True)
+        self._redis = client
+        self.prefix = prefix
+        self.closed_ttl = closed_ttl
+        # set by startup: True at once if another replica already filled it
+        self.rehydrated = False
+
+        self._add_helper = self._redis.register_script(_ADD_HELPER)
+        self._add_resource = self._redis.register_script(_ADD_RESOURCE)
+        self._close = self._redis.register_script(_CLOSE)
+        self._create = self._redis.register_script(_CREATE)
+
+    def _keys(self, event_id: str) -> List[str]:
+        base = f"{{{self.prefix}}}:{event_id}"
+        return [base, f"{base}:helpers", f"{base}:helper_order", f"{base}:resources"]
+
+    @property
+    def _active_key(self) -> str:
+        return f"{{{self.prefix}}}:active"
+
+    async def create(self, session: SOSSession) -> bool:
+        fields: Dict[str, Any] = {
+            "chat_id": session.chat_id,
+            "message_id": "" if session.message_id is None else session.message_id,
+            "requester_user_id": session.requester_user_id,
+            "requester_name": session.requester_name,
+            "status": "ACTIVE" if session.is_active else "CLOSED",
+            "created_at": session.created_at,
+            "last_activity": session.last_activity,
+        }
+        field_args = [str(x) for pair in fields.items() for x in pair]
+        # rehydrated sessions bring their helpers and tallies along
+        helper_args = [str(x) for pair in session.helper_items() for x in pair]
+        resource_args = [str(x) for pair in session.resources.items() for x in pair]
+        args = [
+            session.event_id,
+            str(len(field_args)),
+            str(len(helper_args)),
+            str(len(resource_args)),
+            *field_args,
+            *helper_args,
+            *resource_args,
+        ]
+        keys = self._keys(session.event_id) + [self._active_key]
+        return bool(await self._create(keys=keys, args=args))
+
+    async def get(self, event_id: str) -> Optional[SOSSession]:
+        session_key, helpers_key, order_key, resources_key = self._keys(event_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(session_key)
+            pipe.lrange(order_key, 0, -1)
+            pipe.hgetall(helpers_key)
+            pipe.hgetall(resources_key)
+            fields, order, names, resources = await pipe.execute()
+
+        if not fields or fields.get("status") != "ACTIVE":
+            return None
+        session = SOSSession(
+            event_id=event_id,
+            chat_id=int(fields["chat_id"]),
+            requester_user_id=int(fields["requester_user_id"]),
+            message_id=int(fields["message_id"]) if fields.get("message_id") else None,
+            requester_name=fields.get("requester_name", ""),
+            created_at=float(fields.get("created_at") or time.time()),
+        )
+        if fields.get("last_activity"):
+            session.last_activity = float(fields["last_activity"])
+        for user_id in order:
+            session.add_helper(int(user_id), names.get(user_id, ""))
+        for resource_type, tally in resources.items():
+            session.add_resource_request(resource_type, int(tally))
+        return session
+
+    async def add_helper(self, event_id: str, user_id: int, name: str = "") -> Optional[bool]:
+        session_key, helpers_key, order_key, _ = self._keys(event_id)
+        result = await self._add_helper(
+            keys=[session_key, helpers_key, order_key],
+            args=[str(user_id), name, str(time.time())],
+        )
+        return None if result < 0 else bool(result)
+
+    async def add_resource_request(
+        self, event_id: str, resource_type: str, count: int = 1
+    ) -> Optional[int]:
+        session_key, _, _, resources_key = self._keys(event_id)
+        result = await self._add_resource(
+            keys=[session_key, resources_key],
+            args=[resource_type, str(count), str(time.time())],
+        )
+        return None if result < 0 else int(result)
+
+    async def close(
+        self, event_id: str, closed_by_user_id: int, last_activity: Optional[float] = None
+    ) -> bool:
+        closed = await self._close(
+            keys=self._keys(event_id) + [self._active_key],
+            args=[
+                str(closed_by_user_id),
+                str(self.closed_ttl),
+                "" if last_activity is None else str(last_activity),
+                event_id,
+            ],
+        )
+        return bool(closed)
+
+    async def count(self) -> int:
+        return await self._redis.scard(self._active_key)
+
+    async def helper_count(self) -> int:
+        event_ids = await self._redis.smembers(self._active_key)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for event_id in event_ids:
+                pipe.hlen(self._keys(event_id)[1])
+            return sum(await pipe.execute())
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+from telegram.helpers import escape_markdown
+
+from utils.keyboards import sos_main_keyboard
+from handlers.sos.session_registry import SOSSession
+
+logger = logging.getLogger(__name__)
+
+# max helper names listed in the group message
+MAX_LISTED_HELPERS = 15
+
+
+def resource_label(resource_type: str) -> str:
+    if resource_type == "water":
+        return "آب"
+    if resource_type == "medicine":
+        return "دارو"
+    if resource_type == "power":
+        return "نیروی فیزیکی"
+    return resource_type
+
+
+def _mention(user_id: int, name: str) -> str:
+    return f"[{escape_markdown(name or 'کاربر')}](tg://user?id={user_id})"
+
+
+def render_sos_text(session: SOSSession) -> str:
+    """
+    Text of the group SOS message, including the live summary
+    (helpers + resource request tallies).
+    """
+    lines = [
+        "🚨 *درخواست کمک اضطراری*",
+        "",
+        f"درخواست‌کننده: {_mention(session.requester_user_id, session.requester_name)}",
+        "اگر می‌توانید کمک کنید، روی «کمک می‌کنم» بزنید.",
+        "و در صورت نیاز نوع کمک (آب / دارو / نیرو) را انتخاب کنید.",
+    ]
+
+    helpers = session.helper_items()
+    if helpers:
+        listed = "، ".join(_mention(uid, name) for uid, name in helpers[:MAX_LISTED_HELPERS])
+        if len(helpers) > MAX_LISTED_HELPERS:
+            listed += f" و {len(helpers) - MAX_LISTED_HELPERS} نفر دیگر"
+        lines += ["", f"🙋 یاری‌دهندگان ({len(helpers)}): {listed}"]
+
+    resources = session.resources
+    if resources:
+        tallies = " · ".join(
+            f"{resource_label(rtype)} ×{count}" for rtype, count in resources.items()
+        )
+        lines += ["", f"📦 درخواست‌ها: {tallies}"]
+
+    return "\n".join(lines)
+
+
+EXPIRED_TEXT = (
+    "⌛ این SOS مدتی بدون فعالیت بود و به‌طور خودکار بسته شد.\n"
+    "اگر هنوز به کمک نیاز دارید، دوباره /sos بفرستید."
+)
+
+
+async def edit_expired_message(bot: Bot, session: SOSSession) -> None:
+    """
+    Replace the group SOS message (and its keyboard) with the expiry notice.
+    """
+    if session.message_id is None:
+        return
+    try:
+        await bot.edit_message_text(
+            chat_id=session.chat_id,
+            message_id=session.message_id,
+            text=EXPIRED_TEXT,
+        )
+    except Exception:
+        logger.exception("Failed to edit expired SOS message event_id=%s", session.event_id)
+
+
+class StatusMessageUpdater:
+    """
+    Keeps the group SOS message in sync with its session.
+
+    Edits are debounced per session: the first change after a quiet period
+    is shown at once, and any burst of clicks after that collapses into at
+    most one edit_message_text per `interval` seconds.
+
+    With a `loader` (SessionStore.get) the session is re-read right before
+    each edit, so changes made by other replicas are shown too.
+
+    An edit already on its way to Telegram is not cancelled but awaited by
+    cancel(), so the resolved / expired text is always the last one.
+    """
+
+    def __init__(
+        self,
+        interval: float = 3.0,
+        loader: Optional[Callable[[str], Awaitable[Optional[SOSSession]]]] = None,
+    ) -> None:
+        self.interval = interval
+        self._loader = loader
+        # waiting for their slot
+        self._pending: Dict[str, asyncio.Task] = {}
+        # re-reading the session / calling edit_message_text
+        self._sending: Dict[str, asyncio.Task] = {}
+        self._last_edit: Dict[str, float] = {}
+
+    def schedule(self, bot: Bot, session: SOSSession) -> None:
+        event_id = session.event_id
+        if event_id in self._pending or session.message_id is None:
+            return
+        delay = max(0.0, self._last_edit.get(event_id, 0.0) + self.interval - time.monotonic())
+        self._pending[event_id] = asyncio.create_task(self._edit_later(bot, session, delay))
+
+    async def cancel(self, event_id: str) -> None:
+        """
+        Drop any pending edit and wait for one in flight (session closed /
+        expired; call after the store has closed it).
+        """
+        task = self._pending.pop(event_id, None)
+        if task is not None:
+            task.cancel()
+        sending = self._sending.get(event_id)
+        if sending is not None:
+            await asyncio.gather(sending, return_exceptions=True)
+            # a flood-control retry it may have scheduled
+            task = self._pending.pop(event_id, None)
+            if task is not None:
+                task.cancel()
+        self._last_edit.pop(event_id, None)
+
+    async def aclose(self) -> None:
+        tasks = list(self._pending.values()) + list(self._sending.values())
+        self._pending.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _edit_later(self, bot: Bot, session: SOSSession, delay: float) -> None:
+        event_id = session.event_id
+        await asyncio.sleep(delay)
+
+        # clicks from now on schedule the next edit
+        self._pending.pop(event_id, None)
+        self._sending[event_id] = asyncio.current_task()
+        try:
+            await self._send(bot, session)
+        finally:
+            if self._sending.get(event_id) is asyncio.current_task():
+                del self._sending[event_id]
+
+    async def _send(self, bot: Bot, session: SOSSession) -> None:
+        event_id = session.event_id
+        if self._loader is not None:
+            session = await self._loader(event_id)
+        if session is None or not session.is_active:
+            return
+        self._last_edit[event_id] = time.monotonic()
+
+        try:
+            await bot.edit_message_text(
+                chat_id=session.chat_id,
+                message_id=session.message_id,
+                text=render_sos_text(session),
+                reply_markup=sos_main_keyboard(event_id=event_id),
+                parse_mode=ParseMode.MARKDOWN,
+            )
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if not isinstance(retry_after, (int, float)):
+                retry_after = retry_after.total_seconds()
+            logger.warning("Flood control on SOS event_id=%s; retry in %ss", event_id, retry_after)
+            self._last_edit[event_id] = time.monotonic() + retry_after
+            self.schedule(bot, session)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.exception("Failed to edit SOS status message event_id=%s", event_id)
+        except Exception:
+            logger.exception("Failed to edit SOS status message event_id=%s", event_id)
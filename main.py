@@ -1,11 +1,15 @@
-
 import asyncio
+import functools
 import logging
 import os
+import random
 import sys
+import time
+from typing import List
 
 from dotenv import load_dotenv
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
@@ -13,13 +17,28 @@ from telegram.ext import (
     filters,
 )
 
-from handlers.registration.registration_flow import handle_start
-from handlers.sos.callback_controller import (
+from handlers.registration.registration_flow import handle_registration_location, handle_start
+from handlers.sos.callbacks import (
     sos_button_router,
     handle_sos_command,
+    handle_sos_location,
 )
-from storage.sheet_storage import SheetStorage
+from handlers.sos.broadcast import AlertBroadcaster
+from handlers.sos.request_debouncer import ResourceRequestDebouncer
+from handlers.sos.session_expiry import SessionExpiry
+from handlers.sos.session_locks import SessionLocks
+from handlers.sos.session_registry import MAX_WORKER_ID, EventIdGenerator, SOSSession, SessionRegistry
+from handlers.sos.session_store import InMemorySessionStore, RedisSessionStore, SessionStore
+from handlers.sos.status_message import StatusMessageUpdater, edit_expired_message
+from storage.async_writer import AsyncSheetWriter
+from storage.location_index import LocationIndex
+from storage.medical_index import MedicalIndex
+from storage.registration_index import RegistrationIndex
+from storage.sheet_storage import CompactionInProgress, SheetStorage
 from storage.sheet_writer import SheetWriter
+from storage.sqlite_storage import SQLiteStorage
+from storage.write_journal import WriteJournal
+from utils import callback_codec, metrics
 
 # ---------- Logging ----------
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -45,6 +64,28 @@ def get_required_env(name: str) -> str:
     return value
 
 
+def get_int_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning("Invalid int for ENV %s=%r, using default %s", name, value, default)
+        return default
+
+
+def get_float_env(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Invalid float for ENV %s=%r, using default %s", name, value, default)
+        return default
+
+
 async def on_startup(app) -> None:
     """
     Startup hook: initialize SheetStorage + rehydrate if needed.
@@ -55,29 +96,373 @@ async def on_startup(app) -> None:
     credentials_json = get_required_env("GOOGLE_SERVICE_ACCOUNT_JSON")
 
     storage = SheetStorage(sheet_id=sheet_id, credentials_json=credentials_json)
-    writer = SheetWriter(storage=storage)
+
+    # STORAGE_BACKEND=sqlite: local primary store, Sheets becomes an async mirror
+    primary = None
+    backend = os.getenv("STORAGE_BACKEND", "sheets").lower()
+    if backend == "sqlite":
+        primary = SQLiteStorage(os.getenv("SQLITE_PATH", "data/sos.db"))
+    elif backend != "sheets":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
+    logger.info("Storage backend: %s", backend)
+
+    writer = AsyncSheetWriter(
+        writer=SheetWriter(storage=storage),
+        max_workers=get_int_env("STORAGE_MAX_WORKERS", 4),
+        call_timeout=get_float_env("STORAGE_CALL_TIMEOUT", 15.0),
+        flush_interval=get_float_env("SHEETS_FLUSH_INTERVAL", 2.0),
+        batch_max_rows=get_int_env("SHEETS_BATCH_MAX_ROWS", 50),
+        journal=WriteJournal(os.getenv("SHEETS_JOURNAL_PATH", "data/sheets_journal.jsonl")),
+        primary=primary,
+        read_per_minute=get_float_env("SHEETS_READS_PER_MINUTE", 60.0),
+        write_per_minute=get_float_env("SHEETS_WRITES_PER_MINUTE", 60.0),
+    )
+
+    # Re-apply writes that never reached the sheet before the last shutdown.
+    # Local only: the rows wait in the buffer until Sheets is connected.
+    try:
+        await writer.replay_journal()
+    except Exception:
+        logger.exception("Failed to replay Sheets write journal")
 
     # attach to application so handlers can use
     app.bot_data["sheet_storage"] = storage
     app.bot_data["sheet_writer"] = writer
 
-    # Rehydrate any active SOS from sheet (stateless model)
+    # Medical info served from memory, refreshed in the background
+    app.bot_data["medical_index"] = MedicalIndex(
+        loader=writer.get_all_medical_info,
+        fallback=writer.get_user_medical_info,
+        ttl=get_float_env("MEDICAL_INDEX_TTL", 300.0),
+        max_users=get_int_env("MEDICAL_INDEX_MAX_USERS", 50_000),
+    )
+
+    # /start answers known users from memory (loaded once storage is up)
+    app.bot_data["registration_index"] = RegistrationIndex()
+
+    store = build_session_store()
+    app.bot_data["sos_store"] = store
+    if await store.count():
+        # shared store already filled by another replica
+        store.rehydrated = True
+
+    # Live SOS message: bursts of clicks collapse into one edit per interval
+    app.bot_data["sos_status_updater"] = StatusMessageUpdater(
+        interval=get_float_env("SOS_STATUS_EDIT_INTERVAL", 3.0),
+        loader=store.get,
+    )
+    # SOS ids made before the message is sent. Replicas sharing a session
+    # store need distinct EVENT_ID_WORKER values; unset picks one at random.
+    app.bot_data["event_ids"] = EventIdGenerator(
+        worker_id=get_int_env("EVENT_ID_WORKER", random.randint(0, MAX_WORKER_ID))
+    )
+    # callbacks (and expiry) of one SOS run one at a time; other SOS in parallel
+    app.bot_data["sos_locks"] = SessionLocks()
+    # Abandoned SOS: auto-closed after a quiet period or a maximum age
+    expiry = SessionExpiry(
+        on_expire=functools.partial(expire_sessions, app),
+        inactivity_ttl=get_float_env("SOS_INACTIVITY_TTL", 6 * 3600.0),
+        max_ttl=get_float_env("SOS_MAX_TTL", 48 * 3600.0),
+        sweep_interval=get_float_env("SOS_EXPIRY_SWEEP_INTERVAL", 60.0),
+    )
+    app.bot_data["sos_expiry"] = expiry
+    expiry.start()
+    # Button-mashing: repeated resource taps collapse into one logged request
+    app.bot_data["resource_request_debouncer"] = ResourceRequestDebouncer(
+        writer.log_resource_request,
+        window=get_float_env("RESOURCE_REQUEST_DEBOUNCE", 10.0),
+    )
+    # Shared locations on a grid: a new SOS alerts the nearest helpers by DM
+    nearest_helpers = get_int_env("NEAREST_HELPERS", 10)
+    if nearest_helpers > 0:
+        app.bot_data["location_index"] = LocationIndex(
+            cell_km=get_float_env("LOCATION_CELL_KM", 1.0),
+            max_km=get_float_env("NEAREST_HELPERS_MAX_KM", 25.0),
+            k=nearest_helpers,
+        )
+
+    # SOS alert DMs; SOS_BROADCAST=on also alerts every registered user
+    alert_all = os.getenv("SOS_BROADCAST", "off").lower() in ("1", "true", "yes", "on")
+    app.bot_data["sos_broadcaster"] = AlertBroadcaster(
+        max_concurrency=get_int_env("BROADCAST_CONCURRENCY", 20),
+        per_second=get_float_env("BROADCAST_PER_SECOND", 25.0),
+        per_chat_interval=get_float_env("BROADCAST_PER_CHAT_INTERVAL", 1.0),
+        alert_all=alert_all,
+    )
+    if alert_all:
+        logger.info("SOS alert broadcast enabled")
+    if primary is not None and primary.is_seeded("sos_sessions"):
+        # local store has everything; no need to wait for Sheets
+        await rehydrate_sessions(app)
+
+    metrics_port = get_int_env("METRICS_PORT", 0)
+    if metrics_port:
+        metrics.REGISTRY.add_collector(functools.partial(collect_metrics, app))
+        app.bot_data["metrics_server"] = await metrics.start_http_server(
+            os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port
+        )
+
+    # Sheets connection runs in the background: polling starts right away and
+    # handlers work in degraded mode (writes journaled + buffered) until ready.
+    app.bot_data["storage_connect_task"] = asyncio.create_task(
+        connect_storage(app), name="storage-connect"
+    )
+
+    logger.info("Startup completed (storage connecting in background)")
+
+
+async def connect_storage(app, retry_delays: tuple = (1.0, 2.0, 5.0, 10.0, 30.0)) -> None:
+    """
+    Connect Sheets (retrying forever), then rehydrate and start the
+    background readers that depend on it.
+    """
+    writer: AsyncSheetWriter = app.bot_data["sheet_writer"]
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            await writer.connect()
+            break
+        except Exception:
+            delay = retry_delays[min(attempt, len(retry_delays) - 1)]
+            attempt += 1
+            logger.exception("Google Sheet connection failed (attempt %d); retry in %.0fs", attempt, delay)
+            await asyncio.sleep(delay)
+    logger.info("Google Sheet connected in %.2fs", time.monotonic() - started)
+
+    # STORAGE_BACKEND=sqlite: copy the sheet's users and active sessions
+    # into a fresh SQLite file (once per table, not "while it is empty")
+    try:
+        await writer.seed_primary()
+    except Exception:
+        logger.exception("Failed to seed SQLite store from Google Sheet")
+
+    store: SessionStore = app.bot_data["sos_store"]
+    if not store.rehydrated:
+        # replayed journal rows must land before we read them back
+        await writer.flush()
+        await rehydrate_sessions(app)
+
+    await writer.flush()
+    await load_registrations(app)
+    app.bot_data["medical_index"].start()
+
+    # 0 = off; the compact_sheets.py CLI does the same on demand
+    compact_hours = get_float_env("SHEETS_COMPACT_INTERVAL_HOURS", 0.0)
+    if compact_hours > 0:
+        app.bot_data["sheets_compaction_task"] = asyncio.create_task(
+            compact_sheets_periodically(app, compact_hours * 3600), name="sheets-compaction"
+        )
+
+
+async def compact_sheets_periodically(app, interval: float) -> None:
+    """
+    Move finished sessions to the archive worksheets every `interval` seconds.
+    """
+    writer: AsyncSheetWriter = app.bot_data["sheet_writer"]
+    while True:
+        await asyncio.sleep(interval)
+        started = time.monotonic()
+        try:
+            archived = await writer.compact_sessions()
+        except CompactionInProgress as e:
+            # another replica (or the CLI) is compacting right now
+            logger.info("Sheets compaction skipped: %s", e)
+            continue
+        except Exception:
+            logger.exception("Sheets compaction failed")
+            continue
+        logger.info("Sheets compaction archived %s in %.2fs", archived, time.monotonic() - started)
+
+
+async def collect_metrics(app) -> None:
+    """
+    Refresh gauges right before a scrape.
+    """
+    store: SessionStore = app.bot_data["sos_store"]
+    metrics.ACTIVE_SESSIONS.set(await store.count())
+    metrics.ACTIVE_HELPERS.set(await store.helper_count())
+
+    backlog = app.bot_data["sheet_writer"].backlog()
+    metrics.SHEETS_QUEUE_DEPTH.set(backlog["read_queue"], kind="read")
+    metrics.SHEETS_QUEUE_DEPTH.set(backlog["write_queue"], kind="write")
+    metrics.SHEETS_BUFFERED_ROWS.set(backlog["buffered_rows"])
+    metrics.SHEETS_JOURNAL_PENDING.set(backlog["journal_pending"])
+
+
+async def load_registrations(app) -> None:
+    """
+    Fill the registration and location indexes with one bulk read.
+    """
+    writer: AsyncSheetWriter = app.bot_data["sheet_writer"]
+    index: RegistrationIndex = app.bot_data["registration_index"]
+    locations: LocationIndex = app.bot_data.get("location_index")
+    started = time.monotonic()
     try:
-        active_sessions = storage.get_active_sos_sessions()
-        logger.info("Rehydrated %d active SOS sessions from sheet", len(active_sessions))
-        app.bot_data["active_sos_sessions"] = {s["event_id"]: s for s in active_sessions}
+        registrations = await writer.get_all_registrations()
+        index.load(registrations)
+        if locations is not None:
+            locations.load(registrations)
+        logger.info("Loaded %d registered users in %.2fs", len(index), time.monotonic() - started)
     except Exception:
-        logger.exception("Failed to rehydrate SOS sessions from Google Sheet")
-        app.bot_data["active_sos_sessions"] = {}
+        # /start keeps working: unknown users go through the update (upsert) path
+        logger.exception("Failed to load registrations")
+
+
+async def rehydrate_sessions(app) -> None:
+    """
+    Load active SOS sessions (with helpers + resources) into the session store.
+    Sessions created while storage was still connecting are kept.
+    """
+    writer: AsyncSheetWriter = app.bot_data["sheet_writer"]
+    store: SessionStore = app.bot_data["sos_store"]
+    started = time.monotonic()
+    try:
+        expiry: SessionExpiry = app.bot_data.get("sos_expiry")
+        for record in await writer.get_active_sos_sessions():
+            session = SOSSession.from_record(record)
+            # create() never overwrites: safe with replicas sharing the store
+            await store.create(session)
+            if expiry is not None:
+                # legacy Sheets rows carry no creation time: the max TTL restarts here
+                expiry.track(session.event_id, session.created_at)
+        logger.info(
+            "Rehydrated %d active SOS sessions from storage in %.2fs",
+            await store.count(),
+            time.monotonic() - started,
+        )
+    except Exception:
+        logger.exception("Failed to rehydrate SOS sessions from storage")
+    store.rehydrated = True
+
+
+async def expire_sessions(app, event_ids: List[str]) -> None:
+    """
+    Close SOS sessions whose TTL ran out (called once per expiry sweep):
+    session store, pending edits and alerts, one batched storage update,
+    then the group messages.
+    """
+    store: SessionStore = app.bot_data["sos_store"]
+    locks: SessionLocks = app.bot_data["sos_locks"]
+    expiry: SessionExpiry = app.bot_data["sos_expiry"]
+    expired: List[SOSSession] = []
+    for event_id in event_ids:
+        # after an opt-in / request already in progress for this SOS
+        async with locks.hold(event_id):
+            session = await store.get(event_id)
+            if session is None:
+                continue
+            # opt-ins served by other replicas only show in the shared store
+            if expiry.deadline(session.created_at, session.last_activity) > time.time():
+                expiry.track(event_id, session.created_at, session.last_activity)
+                continue
+            # close() is atomic: the requester or another replica may be first,
+            # and it refuses if the session saw activity since the read above
+            if await store.close(event_id, 0, last_activity=session.last_activity):
+                expired.append(session)
+                continue
+            session = await store.get(event_id)
+            if session is not None:
+                expiry.track(event_id, session.created_at, session.last_activity)
+    if not expired:
+        return
+    expired_ids = [session.event_id for session in expired]
 
-    logger.info("Startup completed")
+    status_updater: StatusMessageUpdater = app.bot_data.get("sos_status_updater")
+    broadcaster: AlertBroadcaster = app.bot_data.get("sos_broadcaster")
+    debouncer: ResourceRequestDebouncer = app.bot_data.get("resource_request_debouncer")
+    for event_id in expired_ids:
+        if status_updater is not None:
+            await status_updater.cancel(event_id)
+        if broadcaster is not None:
+            broadcaster.cancel(event_id)
+        if debouncer is not None:
+            await debouncer.flush_event(event_id)
+
+    writer: AsyncSheetWriter = app.bot_data.get("sheet_writer")
+    if writer is not None:
+        try:
+            await writer.expire_sos_sessions(expired_ids)
+        except Exception:
+            logger.exception("Failed to store expiry of %d SOS sessions", len(expired_ids))
+    metrics.SESSIONS_EXPIRED.inc(len(expired))
+
+    # a few edits at a time: Telegram throttles bursts of edits
+    slots = asyncio.Semaphore(5)
+
+    async def edit(session: SOSSession) -> None:
+        async with slots:
+            await edit_expired_message(app.bot, session)
+
+    await asyncio.gather(*(edit(session) for session in expired))
+    logger.info("Expired %d SOS sessions", len(expired))
+
+
+def build_session_store() -> SessionStore:
+    """
+    SESSION_STORE=memory (default): state lives in this process.
+    SESSION_STORE=redis: state shared by every replica through REDIS_URL,
+    so webhook updates can be load-balanced across workers.
+    """
+    kind = os.getenv("SESSION_STORE", "memory").lower()
+    if kind == "redis":
+        logger.info("Using Redis session store")
+        return RedisSessionStore(
+            url=get_required_env("REDIS_URL"),
+            prefix=os.getenv("REDIS_KEY_PREFIX", "sos"),
+            closed_ttl=get_int_env("SESSION_CLOSED_TTL", 86_400),
+        )
+    return InMemorySessionStore(SessionRegistry())
 
 
 async def on_shutdown(app) -> None:
     logger.info("Application shutting down...")
 
+    metrics_server: asyncio.AbstractServer = app.bot_data.get("metrics_server")
+    if metrics_server is not None:
+        metrics_server.close()
+
+    connect_task: asyncio.Task = app.bot_data.get("storage_connect_task")
+    if connect_task is not None and not connect_task.done():
+        connect_task.cancel()
+
+    compaction_task: asyncio.Task = app.bot_data.get("sheets_compaction_task")
+    if compaction_task is not None:
+        compaction_task.cancel()
+
+    expiry: SessionExpiry = app.bot_data.get("sos_expiry")
+    if expiry is not None:
+        await expiry.aclose()
+
+    status_updater: StatusMessageUpdater = app.bot_data.get("sos_status_updater")
+    if status_updater is not None:
+        await status_updater.aclose()
+
+    broadcaster: AlertBroadcaster = app.bot_data.get("sos_broadcaster")
+    if broadcaster is not None:
+        await broadcaster.aclose()
 
-def build_application() -> "Application":
+    medical_index: MedicalIndex = app.bot_data.get("medical_index")
+    if medical_index is not None:
+        await medical_index.aclose()
+
+    debouncer: ResourceRequestDebouncer = app.bot_data.get("resource_request_debouncer")
+    if debouncer is not None:
+        # open windows become journaled requests before the writer closes
+        await debouncer.aclose()
+
+    store: SessionStore = app.bot_data.get("sos_store")
+    if store is not None:
+        await store.aclose()
+
+    writer: AsyncSheetWriter = app.bot_data.get("sheet_writer")
+    if writer is not None:
+        await writer.aclose()
+        if isinstance(writer.primary, SQLiteStorage):
+            writer.primary.close()
+
+
+def build_application() -> Application:
     load_env()
     token = get_required_env("BOT_TOKEN")
 
@@ -90,18 +475,35 @@ def build_application() -> "Application":
         .post_shutdown(on_shutdown)
         .build()
     )
+    register_handlers(application)
+    return application
+
 
+def register_handlers(application: Application) -> None:
+    """
+    All update handlers (shared with benchmarks/load_harness.py).
+    """
     # /start -> registration flow
     application.add_handler(CommandHandler("start", handle_start))
 
     # /sos -> create new SOS event
     application.add_handler(CommandHandler("sos", handle_sos_command))
 
+    # Shared locations: private chat -> registration, reply to an SOS -> nearest helpers
+    application.add_handler(
+        MessageHandler(filters.LOCATION & filters.ChatType.PRIVATE, handle_registration_location)
+    )
+    application.add_handler(
+        MessageHandler(filters.LOCATION & filters.ChatType.GROUPS & filters.REPLY, handle_sos_location)
+    )
+
     # /admin (optional, for future extension)
     # application.add_handler(CommandHandler("admin", handle_admin))
 
     # Callback buttons for all SOS logic
-    application.add_handler(CallbackQueryHandler(sos_button_router))
+    application.add_handler(
+        CallbackQueryHandler(sos_button_router, pattern=callback_codec.PATTERN)
+    )
 
     # Optionally, handle plain text for debugging
     application.add_handler(
@@ -109,14 +511,50 @@ def build_application() -> "Application":
         group=99,
     )
 
-    return application
+
+# Only these update types have handlers; Telegram need not send the rest
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+def run_webhook(app: Application) -> None:
+    """
+    Serve updates over a webhook (BOT_MODE=webhook).
+
+    Telegram POSTs to WEBHOOK_URL + "/" + WEBHOOK_PATH; requests without the
+    X-Telegram-Bot-Api-Secret-Token header matching WEBHOOK_SECRET_TOKEN are
+    rejected. Without WEBHOOK_CERT/WEBHOOK_KEY the server speaks plain HTTP
+    and expects a TLS-terminating reverse proxy in front of it.
+    Updates queued while the bot was down are delivered, not dropped.
+    """
+    url_path = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+    public_url = get_required_env("WEBHOOK_URL").rstrip("/")
+    listen = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    port = get_int_env("WEBHOOK_PORT", 8443)
+
+    logger.info("Starting webhook on %s:%s/%s (public %s)", listen, port, url_path, public_url)
+    app.run_webhook(
+        listen=listen,
+        port=port,
+        url_path=url_path,
+        webhook_url=f"{public_url}/{url_path}",
+        secret_token=get_required_env("WEBHOOK_SECRET_TOKEN"),
+        cert=os.getenv("WEBHOOK_CERT") or None,
+        key=os.getenv("WEBHOOK_KEY") or None,
+        max_connections=get_int_env("WEBHOOK_MAX_CONNECTIONS", 40),
+        allowed_updates=ALLOWED_UPDATES,
+        drop_pending_updates=False,
+    )
 
 
 def main() -> None:
     try:
         app = build_application()
-        logger.info("Starting polling...")
-        app.run_polling(drop_pending_updates=True)
+        mode = os.getenv("BOT_MODE", "polling").lower()
+        if mode == "webhook":
+            run_webhook(app)
+        else:
+            logger.info("Starting polling...")
+            app.run_polling(drop_pending_updates=True, allowed_updates=ALLOWED_UPDATES)
     except Exception as e:
         logger.exception("Fatal error in main: %s", e)
         raise
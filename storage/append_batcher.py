@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (row, token) – the token travels with the row and is handed back on flush
+BufferedRow = Tuple[List[str], Any]
+FlushFn = Callable[[str, List[List[str]], List[Any]], Awaitable[Any]]
+
+
+class AppendBatcher:
+    """
+    Write-behind buffer for worksheet appends.
+
+    Rows are buffered per worksheet and sent with one append_rows call per
+    worksheet, either when a buffer reaches max_rows or when flush_interval
+    seconds have passed (the max write latency).
+    flush_fn receives the rows plus the tokens they were added with.
+
+    Each worksheet flushes under its own lock, so a row-addressed write
+    that waits for one worksheet's rows is not held up by another
+    worksheet's append stuck in quota backoff.
+    """
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        max_rows: int = 50,
+        flush_interval: float = 2.0,
+    ) -> None:
+        self._flush_fn = flush_fn
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+
+        self._buffers: Dict[str, List[BufferedRow]] = {}
+        self._wake = asyncio.Event()
+        self._flush_locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, sheet_name: str, row: List[str], token: Any = None) -> None:
+        buf = self._buffers.setdefault(sheet_name, [])
+        buf.append((row, token))
+        if len(buf) >= self.max_rows:
+            self._wake.set()
+
+    def pending(self) -> int:
+        return sum(len(rows) for rows in self._buffers.values())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="sheet-append-batcher")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self, sheet_name: Optional[str] = None) -> None:
+        """
+        Send everything buffered so far (or only `sheet_name`'s rows), one
+        append_rows call per worksheet. Rows of a failed call are put back
+        at the head of their buffer.
+        """
+        if sheet_name is None:
+            # also sheets whose rows another flush has taken and is still sending
+            names = list(dict.fromkeys([*self._buffers, *self._flush_locks]))
+        else:
+            names = [sheet_name]
+        for name in names:
+            await self._flush_sheet(name)
+
+    async def _flush_sheet(self, sheet_name: str) -> None:
+        lock = self._flush_locks.get(sheet_name)
+        if lock is None:
+            lock = self._flush_locks[sheet_name] = asyncio.Lock()
+        async with lock:
+            rows = self._buffers.pop(sheet_name, None)
+            if not rows:
+                return
+            try:
+                await self._flush_fn(
+                    sheet_name,
+                    [row for row, _ in rows],
+                    [token for _, token in rows],
+                )
+                logger.debug("Flushed %d rows to %s", len(rows), sheet_name)
+            except asyncio.CancelledError:
+                self._requeue(sheet_name, rows)
+                raise
+            except Exception:
+                logger.exception(
+                    "Failed to flush %d rows to %s; will retry", len(rows), sheet_name
+                )
+                self._requeue(sheet_name, rows)
+
+    def _requeue(self, sheet_name: str, rows: List[BufferedRow]) -> None:
+        self._buffers[sheet_name] = rows + self._buffers.get(sheet_name, [])
+
+    async def aclose(self, flush: bool = True) -> None:
+        """
+        Stop the background flusher and (by default) flush what is left.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if flush:
+            await self.flush()
+        if self._buffers:
+            logger.error("%d rows left unflushed on shutdown", self.pending())
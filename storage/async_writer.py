@@ -0,0 +1,561 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+from .append_batcher import AppendBatcher
+from .backend import StorageBackend
+from .quota_scheduler import READ, WRITE, Priority, QuotaScheduler
+from .sheet_storage import (
+    HELPERS,
+    REGISTRATIONS,
+    RESOURCE_REQUESTS,
+    SOS_SESSIONS,
+    SheetStorage,
+)
+from .sheet_writer import SheetWriter
+from .write_journal import WriteJournal
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# journal op -> (worksheet, row builder) for append-type mutations
+_APPEND_OPS: Dict[str, Any] = {
+    "append_registration_row": (REGISTRATIONS, SheetStorage.registration_row),
+    "log_new_sos_session": (SOS_SESSIONS, SheetStorage.sos_session_row),
+    "log_resource_request": (RESOURCE_REQUESTS, SheetStorage.resource_request_row),
+    "log_helper_optin": (HELPERS, SheetStorage.helper_optin_row),
+}
+
+# journal op -> StorageBackend method applied on the primary store
+_PRIMARY_OPS: Dict[str, str] = {
+    "append_registration_row": "append_registration",
+    "update_registration_row": "update_registration",
+    "update_registration_location": "update_registration_location",
+    "log_new_sos_session": "log_new_sos_session",
+    "close_sos_session": "close_sos_session",
+    "expire_sos_sessions": "expire_sos_sessions",
+    "log_resource_request": "log_resource_request",
+    "log_helper_optin": "log_helper_optin",
+}
+
+# worksheet -> scheduling priority of its append flushes
+_APPEND_PRIORITY: Dict[str, Priority] = {
+    SOS_SESSIONS: Priority.CRITICAL,
+    HELPERS: Priority.HIGH,
+    REGISTRATIONS: Priority.LOW,
+    RESOURCE_REQUESTS: Priority.LOW,
+}
+
+
+class AsyncSheetWriter:
+    """
+    Async facade over SheetWriter / SheetStorage.
+    All gspread calls run on a dedicated, bounded thread pool so a slow
+    Sheets round-trip never blocks the event loop (and other updates).
+    They are admitted by a QuotaScheduler: read/write quotas, priorities
+    (new SOS and closures first) and 429/5xx backoff.
+
+    Mutations are first recorded in a local write-ahead journal, then applied
+    to Sheets in the background and acknowledged; unacknowledged entries are
+    replayed on startup. Appends are write-behind: rows are coalesced by
+    AppendBatcher and sent with one append_rows call per worksheet.
+
+    With a `primary` backend (e.g. SQLiteStorage) every mutation is committed
+    there first and reads are served from it; Sheets becomes an export mirror.
+
+    The Sheets connection is opened by connect(), normally in the background.
+    Until then mutations are journaled and buffered, and Sheets reads wait
+    (within their timeout) for the connection.
+    """
+
+    def __init__(
+        self,
+        writer: SheetWriter,
+        max_workers: int = 4,
+        call_timeout: float = 15.0,
+        flush_interval: float = 2.0,
+        batch_max_rows: int = 50,
+        journal: Optional[WriteJournal] = None,
+        retry_delays: tuple = (1.0, 5.0, 30.0),
+        primary: Optional[StorageBackend] = None,
+        read_per_minute: float = 60.0,
+        write_per_minute: float = 60.0,
+    ) -> None:
+        self.writer = writer
+        self.storage = writer.storage
+        self.primary = primary
+        self.call_timeout = call_timeout
+        self.journal = journal
+        self.retry_delays = retry_delays
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="sheet-io",
+        )
+        self._scheduler = QuotaScheduler(
+            self._executor,
+            read_per_minute=read_per_minute,
+            write_per_minute=write_per_minute,
+            max_in_flight=max_workers,
+        )
+        # single thread keeps local disk I/O (journal, primary) ordered
+        # and off the event loop
+        self._local_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="storage-local",
+        )
+        self._batcher = AppendBatcher(
+            flush_fn=self._flush_rows,
+            max_rows=batch_max_rows,
+            flush_interval=flush_interval,
+        )
+        self._background: Set[asyncio.Task] = set()
+        self._ready = asyncio.Event()
+        # closes not yet applied to the sheet (rows there still say ACTIVE)
+        self._pending_closes: Set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    async def connect(self) -> None:
+        """
+        Connect the Sheets storage on the storage executor; buffered writes
+        start flowing once it succeeds.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.storage.connect)
+        self._scheduler.start()
+        self._ready.set()
+        self._batcher.start()
+
+    async def run(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        timeout: Optional[float] = None,
+        priority: Priority = Priority.NORMAL,
+        kind: str = READ,
+        **kwargs: Any,
+    ) -> T:
+        """
+        Run a blocking storage call through the scheduler, waiting at most
+        `timeout` (default call_timeout) for connection, queue and call.
+        On timeout/cancellation the awaiting handler is released; a call that
+        has not started yet is dropped from the queue.
+        """
+        call_timeout = self.call_timeout if timeout is None else timeout
+
+        async def _call() -> T:
+            await self._ready.wait()
+            return await self._scheduler.submit(fn, *args, kind=kind, priority=priority, **kwargs)
+
+        try:
+            return await asyncio.wait_for(_call(), timeout=call_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Storage call %s timed out after %.1fs",
+                getattr(fn, "__name__", fn),
+                call_timeout,
+            )
+            raise
+
+    async def _write(self, fn: Callable[..., T], *args: Any, priority: Priority) -> T:
+        """
+        Background Sheets write: no timeout, because abandoning a call that
+        may still succeed would make the retry write the rows twice.
+        """
+        await self._ready.wait()
+        return await self._scheduler.submit(fn, *args, kind=WRITE, priority=priority)
+
+    async def flush(self, sheet_name: Optional[str] = None) -> None:
+        await self._batcher.flush(sheet_name)
+
+    async def drain(self) -> None:
+        """
+        Flush buffered appends and wait until every queued row update
+        (close / expire / registration) has been applied or given up on.
+        """
+        await self.flush()
+        while self._background:
+            await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    async def seed_primary(self) -> None:
+        """
+        Copy whatever the local primary store has not been seeded with yet
+        (registrations, active sessions) from the sheet. Each table is
+        seeded once; a failure leaves it to the next start.
+        """
+        if self.primary is None:
+            return
+        if not await self._local(self.primary.is_seeded, "registrations"):
+            registrations = await self.run(self.storage.get_all_registrations, priority=Priority.LOW)
+            await self._local(self.primary.seed_registrations, registrations)
+            logger.info("Seeded local store with %d registrations from Google Sheet", len(registrations))
+        if not await self._local(self.primary.is_seeded, "sos_sessions"):
+            # replayed journal rows must land before we read them back
+            await self.flush()
+            sessions = await self.run(self.storage.get_active_sos_sessions, priority=Priority.CRITICAL)
+            await self._local(self.primary.seed_sos_sessions, sessions)
+            logger.info("Seeded local store with %d active SOS sessions from Google Sheet", len(sessions))
+
+    def backlog(self) -> Dict[str, int]:
+        """
+        Work not yet in Sheets (for metrics).
+        """
+        return {
+            "read_queue": self._scheduler.queue_depth(READ),
+            "write_queue": self._scheduler.queue_depth(WRITE),
+            "buffered_rows": self._batcher.pending(),
+            "journal_pending": self.journal.pending_count() if self.journal is not None else 0,
+        }
+
+    async def aclose(self) -> None:
+        """
+        Flush buffered appends, wait for in-flight calls and release the pools.
+        Anything still unacknowledged stays in the journal for the next start.
+        """
+        # without a connection there is nothing to flush to; rows stay journaled
+        await self._batcher.aclose(flush=self.ready)
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await self._scheduler.aclose()
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+        if self.journal is not None:
+            await self._local(self.journal.close)
+        self._local_executor.shutdown(wait=True)
+
+    # -------- Journal --------
+
+    async def replay_journal(self) -> int:
+        """
+        Open the journal and re-apply every mutation it has not seen
+        acknowledged. Call once at startup, before handlers run.
+        """
+        if self.journal is None:
+            return 0
+
+        entries = await self._local(self.journal.open)
+        for entry in entries:
+            self._apply(entry["seq"], entry["op"], entry["args"])
+        if entries:
+            logger.warning("Replaying %d unacknowledged Sheets writes from journal", len(entries))
+        return len(entries)
+
+    async def _local(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._local_executor, fn, *args)
+
+    async def _submit(self, op: str, args: Dict[str, Any]) -> None:
+        """
+        Record a mutation durably, then hand it to the background appliers.
+        """
+        seq = await self._local(self._record, op, args)
+        self._apply(seq, op, args)
+
+    def _record(self, op: str, args: Dict[str, Any]) -> Optional[int]:
+        # runs on the local executor
+        if self.primary is not None:
+            try:
+                getattr(self.primary, _PRIMARY_OPS[op])(**args)
+            except Exception:
+                logger.exception("Primary store failed to apply %s", op)
+
+        if self.journal is None:
+            return None
+        try:
+            return self.journal.append(op, args)
+        except Exception:
+            logger.exception("Failed to journal %s; applying without journal", op)
+            return None
+
+    def _apply(self, seq: Optional[int], op: str, args: Dict[str, Any]) -> None:
+        if op == "close_sos_session":
+            self._pending_closes.add(args["event_id"])
+            self._spawn(self._apply_with_retry(seq, self._close_sos_session, args))
+            return
+        if op == "expire_sos_sessions":
+            self._pending_closes.update(args["event_ids"])
+            self._spawn(self._apply_with_retry(seq, self._expire_sos_sessions, args))
+            return
+        if op == "update_registration_row":
+            self._spawn(self._apply_with_retry(seq, self._update_registration, args))
+            return
+        if op == "update_registration_location":
+            self._spawn(self._apply_with_retry(seq, self._update_registration_location, args))
+            return
+
+        sheet_name, build_row = _APPEND_OPS[op]
+        self._batcher.add(sheet_name, build_row(**args), seq)
+
+    def _spawn(self, coro: Awaitable[Any]) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _apply_with_retry(
+        self,
+        seq: Optional[int],
+        fn: Callable[..., Awaitable[Any]],
+        args: Dict[str, Any],
+    ) -> None:
+        for attempt, delay in enumerate((0.0,) + tuple(self.retry_delays)):
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                await fn(**args)
+            except Exception:
+                logger.exception(
+                    "Sheets write %s failed (attempt %d)", fn.__name__, attempt + 1
+                )
+                continue
+            await self._ack([seq])
+            return
+        logger.error("Giving up on %s for now; it stays journaled for replay", fn.__name__)
+
+    async def _ack(self, seqs: List[Optional[int]]) -> None:
+        if self.journal is None or not any(s is not None for s in seqs):
+            return
+        try:
+            await self._local(self.journal.ack, seqs)
+        except Exception:
+            logger.exception("Failed to acknowledge journal entries")
+
+    async def _flush_rows(
+        self,
+        sheet_name: str,
+        rows: List[List[str]],
+        seqs: List[Optional[int]],
+    ) -> Optional[str]:
+        updated_range = await self._write(
+            self.writer.append_rows,
+            sheet_name,
+            rows,
+            priority=_APPEND_PRIORITY.get(sheet_name, Priority.NORMAL),
+        )
+        await self._ack(seqs)
+        return updated_range
+
+    async def _close_sos_session(self, event_id: str, closed_by_user_id: int) -> None:
+        await self._ready.wait()
+        # the session row may still be buffered
+        await self._batcher.flush(SOS_SESSIONS)
+        await self._write(
+            self.writer.close_sos_session,
+            event_id,
+            closed_by_user_id,
+            priority=Priority.CRITICAL,
+        )
+        self._pending_closes.discard(event_id)
+
+    async def _expire_sos_sessions(self, event_ids: List[str]) -> None:
+        await self._ready.wait()
+        await self._batcher.flush(SOS_SESSIONS)
+        await self._write(self.writer.expire_sos_sessions, event_ids, priority=Priority.HIGH)
+        self._pending_closes.difference_update(event_ids)
+
+    async def _update_registration(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: Optional[int],
+    ) -> None:
+        await self._ready.wait()
+        # the user's first row may still be buffered
+        await self._batcher.flush(REGISTRATIONS)
+        await self._write(
+            self.writer.update_registration_row,
+            user_id,
+            username,
+            first_name,
+            last_name,
+            chat_id,
+            priority=Priority.LOW,
+        )
+
+    async def _update_registration_location(
+        self, user_id: int, latitude: float, longitude: float
+    ) -> None:
+        await self._ready.wait()
+        # the registration row may still be buffered
+        await self._batcher.flush(REGISTRATIONS)
+        await self._write(
+            self.writer.update_registration_location,
+            user_id,
+            latitude,
+            longitude,
+            priority=Priority.LOW,
+        )
+
+    # -------- Registration --------
+
+    async def append_registration_row(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: int,
+    ) -> None:
+        logger.debug("Queue registration row for user_id=%s", user_id)
+        await self._submit(
+            "append_registration_row",
+            {
+                "user_id": user_id,
+                "username": username,
+                "first_name": first_name,
+                "last_name": last_name,
+                "chat_id": chat_id,
+            },
+        )
+
+    async def update_registration_row(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: Optional[int],
+    ) -> None:
+        """
+        Targeted rewrite of the user's row (appended if missing).
+        """
+        logger.debug("Queue registration update for user_id=%s", user_id)
+        await self._submit(
+            "update_registration_row",
+            {
+                "user_id": user_id,
+                "username": username,
+                "first_name": first_name,
+                "last_name": last_name,
+                "chat_id": chat_id,
+            },
+        )
+
+    async def update_registration_location(
+        self, user_id: int, latitude: float, longitude: float
+    ) -> None:
+        logger.debug("Queue location update for user_id=%s", user_id)
+        await self._submit(
+            "update_registration_location",
+            {"user_id": user_id, "latitude": latitude, "longitude": longitude},
+        )
+
+    async def get_all_registrations(self) -> Dict[int, Dict[str, Any]]:
+        # until seeded, the local store only has users seen since it was created
+        if self.primary is not None and await self._local(self.primary.is_seeded, "registrations"):
+            return await self._local(self.primary.get_all_registrations)
+        return await self.run(self.storage.get_all_registrations, priority=Priority.LOW)
+
+    # -------- SOS sessions --------
+
+    async def log_new_sos_session(
+        self,
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+    ) -> None:
+        logger.info(
+            "Queue new SOS session event_id=%s chat_id=%s requester=%s",
+            event_id,
+            chat_id,
+            requester_user_id,
+        )
+        # journal entries written before message_id existed replay without it
+        await self._submit(
+            "log_new_sos_session",
+            {
+                "event_id": event_id,
+                "chat_id": chat_id,
+                "requester_user_id": requester_user_id,
+                "message_id": message_id,
+            },
+        )
+
+    async def close_sos_session(self, event_id: str, closed_by_user_id: int) -> None:
+        logger.info("Queue close of SOS session event_id=%s closed_by=%s", event_id, closed_by_user_id)
+        await self._submit(
+            "close_sos_session",
+            {"event_id": event_id, "closed_by_user_id": closed_by_user_id},
+        )
+
+    async def expire_sos_sessions(self, event_ids: List[str]) -> None:
+        """
+        Sessions closed by TTL: one journal entry, one sheet write.
+        """
+        logger.info("Queue expiry of %d SOS sessions", len(event_ids))
+        await self._submit("expire_sos_sessions", {"event_ids": list(event_ids)})
+
+    async def get_active_sos_sessions(self) -> List[Dict[str, Any]]:
+        if self.primary is not None:
+            return await self._local(self.primary.get_active_sos_sessions)
+        sessions = await self.run(self.storage.get_active_sos_sessions, priority=Priority.CRITICAL)
+        return [s for s in sessions if s["event_id"] not in self._pending_closes]
+
+    async def compact_sessions(self) -> Dict[str, int]:
+        """
+        Archive finished sessions out of the live worksheets. Buffered rows
+        are flushed first, so helpers / resource requests of a finished
+        session are archived with it instead of being left behind.
+        """
+        await self._ready.wait()
+        await self._batcher.flush()
+        return await self._write(self.storage.compact_closed_sessions, priority=Priority.LOW)
+
+    # -------- Resource requests --------
+
+    async def log_resource_request(
+        self, event_id: str, user_id: int, resource_type: str, count: int = 1
+    ) -> None:
+        logger.info(
+            "Queue resource request: event_id=%s user_id=%s type=%s count=%s",
+            event_id,
+            user_id,
+            resource_type,
+            count,
+        )
+        await self._submit(
+            "log_resource_request",
+            {
+                "event_id": event_id,
+                "user_id": user_id,
+                "resource_type": resource_type,
+                "count": count,
+            },
+        )
+
+    # -------- Helpers --------
+
+    async def log_helper_optin(self, event_id: str, helper_user_id: int) -> None:
+        logger.info("Queue helper opt-in: event_id=%s helper=%s", event_id, helper_user_id)
+        await self._submit(
+            "log_helper_optin",
+            {"event_id": event_id, "helper_user_id": helper_user_id},
+        )
+
+    # -------- Medical info --------
+
+    async def get_user_medical_info(self, user_id: int) -> Optional[Dict[str, Any]]:
+        if self.primary is not None:
+            return await self._local(self.primary.get_user_medical_info, user_id)
+        return await self.run(self.storage.get_user_medical_info, user_id, priority=Priority.HIGH)
+
+    async def get_all_medical_info(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Medical rows are maintained by coordinators in Sheets, so this always
+        reads the sheet and refreshes the primary's copy.
+        """
+        all_info = await self.run(self.storage.get_all_medical_info, priority=Priority.LOW)
+        replace = getattr(self.primary, "replace_medical_info", None)
+        if replace is not None:
+            await self._local(replace, all_info)
+        return all_info
@@ -0,0 +1,66 @@
+from typing import Any, Dict, List, Optional, Protocol
+
+
+class StorageBackend(Protocol):
+    """
+    Operations SheetWriter / handlers need from a store.
+    Implemented by SheetStorage (Google Sheets) and SQLiteStorage (local).
+    """
+
+    # -------- Registrations --------
+
+    def append_registration(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: int,
+    ) -> None: ...
+
+    def update_registration(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: Optional[int],
+    ) -> None: ...
+
+    def update_registration_location(
+        self, user_id: int, latitude: float, longitude: float
+    ) -> None: ...
+
+    def get_all_registrations(self) -> Dict[int, Dict[str, Any]]: ...
+
+    # -------- SOS sessions --------
+
+    def log_new_sos_session(
+        self,
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+    ) -> None: ...
+
+    def close_sos_session(self, event_id: str, closed_by_user_id: int) -> None: ...
+
+    def expire_sos_sessions(self, event_ids: List[str]) -> None: ...
+
+    def get_active_sos_sessions(self) -> List[Dict[str, Any]]: ...
+
+    # -------- Resource requests --------
+
+    def log_resource_request(
+        self, event_id: str, user_id: int, resource_type: str, count: int = 1
+    ) -> None: ...
+
+    # -------- Helpers --------
+
+    def log_helper_optin(self, event_id: str, helper_user_id: int) -> None: ...
+
+    # -------- Medical info --------
+
+    def get_user_medical_info(self, user_id: int) -> Optional[Dict[str, Any]]: ...
+
+    def get_all_medical_info(self) -> Dict[int, Dict[str, Any]]: ...
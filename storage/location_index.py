@@ -0,0 +1,164 @@
+import heapq
+import logging
+import math
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+Cell = Tuple[int, int]
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle (haversine) distance.
+    """
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_location(latitude: Any, longitude: Any) -> bool:
+    try:
+        return -90.0 <= float(latitude) <= 90.0 and -180.0 <= float(longitude) <= 180.0
+    except (TypeError, ValueError):
+        return False
+
+
+class LocationIndex:
+    """
+    Last shared location of each registered user on a uniform lat/lon grid
+    (cells of `cell_km` degrees-equivalent), for "who is close to this SOS".
+
+    nearest() scans rings of cells outwards from the SOS and stops as soon
+    as no unscanned cell can hold anyone closer than the k-th match, or
+    everything within `max_km` has been seen. With users spread over a
+    city that touches a handful of cells, whatever the total count.
+    """
+
+    def __init__(self, cell_km: float = 1.0, max_km: float = 25.0, k: int = 10) -> None:
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self.cell_km = cell_km
+        self.max_km = max_km
+        self.k = k
+        # cell -> user_id -> (lat, lon)
+        self._cells: Dict[Cell, Dict[int, Tuple[float, float]]] = {}
+        self._users: Dict[int, Tuple[float, float, Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._users
+
+    def _cell(self, latitude: float, longitude: float) -> Cell:
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def get(self, user_id: int) -> Optional[Tuple[float, float]]:
+        entry = self._users.get(user_id)
+        return None if entry is None else (entry[0], entry[1])
+
+    def update(self, user_id: int, latitude: float, longitude: float) -> None:
+        self.remove(user_id)
+        cell = self._cell(latitude, longitude)
+        self._users[user_id] = (latitude, longitude, cell)
+        self._cells.setdefault(cell, {})[user_id] = (latitude, longitude)
+
+    def remove(self, user_id: int) -> None:
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return
+        members = self._cells.get(entry[2])
+        if members is not None:
+            members.pop(user_id, None)
+            if not members:
+                del self._cells[entry[2]]
+
+    def load(self, registrations: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Merge locations from a bulk registrations read. Locations shared
+        while the read was in flight are newer and kept.
+        """
+        loaded = 0
+        for user_id, profile in registrations.items():
+            latitude, longitude = profile.get("latitude"), profile.get("longitude")
+            if user_id in self._users or not valid_location(latitude, longitude):
+                continue
+            self.update(user_id, float(latitude), float(longitude))
+            loaded += 1
+        logger.info("Location index loaded: %d users (%d cells)", loaded, len(self._cells))
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: Optional[int] = None,
+        max_km: Optional[float] = None,
+        exclude: Collection[int] = (),
+    ) -> List[Tuple[int, float]]:
+        """
+        Up to k (user_id, distance_km) within max_km, closest first.
+        """
+        k = self.k if k is None else k
+        max_km = self.max_km if max_km is None else max_km
+        if k <= 0 or not self._users:
+            return []
+
+        cx, cy = self._cell(latitude, longitude)
+        # longitude cells shrink towards the poles: more rings to cover max_km
+        shrink = math.cos(math.radians(min(89.0, abs(latitude) + max_km / KM_PER_DEGREE)))
+        last_ring = math.ceil(max_km / (self.cell_km * max(shrink, 0.05)))
+        # candidates are ranked by squared equirectangular distance in
+        # degrees (no trig per user; exact enough within max_km), and only
+        # the k results get a haversine distance
+        x_scale = math.cos(math.radians(latitude))
+        limit = (max_km / KM_PER_DEGREE) ** 2
+        empty: Dict[int, Tuple[float, float]] = {}
+        # k best so far as a max-heap of (-squared distance, user_id)
+        best: List[Tuple[float, int]] = []
+        ring = 0
+        while True:
+            for cell in self._ring(cx, cy, ring):
+                for user_id, (lat, lon) in self._cells.get(cell, empty).items():
+                    dy = lat - latitude
+                    dx = (lon - longitude) * x_scale
+                    d2 = dx * dx + dy * dy
+                    if d2 > limit or user_id in exclude:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, user_id))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, user_id))
+
+            # anyone outside rings 0..ring is at least this far away
+            edge_lat = min(89.9, abs(latitude) + (ring + 1) * self.cell_deg)
+            reach = ring * self.cell_km * math.cos(math.radians(edge_lat))
+            if reach >= max_km or ring >= last_ring:
+                break
+            if len(best) == k and (reach / KM_PER_DEGREE) ** 2 >= -best[0][0]:
+                break
+            ring += 1
+
+        ranked = sorted(best, reverse=True)
+        results = []
+        for _, user_id in ranked:
+            lat, lon, _ = self._users[user_id]
+            results.append((user_id, distance_km(latitude, longitude, lat, lon)))
+        return results
+
+    @staticmethod
+    def _ring(cx: int, cy: int, ring: int) -> List[Cell]:
+        if ring == 0:
+            return [(cx, cy)]
+        cells = []
+        for dx in range(-ring, ring + 1):
+            cells.append((cx + dx, cy - ring))
+            cells.append((cx + dx, cy + ring))
+        for dy in range(-ring + 1, ring):
+            cells.append((cx - ring, cy + dy))
+            cells.append((cx + ring, cy + dy))
+        return cells
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+MedicalInfo = Dict[str, Any]
+
+
+class MedicalIndex:
+    """
+    In-memory user_id -> medical info map.
+
+    Built from one bulk read of the medical worksheet and refreshed in the
+    background every `ttl` seconds, so a lookup is a dict hit instead of a
+    full-sheet download per "کمک می‌کنم".
+
+    At most `max_users` users are kept (LRU). Once the sheet outgrows the cap,
+    misses fall back to a single-user read. invalidate() is the explicit hook
+    for when a user's medical rows are known to have changed.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[Dict[int, MedicalInfo]]],
+        fallback: Callable[[int], Awaitable[Optional[MedicalInfo]]],
+        ttl: float = 300.0,
+        max_users: int = 50_000,
+    ) -> None:
+        self._loader = loader
+        self._fallback = fallback
+        self.ttl = ttl
+        self.max_users = max_users
+
+        self._entries: "OrderedDict[int, MedicalInfo]" = OrderedDict()
+        self._stale: Set[int] = set()
+        self._loaded = False
+        self._complete = False  # True when every user of the sheet fits in memory
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, user_id: int) -> Optional[MedicalInfo]:
+        info = self._entries.get(user_id)
+        if info is not None:
+            self._entries.move_to_end(user_id)
+            return info
+
+        if self._loaded and self._complete and user_id not in self._stale:
+            # authoritative miss: nothing registered for this user
+            return None
+
+        info = await self._fallback(user_id)
+        self._stale.discard(user_id)
+        if info:
+            self._put(user_id, info)
+        return info
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """
+        Drop one user (re-read on next lookup) or, with no user_id,
+        trigger an immediate full refresh.
+        """
+        if user_id is None:
+            self._wake.set()
+            return
+        self._entries.pop(user_id, None)
+        self._stale.add(user_id)
+
+    async def refresh(self) -> None:
+        all_info = await self._loader()
+
+        entries: "OrderedDict[int, MedicalInfo]" = OrderedDict()
+        for user_id, info in all_info.items():
+            entries[user_id] = info
+            if len(entries) > self.max_users:
+                entries.popitem(last=False)
+
+        # keep users that were hot before the refresh
+        for user_id in self._entries:
+            if user_id in all_info:
+                entries[user_id] = all_info[user_id]
+                entries.move_to_end(user_id)
+                if len(entries) > self.max_users:
+                    entries.popitem(last=False)
+
+        self._entries = entries
+        self._complete = len(all_info) <= self.max_users
+        self._stale.clear()
+        self._loaded = True
+        logger.info(
+            "Medical index refreshed: %d users indexed (%d in sheet)",
+            len(entries),
+            len(all_info),
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="medical-index-refresh")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh medical index")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.ttl)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _put(self, user_id: int, info: MedicalInfo) -> None:
+        self._entries[user_id] = info
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self._complete = False
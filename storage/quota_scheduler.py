@@ -0,0 +1,213 @@
+import asyncio
+import enum
+import functools
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+WRITE = "write"
+
+# 429 = quota exhausted, 5xx = transient Google backend errors
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class Priority(enum.IntEnum):
+    CRITICAL = 0  # new SOS, closures, rehydration
+    HIGH = 1  # helper opt-ins, medical lookups
+    NORMAL = 2
+    LOW = 3  # registrations, resource logs, bulk refreshes
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` tokens per minute, holding at most `burst`.
+    """
+
+    def __init__(self, per_minute: float, burst: int = 10) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def reserve(self) -> float:
+        """
+        Take a token and return 0, or return how long to wait for one.
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop handing out tokens (server told us the quota is exhausted).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class _Job:
+    __slots__ = ("call", "name", "future", "attempts")
+
+    def __init__(self, call: Callable[[], Any], name: str, future: asyncio.Future) -> None:
+        self.call = call
+        self.name = name
+        self.future = future
+        self.attempts = 0
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    # gspread.exceptions.APIError carries the HTTP response
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+class QuotaScheduler:
+    """
+    Single gate for every Google Sheets call.
+
+    - read and write quotas are enforced with separate token buckets;
+    - queued calls are served by Priority, then FIFO;
+    - 429 / 5xx responses are retried with jittered exponential backoff
+      (a 429 also pauses the whole bucket).
+
+    Calls run on the given executor, at most `max_in_flight` at a time.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        read_per_minute: float = 60.0,
+        write_per_minute: float = 60.0,
+        burst: int = 10,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        base_backoff: float = 1.0,
+        max_backoff: float = 32.0,
+    ) -> None:
+        self._executor = executor
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._buckets = {
+            READ: TokenBucket(read_per_minute, burst),
+            WRITE: TokenBucket(write_per_minute, burst),
+        }
+        self._queues: Dict[str, asyncio.PriorityQueue] = {
+            READ: asyncio.PriorityQueue(),
+            WRITE: asyncio.PriorityQueue(),
+        }
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._seq = itertools.count()
+        self._dispatchers: Set[asyncio.Task] = set()
+        self._running: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._dispatchers:
+            return
+        for kind in (READ, WRITE):
+            self._dispatchers.add(
+                asyncio.create_task(self._dispatch(kind), name=f"sheets-{kind}-dispatcher")
+            )
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        kind: str = READ,
+        priority: Priority = Priority.NORMAL,
+        **kwargs: Any,
+    ) -> asyncio.Future:
+        """
+        Queue a blocking storage call. Cancelling the returned future drops
+        the call if it has not started yet.
+        """
+        job = _Job(
+            call=functools.partial(fn, *args, **kwargs),
+            name=getattr(fn, "__name__", repr(fn)),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._queues[kind].put_nowait((priority, next(self._seq), job))
+        return job.future
+
+    def queue_depth(self, kind: str) -> int:
+        return self._queues[kind].qsize()
+
+    async def aclose(self) -> None:
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, *self._running, return_exceptions=True)
+        self._dispatchers.clear()
+
+        for queue in self._queues.values():
+            while not queue.empty():
+                _, _, job = queue.get_nowait()
+                job.future.cancel()
+
+    # -------- internals --------
+
+    async def _dispatch(self, kind: str) -> None:
+        queue = self._queues[kind]
+        bucket = self._buckets[kind]
+        while True:
+            entry = await queue.get()
+            job: _Job = entry[2]
+            if job.future.done():
+                # caller timed out / cancelled while queued
+                continue
+
+            wait = bucket.reserve()
+            if wait > 0:
+                # put it back so a more urgent call can overtake meanwhile
+                queue.put_nowait(entry)
+                await asyncio.sleep(wait)
+                continue
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._execute(kind, entry))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, kind: str, entry: tuple) -> None:
+        priority, seq, job = entry
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, job.call)
+        except Exception as exc:
+            status = _status_code(exc)
+            if status in _RETRYABLE_STATUS and job.attempts < self.max_retries:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** job.attempts)
+                delay *= random.uniform(0.5, 1.5)
+                job.attempts += 1
+                if status == 429:
+                    self._buckets[kind].pause(delay)
+                logger.warning(
+                    "Sheets %s %s got HTTP %s; retry %d in %.1fs",
+                    kind,
+                    job.name,
+                    status,
+                    job.attempts,
+                    delay,
+                )
+                loop.call_later(delay, self._queues[kind].put_nowait, entry)
+            elif not job.future.done():
+                job.future.set_exception(exc)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._slots.release()
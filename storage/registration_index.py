@@ -0,0 +1,97 @@
+import logging
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# check() results
+NEW = "new"
+CHANGED = "changed"
+KNOWN = "known"
+
+
+def profile_fingerprint(
+    username: Optional[str],
+    first_name: Optional[str],
+    last_name: Optional[str],
+    chat_id: int,
+) -> int:
+    """
+    32-bit checksum of the registration columns, stable across restarts.
+    """
+    raw = "\x1f".join((username or "", first_name or "", last_name or "", str(chat_id)))
+    return zlib.crc32(raw.encode("utf-8"))
+
+
+class RegistrationIndex:
+    """
+    In-memory set of registered user_ids, loaded once from the registrations
+    worksheet, so /start needs no storage round-trip for known users.
+
+    Each user maps to a fingerprint of their profile instead of the profile
+    itself (two ints per user), which is enough to tell "already registered"
+    from "username / name changed". Users who registered from a private chat
+    are also kept as alert recipients (the bot may message them first).
+    """
+
+    def __init__(self) -> None:
+        self._profiles: Dict[int, int] = {}
+        # user_id -> private chat_id
+        self._dm_chats: Dict[int, int] = {}
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._profiles
+
+    def check(self, user_id: int, fingerprint: int) -> str:
+        """
+        NEW / CHANGED / KNOWN for this user and profile.
+        Before load() a user we have not seen is reported as NEW.
+        """
+        known = self._profiles.get(user_id)
+        if known is None:
+            return NEW
+        return KNOWN if known == fingerprint else CHANGED
+
+    def remember(self, user_id: int, fingerprint: int, chat_id: Optional[int] = None) -> None:
+        self._profiles[user_id] = fingerprint
+        if chat_id is not None:
+            self.remember_dm_chat(user_id, chat_id)
+
+    def remember_dm_chat(self, user_id: int, chat_id: int) -> None:
+        if chat_id > 0:
+            self._dm_chats[user_id] = chat_id
+
+    def dm_chat_id(self, user_id: int) -> Optional[int]:
+        return self._dm_chats.get(user_id)
+
+    def dm_chat_ids(self, exclude: Iterable[int] = ()) -> List[int]:
+        """
+        Private chats of registered users, for SOS alerts.
+        """
+        skip = set(exclude)
+        return [chat_id for user_id, chat_id in self._dm_chats.items() if user_id not in skip]
+
+    def load(self, registrations: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Merge a bulk read (user_id -> profile). Users registered while the
+        read was in flight are newer than the sheet and keep their entry.
+        """
+        for user_id, profile in registrations.items():
+            chat_id = profile.get("chat_id", 0)
+            if chat_id > 0:
+                self._dm_chats.setdefault(user_id, chat_id)
+            self._profiles.setdefault(
+                user_id,
+                profile_fingerprint(
+                    profile.get("username"),
+                    profile.get("first_name"),
+                    profile.get("last_name"),
+                    profile.get("chat_id", 0),
+                ),
+            )
+        self.loaded = True
+        logger.info("Registration index loaded: %d users", len(self._profiles))
@@ -1,12 +1,94 @@
+import datetime
 import json
 import logging
-from typing import Dict, Any, List, Optional
+import re
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
 
-import gspread
-from google.oauth2.service_account import Credentials
+from utils.metrics import MeteredProxy
+
+from .location_index import valid_location
 
 logger = logging.getLogger(__name__)
 
+# Logical worksheet names used by batched appends
+REGISTRATIONS = "registrations"
+SOS_SESSIONS = "sos_sessions"
+RESOURCE_REQUESTS = "resource_requests"
+HELPERS = "helpers"
+
+# sos_sessions statuses that end a session; compaction archives these
+FINISHED_STATUSES = ("CLOSED", "EXPIRED")
+
+# Compaction lease, in a spare cell of the sos_sessions header row.
+# Compaction deletes rows, which shifts the rows close / expire address, in
+# every process sharing the spreadsheet:
+# - a compaction writes the lease, waits lease_settle, checks the lease is
+#   still its own and only then reads and deletes rows;
+# - close / expire read the lease together with their row check, wait while
+#   it is held, and send their update within lease_write_window of the read.
+# A write that saw the lease free has therefore landed before any delete.
+LEASE_CELL = "H1"
+_LEASE_COLUMN = 7  # 0-based index of column H
+_LEASE_PREFIX = "compaction"
+
+# gspread versions whose Spreadsheet internals _open_prefetched relies on
+_PREFETCH_GSPREAD = "6.1."
+
+
+class CompactionInProgress(RuntimeError):
+    pass
+
+
+def _lease_expiry(value: str) -> float:
+    """
+    "compaction <owner> <expires>" -> expires (epoch seconds); 0.0 if free.
+    """
+    parts = (value or "").split()
+    if len(parts) != 3 or parts[0] != _LEASE_PREFIX:
+        return 0.0
+    try:
+        return float(parts[2])
+    except ValueError:
+        return 0.0
+
+
+_A1_START_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def _first_row_of_range(a1_range: Optional[str]) -> Optional[int]:
+    """
+    "sos_sessions!A12:D14" -> 12
+    """
+    if not a1_range:
+        return None
+    match = _A1_START_ROW.search(a1_range)
+    return int(match.group(1)) if match else None
+
+
+def _whole_sheet(worksheet: Any) -> str:
+    # A1 notation for every cell of a worksheet
+    return "'{}'".format(worksheet.title.replace("'", "''"))
+
+
+def _row_runs(row_numbers: List[int]) -> List[range]:
+    """
+    [2, 3, 4, 7, 9, 10] -> [range(2, 5), range(7, 8), range(9, 11)]
+    """
+    runs: List[range] = []
+    start = prev = None
+    for number in sorted(row_numbers):
+        if prev is not None and number == prev + 1:
+            prev = number
+            continue
+        if start is not None:
+            runs.append(range(start, prev + 1))
+        start = prev = number
+    if start is not None:
+        runs.append(range(start, prev + 1))
+    return runs
+
 
 class SheetStorage:
     """
@@ -18,6 +100,12 @@ class SheetStorage:
     - medical_info (optional)
     """
 
+    # compaction lease timings (seconds), see LEASE_CELL
+    lease_ttl = 300.0
+    lease_settle = 30.0
+    lease_write_window = 10.0
+    lease_poll = 2.0
+
     def __init__(
         self,
         sheet_id: str,
@@ -29,8 +117,38 @@ class SheetStorage:
         medical_sheet_name: str = "medical",
     ) -> None:
         self.sheet_id = sheet_id
+        self._credentials_json = credentials_json
+        self._sheet_names = {
+            "registrations": registrations_sheet_name,
+            "sos_sessions": sos_sessions_sheet_name,
+            "resource_requests": resource_requests_sheet_name,
+            "helpers": helpers_sheet_name,
+            "medical": medical_sheet_name,
+        }
+        self._file = None
+
+        # event_id -> sheet row in sos_sessions (1-based, header is row 1)
+        self._session_rows: Dict[str, int] = {}
+        # user_id -> sheet row in registrations (latest row per user)
+        self._registration_rows: Dict[int, int] = {}
 
-        creds_info = json.loads(credentials_json)
+    @property
+    def is_connected(self) -> bool:
+        return self._file is not None
+
+    def connect(self) -> None:
+        """
+        Authorize and resolve all worksheets. Blocking network I/O: run it off
+        the event loop. The Google client libraries are imported here so that
+        process start does not pay for them.
+        """
+        if self.is_connected:
+            # already attached (e.g. to a local emulator)
+            return
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        creds_info = json.loads(self._credentials_json)
         scopes = [
             "https://www.googleapis.com/auth/spreadsheets",
             "https://www.googleapis.com/auth/drive",
@@ -38,15 +156,79 @@ class SheetStorage:
         creds = Credentials.from_service_account_info(creds_info, scopes=scopes)
         client = gspread.authorize(creds)
 
-        self._file = client.open_by_key(sheet_id)
+        if gspread.__version__.startswith(_PREFETCH_GSPREAD):
+            spreadsheet, worksheets = self._open_prefetched(gspread, client)
+        else:
+            # other gspread versions: public API, one extra metadata fetch
+            spreadsheet, worksheets = client.open_by_key(self.sheet_id), None
+
+        self._attach(spreadsheet, worksheets)
+        logger.info("SheetStorage connected to sheet_id=%s", self.sheet_id)
+
+    def _open_prefetched(self, gspread: Any, client: Any) -> Tuple[Any, List[Any]]:
+        """
+        client.open_by_key() fetches the metadata in Spreadsheet.__init__
+        and worksheets() fetches it again: build both from one response.
+        Relies on gspread 6.1 internals (Spreadsheet.client / _properties),
+        hence the version check in connect().
+        """
+        http_client = client.http_client
+        metadata = http_client.fetch_sheet_metadata(self.sheet_id)
+        spreadsheet = gspread.Spreadsheet.__new__(gspread.Spreadsheet)
+        spreadsheet.client = http_client
+        spreadsheet._properties = {"id": self.sheet_id, **metadata["properties"]}
+        worksheets = [
+            gspread.Worksheet(spreadsheet, sheet["properties"], self.sheet_id, http_client)
+            for sheet in metadata["sheets"]
+        ]
+        return spreadsheet, worksheets
+
+    def _attach(self, spreadsheet: Any, worksheets: Optional[List[Any]] = None) -> None:
+        # one metadata fetch resolves every worksheet (instead of one per name)
+        if worksheets is None:
+            worksheets = spreadsheet.worksheets()
+        by_title = {ws.title: ws for ws in worksheets}
+        missing = [name for name in self._sheet_names.values() if name not in by_title]
+        if missing:
+            raise RuntimeError(f"Worksheets not found in spreadsheet: {', '.join(missing)}")
 
-        self._registrations = self._file.worksheet(registrations_sheet_name)
-        self._sos_sessions = self._file.worksheet(sos_sessions_sheet_name)
-        self._resource_requests = self._file.worksheet(resource_requests_sheet_name)
-        self._helpers = self._file.worksheet(helpers_sheet_name)
-        self._medical = self._file.worksheet(medical_sheet_name)
+        # every API call is counted and timed per (worksheet, op)
+        def metered(key: str) -> Any:
+            return MeteredProxy(by_title[self._sheet_names[key]], key)
 
-        logger.info("SheetStorage initialized with sheet_id=%s", sheet_id)
+        self._registrations = metered("registrations")
+        self._sos_sessions = metered("sos_sessions")
+        self._resource_requests = metered("resource_requests")
+        self._helpers = metered("helpers")
+        self._medical = metered("medical")
+
+        # logical name -> worksheet, for batched appends
+        self._append_targets = {
+            REGISTRATIONS: self._registrations,
+            SOS_SESSIONS: self._sos_sessions,
+            RESOURCE_REQUESTS: self._resource_requests,
+            HELPERS: self._helpers,
+        }
+        self._file = MeteredProxy(spreadsheet, "spreadsheet")
+
+    # -------- Batched appends --------
+
+    def append_rows(self, sheet_name: str, rows: List[List[str]]) -> Optional[str]:
+        """
+        Append many rows to one worksheet with a single API call.
+        Returns the updated A1 range reported by Sheets (if any).
+        """
+        if not rows:
+            return None
+        worksheet = self._append_targets[sheet_name]
+        response = worksheet.append_rows(rows, value_input_option="USER_ENTERED")
+        updated_range = (response or {}).get("updates", {}).get("updatedRange")
+
+        if sheet_name == SOS_SESSIONS:
+            self._index_appended_sessions(rows, updated_range)
+        elif sheet_name == REGISTRATIONS:
+            self._index_appended_registrations(rows, updated_range)
+        return updated_range
 
     # -------- Registrations --------
 
@@ -58,112 +240,538 @@ class SheetStorage:
         last_name: Optional[str],
         chat_id: int,
     ) -> None:
-        row = [
+        row = self.registration_row(user_id, username, first_name, last_name, chat_id)
+        response = self._registrations.append_row(row, value_input_option="USER_ENTERED")
+        updated_range = (response or {}).get("updates", {}).get("updatedRange")
+        self._index_appended_registrations([row], updated_range)
+
+    def update_registration(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: Optional[int],
+    ) -> None:
+        """
+        Rewrite the user's registration row in place (profile changed).
+        Same lookup strategy as close_sos_session; appends if the user has
+        no row yet, so it is also a safe upsert. chat_id None keeps the
+        stored one (0 on a new row).
+        """
+        key = str(user_id)
+        row_number = self._registration_rows.get(user_id)
+        if row_number is None or self._registrations.acell(f"A{row_number}").value != key:
+            self.load_registration_index()
+            row_number = self._registration_rows.get(user_id)
+            if row_number is None:
+                self.append_registration(user_id, username, first_name, last_name, chat_id or 0)
+                return
+
+        row = self.registration_row(user_id, username, first_name, last_name, chat_id or 0)
+        # Assume columns: user_id | username | first_name | last_name | chat_id
+        last_column = "E" if chat_id is not None else "D"
+        self._registrations.update(
+            f"B{row_number}:{last_column}{row_number}",
+            [row[1:5] if chat_id is not None else row[1:4]],
+            value_input_option="USER_ENTERED",
+        )
+
+    def update_registration_location(self, user_id: int, latitude: float, longitude: float) -> None:
+        """
+        Store the user's shared location next to their registration.
+        Same row lookup as update_registration; skipped if the user has no row.
+        """
+        row_number = self._registration_rows.get(user_id)
+        if row_number is None or self._registrations.acell(f"A{row_number}").value != str(user_id):
+            self.load_registration_index()
+            row_number = self._registration_rows.get(user_id)
+            if row_number is None:
+                logger.warning("user_id=%s not registered in sheet; location skipped", user_id)
+                return
+
+        # Columns after chat_id: latitude | longitude
+        self._registrations.update(
+            f"F{row_number}:G{row_number}",
+            [[f"{latitude:.6f}", f"{longitude:.6f}"]],
+            value_input_option="RAW",
+        )
+
+    def get_all_registrations(self) -> Dict[int, Dict[str, Any]]:
+        """
+        One bulk read of the registrations worksheet: user_id -> profile.
+        If a user has several rows (older duplicates), the last one wins.
+        """
+        values = self._registrations.get_all_values()
+
+        res: Dict[int, Dict[str, Any]] = {}
+        rows: Dict[int, int] = {}
+        for idx, row in enumerate(values[1:], start=2):
+            if len(row) < 5:
+                continue
+            try:
+                user_id = int(row[0])
+                chat_id = int(row[4])
+            except ValueError:
+                continue
+            res[user_id] = {
+                "username": row[1],
+                "first_name": row[2],
+                "last_name": row[3],
+                "chat_id": chat_id,
+            }
+            if len(row) >= 7 and valid_location(row[5], row[6]):
+                res[user_id]["latitude"] = float(row[5])
+                res[user_id]["longitude"] = float(row[6])
+            rows[user_id] = idx
+
+        # full read anyway – refresh the row index for free
+        self._registration_rows = rows
+        return res
+
+    def load_registration_index(self) -> int:
+        """
+        (Re)build the user_id -> row index from column A. Returns its size.
+        """
+        user_ids = self._registrations.col_values(1)
+        rows: Dict[int, int] = {}
+        for idx, value in enumerate(user_ids[1:], start=2):
+            try:
+                rows[int(value)] = idx
+            except ValueError:
+                continue
+        self._registration_rows = rows
+        return len(rows)
+
+    def _index_appended_registrations(
+        self,
+        rows: List[List[str]],
+        updated_range: Optional[str],
+    ) -> None:
+        first_row = _first_row_of_range(updated_range)
+        if first_row is None:
+            return
+        for offset, row in enumerate(rows):
+            self._registration_rows[int(row[0])] = first_row + offset
+
+    @staticmethod
+    def registration_row(
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: int,
+    ) -> List[str]:
+        return [
             str(user_id),
             username or "",
             first_name or "",
             last_name or "",
             str(chat_id),
         ]
-        self._registrations.append_row(row, value_input_option="USER_ENTERED")
 
     # -------- SOS sessions --------
 
-    def log_new_sos_session(self, event_id: int, chat_id: int, requester_user_id: int) -> None:
-        row = [
+    def log_new_sos_session(
+        self,
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+    ) -> None:
+        row = self.sos_session_row(event_id, chat_id, requester_user_id, message_id)
+        response = self._sos_sessions.append_row(row, value_input_option="USER_ENTERED")
+        updated_range = (response or {}).get("updates", {}).get("updatedRange")
+        self._index_appended_sessions([row], updated_range)
+
+    @staticmethod
+    def sos_session_row(
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+    ) -> List[str]:
+        # columns: event_id | chat_id | requester_user_id | status | closed_by | message_id
+        return [
             str(event_id),
             str(chat_id),
             str(requester_user_id),
             "ACTIVE",
+            "",
+            "" if message_id is None else str(message_id),
         ]
-        self._sos_sessions.append_row(row, value_input_option="USER_ENTERED")
 
-    def close_sos_session(self, event_id: int, closed_by_user_id: int) -> None:
+    def close_sos_session(self, event_id: str, closed_by_user_id: int) -> None:
         """
         Mark session as CLOSED in the sheet.
+        Uses the event_id -> row index, so this is one check of the row's
+        event_id cell (read together with the compaction lease) plus one
+        targeted update however long the sheet is. The index is rebuilt
+        from column A only if the indexed row no longer holds this event.
         """
-        values = self._sos_sessions.get_all_values()
-        if not values:
-            return
+        key = str(event_id)
+        for _ in range(3):
+            row_number = self._session_rows.get(key)
+            if row_number is None:
+                self.load_session_index()
+                row_number = self._session_rows.get(key)
+                if row_number is None:
+                    logger.warning("SOS event_id=%s not found in sheet; close skipped", event_id)
+                    return
 
-        header = values[0]
-        rows = values[1:]
+            (found,), read_at = self._read_session_cells([f"A{row_number}"])
+            if found != key:
+                # rows moved (e.g. by a compaction): rebuild the index
+                self._session_rows.pop(key, None)
+                continue
+            if time.monotonic() - read_at > self.lease_write_window:
+                continue
 
-        # Assume columns: event_id | chat_id | requester_user_id | status | closed_by
-        for idx, row in enumerate(rows, start=2):
-            if not row or len(row) < 1:
-                continue
-            if row[0] == str(event_id):
-                # status
-                if len(row) < 4:
-                    row += [""] * (4 - len(row))
-                row[3] = "CLOSED"
-
-                if len(row) < 5:
-                    row.append(str(closed_by_user_id))
-                else:
-                    row[4] = str(closed_by_user_id)
-
-                self._sos_sessions.update(
-                    f"A{idx}:E{idx}",
-                    [row],
-                    value_input_option="USER_ENTERED",
-                )
+            # Assume columns: event_id | chat_id | requester_user_id | status | closed_by
+            self._sos_sessions.update(
+                f"D{row_number}:E{row_number}",
+                [["CLOSED", str(closed_by_user_id)]],
+                value_input_option="USER_ENTERED",
+            )
+            return
+        raise RuntimeError(f"Sheet row of SOS event_id={event_id} keeps moving; close not written")
+
+    def expire_sos_sessions(self, event_ids: List[str]) -> None:
+        """
+        Mark many sessions EXPIRED with one batch_update. The indexed rows
+        are checked with one batch_get of their event_id cells (and the
+        compaction lease); if any is stale the index is rebuilt from
+        column A and the check repeated.
+        """
+        keys = [str(e) for e in event_ids]
+        for _ in range(3):
+            rows = {key: self._session_rows.get(key) for key in keys}
+            if any(row is None for row in rows.values()):
+                self.load_session_index()
+                rows = {key: self._session_rows.get(key) for key in keys}
+            found = [key for key, row in rows.items() if row is not None]
+            if not found:
                 break
 
+            values, read_at = self._read_session_cells([f"A{rows[key]}" for key in found])
+            if any(value != key for value, key in zip(values, found)):
+                # rows moved (e.g. by a compaction): rebuild the index
+                self._session_rows = {}
+                continue
+            if time.monotonic() - read_at > self.lease_write_window:
+                continue
+
+            # Assume columns: event_id | chat_id | requester_user_id | status | closed_by
+            self._sos_sessions.batch_update(
+                [{"range": f"D{rows[key]}:E{rows[key]}", "values": [["EXPIRED", ""]]} for key in found],
+                value_input_option="USER_ENTERED",
+            )
+            break
+        else:
+            raise RuntimeError("Sheet rows of expired SOS sessions keep moving; expiry not written")
+
+        missing = [key for key in keys if self._session_rows.get(key) is None]
+        if missing:
+            logger.warning("SOS event_ids not found in sheet; expiry skipped: %s", missing)
+
+    def _read_session_cells(self, cells: List[str]) -> Tuple[List[str], float]:
+        """
+        Read single sos_sessions cells together with the compaction lease,
+        in one call, waiting while a compaction (in any process) holds the
+        lease. Returns the values and the monotonic time the read started:
+        a row-addressed write must be sent within lease_write_window of it.
+        """
+        while True:
+            read_at = time.monotonic()
+            values = [
+                value[0][0] if value and value[0] else ""
+                for value in self._sos_sessions.batch_get(cells + [LEASE_CELL])
+            ]
+            wait = _lease_expiry(values[-1]) - time.time()
+            if wait <= 0:
+                return values[:-1], read_at
+            logger.info("Sheets compaction in progress; session write waits up to %.0fs", wait)
+            time.sleep(min(self.lease_poll, wait))
+
+    def load_session_index(self) -> int:
+        """
+        (Re)build the event_id -> row index from column A. Returns its size.
+        """
+        event_ids = self._sos_sessions.col_values(1)
+        self._session_rows = {
+            value: idx for idx, value in enumerate(event_ids[1:], start=2) if value
+        }
+        return len(self._session_rows)
+
+    def _index_appended_sessions(self, rows: List[List[str]], updated_range: Optional[str]) -> None:
+        first_row = _first_row_of_range(updated_range)
+        if first_row is None:
+            # unknown position – the next close falls back to a column scan
+            return
+        for offset, row in enumerate(rows):
+            self._session_rows[row[0]] = first_row + offset
+
     def get_active_sos_sessions(self) -> List[Dict[str, Any]]:
         """
-        Read active sessions for rehydration. Minimal implementation.
+        Read active sessions for rehydration, with their helpers and resource
+        request tallies. sos_sessions, helpers and resource_requests are
+        fetched with one batch_get and joined in memory.
         """
-        values = self._sos_sessions.get_all_values()
-        if not values:
-            return []
+        started = time.monotonic()
+        ranges = [
+            _whole_sheet(self._sos_sessions),
+            _whole_sheet(self._helpers),
+            _whole_sheet(self._resource_requests),
+        ]
+        response = self._file.values_batch_get(ranges)
+        session_values, helper_values, resource_values = (
+            vr.get("values", []) for vr in response.get("valueRanges", [])
+        )
 
-        header = values[0]
-        rows = values[1:]
+        # Assume header rows on every worksheet
+        sessions = session_values[1:]
+        helper_rows = helper_values[1:]
+        resource_rows = resource_values[1:]
 
-        res: List[Dict[str, Any]] = []
-        for row in rows:
+        # full read anyway – refresh the row index for free
+        self._session_rows = {
+            row[0]: idx for idx, row in enumerate(sessions, start=2) if row and row[0]
+        }
+
+        active: Dict[str, Dict[str, Any]] = {}
+        for row in sessions:
             if len(row) < 4:
                 continue
             status = row[3]
             if status != "ACTIVE":
                 continue
+            event_id = row[0]
+            if not event_id:
+                continue
             try:
-                event_id = int(row[0])
                 chat_id = int(row[1])
                 requester_user_id = int(row[2])
+                # legacy rows have no message_id column; their id embeds it
+                message_id = int(row[5]) if len(row) > 5 and row[5] else None
+            except ValueError:
+                continue
+
+            active[event_id] = {
+                "event_id": event_id,
+                "chat_id": chat_id,
+                "requester_user_id": requester_user_id,
+                "message_id": message_id,
+                "is_active": True,
+                "helpers": [],
+                "resources": {},
+            }
+
+        # helpers: event_id | helper_user_id
+        for row in helper_rows:
+            if len(row) < 2 or row[0] not in active:
+                continue
+            try:
+                helper_id = int(row[1])
             except ValueError:
                 continue
+            helpers = active[row[0]]["helpers"]
+            if helper_id not in helpers:
+                helpers.append(helper_id)
+
+        # resource_requests: event_id | user_id | resource_type | count
+        # (one row per request; count is how many taps it absorbed)
+        for row in resource_rows:
+            if len(row) < 3 or row[0] not in active:
+                continue
+            resources = active[row[0]]["resources"]
+            resources[row[2]] = resources.get(row[2], 0) + 1
+
+        logger.info(
+            "Loaded %d active SOS sessions from %d rows (1 batch_get) in %.2fs",
+            len(active),
+            len(session_values) + len(helper_values) + len(resource_values),
+            time.monotonic() - started,
+        )
+        return list(active.values())
+
+    # -------- Compaction --------
+
+    def compact_closed_sessions(
+        self, archive_date: Optional[datetime.date] = None, dry_run: bool = False
+    ) -> Dict[str, int]:
+        """
+        Move finished sessions (CLOSED / EXPIRED) and their helpers and
+        resource_requests rows into monthly "<worksheet>_archive_YYYY_MM"
+        worksheets, so the live worksheets only hold open work.
+
+        The number of API calls does not depend on how many rows move: one
+        values_batch_get, one append per archive worksheet (plus one
+        add_worksheet the first time in a month), one batch_update that
+        deletes every archived row, one column A read to rebuild the row
+        index, and a few single-cell calls for the lease. Rows are archived
+        before they are deleted: a crash in between leaves duplicates in the
+        archive, never lost rows.
+
+        Runs under the compaction lease (see LEASE_CELL), so it is safe next
+        to running bots and other compactions; raises CompactionInProgress
+        if another one holds it. Blocks for lease_settle seconds first.
+
+        Returns the number of rows archived per logical worksheet.
+        """
+        if dry_run:
+            return self._compaction_plan()[2]
+
+        archive_date = archive_date or datetime.date.today()
+        token = self._acquire_lease()
+        try:
+            values, moves, counts = self._compaction_plan()
+            if not any(counts.values()):
+                return counts
+            live = self._compaction_targets()
 
-            res.append(
+            suffix = archive_date.strftime("%Y_%m")
+            by_title = {ws.title: ws for ws in self._file.worksheets()}
+            for name, numbers in moves.items():
+                if not numbers:
+                    continue
+                rows = values[name]
+                title = f"{live[name].title}_archive_{suffix}"
+                payload = [rows[number - 1] for number in numbers]
+                archive = by_title.get(title)
+                if archive is None:
+                    # the new worksheet starts with the live header row
+                    # (without the lease cell)
+                    payload = [rows[0][:_LEASE_COLUMN]] + payload
+                    width = max(len(row) for row in payload)
+                    archive = self._file.add_worksheet(title=title, rows=1, cols=width)
+                    logger.info("Created archive worksheet %s", title)
+                MeteredProxy(archive, "archive").append_rows(
+                    payload, value_input_option="USER_ENTERED"
+                )
+
+            # the row numbers are only valid while the lease holds
+            current = self._sos_sessions.acell(LEASE_CELL).value or ""
+            if current != token or _lease_expiry(token) - time.time() < self.lease_settle:
+                raise CompactionInProgress(
+                    "Compaction lease lost or about to expire; rows archived but not deleted"
+                )
+
+            # bottom-up within each worksheet, so no deletion shifts a range
+            # still to be deleted; rows appended meanwhile sit below them all
+            requests = [
                 {
-                    "event_id": event_id,
-                    "chat_id": chat_id,
-                    "requester_user_id": requester_user_id,
-                    "is_active": True,
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": live[name].id,
+                            "dimension": "ROWS",
+                            "startIndex": run.start - 1,
+                            "endIndex": run.stop - 1,
+                        }
+                    }
                 }
-            )
-        return res
+                for name, numbers in moves.items()
+                for run in reversed(_row_runs(numbers))
+            ]
+            self._file.batch_update({"requests": requests})
+            self.load_session_index()
+        finally:
+            self._release_lease(token)
+
+        logger.info("Archived finished SOS sessions to *_archive_%s: %s", suffix, counts)
+        return counts
+
+    def _compaction_targets(self) -> Dict[str, Any]:
+        return {
+            SOS_SESSIONS: self._sos_sessions,
+            HELPERS: self._helpers,
+            RESOURCE_REQUESTS: self._resource_requests,
+        }
+
+    def _compaction_plan(self) -> Tuple[Dict[str, List[List[str]]], Dict[str, List[int]], Dict[str, int]]:
+        """
+        One batch read of the live worksheets -> (values, sheet rows to
+        archive per worksheet, their counts).
+        """
+        live = self._compaction_targets()
+        response = self._file.values_batch_get([_whole_sheet(ws) for ws in live.values()])
+        values = dict(
+            zip(live, (vr.get("values", []) for vr in response.get("valueRanges", [])))
+        )
+
+        # Assume columns: event_id | chat_id | requester_user_id | status | closed_by
+        finished = {
+            row[0]
+            for row in values[SOS_SESSIONS][1:]
+            if len(row) >= 4 and row[0] and row[3] in FINISHED_STATUSES
+        }
+        # logical name -> sheet rows (1-based) to archive; every worksheet
+        # has event_id in column A and a header row
+        moves = {
+            name: [idx for idx, row in enumerate(rows[1:], start=2) if row and row[0] in finished]
+            for name, rows in values.items()
+        }
+        return values, moves, {name: len(numbers) for name, numbers in moves.items()}
+
+    def _acquire_lease(self) -> str:
+        """
+        Take the compaction lease and wait lease_settle, so that every
+        row-addressed write that saw it free has landed. Last writer wins:
+        if another compaction took it meanwhile, this one backs off.
+        """
+        while True:
+            read_at = time.monotonic()
+            current = self._sos_sessions.acell(LEASE_CELL).value or ""
+            if _lease_expiry(current) > time.time():
+                raise CompactionInProgress(f"Compaction lease held: {current}")
+            token = f"{_LEASE_PREFIX} {uuid.uuid4().hex[:12]} {time.time() + self.lease_ttl:.0f}"
+            if time.monotonic() - read_at <= self.lease_write_window:
+                break
+        self._sos_sessions.update(LEASE_CELL, [[token]], value_input_option="RAW")
+        time.sleep(self.lease_settle)
+        if (self._sos_sessions.acell(LEASE_CELL).value or "") != token:
+            raise CompactionInProgress("Compaction lease taken by another compaction")
+        return token
+
+    def _release_lease(self, token: str) -> None:
+        try:
+            if (self._sos_sessions.acell(LEASE_CELL).value or "") == token:
+                self._sos_sessions.update(LEASE_CELL, [[""]], value_input_option="RAW")
+        except Exception:
+            # it expires by itself after lease_ttl
+            logger.exception("Failed to release the compaction lease")
 
     # -------- Resource requests --------
 
-    def log_resource_request(self, event_id: int, user_id: int, resource_type: str) -> None:
-        row = [
+    def log_resource_request(
+        self, event_id: str, user_id: int, resource_type: str, count: int = 1
+    ) -> None:
+        row = self.resource_request_row(event_id, user_id, resource_type, count)
+        self._resource_requests.append_row(row, value_input_option="USER_ENTERED")
+
+    @staticmethod
+    def resource_request_row(
+        event_id: str, user_id: int, resource_type: str, count: int = 1
+    ) -> List[str]:
+        # count = taps collapsed into this request
+        return [
             str(event_id),
             str(user_id),
             resource_type,
+            str(count),
         ]
-        self._resource_requests.append_row(row, value_input_option="USER_ENTERED")
 
     # -------- Helpers --------
 
-    def log_helper_optin(self, event_id: int, helper_user_id: int) -> None:
-        row = [
+    def log_helper_optin(self, event_id: str, helper_user_id: int) -> None:
+        row = self.helper_optin_row(event_id, helper_user_id)
+        self._helpers.append_row(row, value_input_option="USER_ENTERED")
+
+    @staticmethod
+    def helper_optin_row(event_id: str, helper_user_id: int) -> List[str]:
+        return [
             str(event_id),
             str(helper_user_id),
         ]
-        self._helpers.append_row(row, value_input_option="USER_ENTERED")
 
     # -------- Medical info --------
 
@@ -175,13 +783,19 @@ class SheetStorage:
         or
         user_id | field1 | field2 | ...
         اینجا ساده: user_id | label | value
+
+        Targeted: column A locates the user's rows, one batch_get fetches
+        only those (MedicalIndex misses must not download the sheet).
         """
-        values = self._medical.get_all_values()
-        if not values:
+        user_ids = self._medical.col_values(1)
+        row_numbers = [idx for idx, value in enumerate(user_ids[1:], start=2) if value == str(user_id)]
+        if not row_numbers:
             return None
 
+        ranges = [f"A{run.start}:C{run.stop - 1}" for run in _row_runs(row_numbers)]
         res: Dict[str, Any] = {}
-        for row in values[1:]:
+        for row in (row for block in self._medical.batch_get(ranges) for row in block):
+            # rows may have moved since column A was read
             if len(row) < 3:
                 continue
             if row[0] != str(user_id):
@@ -191,3 +805,24 @@ class SheetStorage:
             res[label] = value
 
         return res or None
+
+    def get_all_medical_info(self) -> Dict[int, Dict[str, Any]]:
+        """
+        One bulk read of the medical worksheet, grouped by user_id.
+        Same row layout as get_user_medical_info.
+        """
+        values = self._medical.get_all_values()
+
+        res: Dict[int, Dict[str, Any]] = {}
+        for row in values[1:]:
+            if len(row) < 3:
+                continue
+            try:
+                user_id = int(row[0])
+            except ValueError:
+                continue
+            label = row[1] or "field"
+            value = row[2] or ""
+            res.setdefault(user_id, {})[label] = value
+
+        return res
@@ -1,20 +1,27 @@
 import logging
-from typing import Optional
+from typing import List, Optional
 
-from .sheet_storage import SheetStorage
+from .backend import StorageBackend
 
 logger = logging.getLogger(__name__)
 
 
 class SheetWriter:
     """
-    Thin, semantic wrapper over SheetStorage.
+    Thin, semantic wrapper over a StorageBackend (SheetStorage, SQLiteStorage).
     Keeps main.py + handlers decoupled from concrete sheet layout.
     """
 
-    def __init__(self, storage: SheetStorage) -> None:
+    def __init__(self, storage: StorageBackend) -> None:
         self.storage = storage
 
+    # -------- Batched appends --------
+
+    def append_rows(self, sheet_name: str, rows: List[List[str]]) -> Optional[str]:
+        # Sheets-only: used by the write-behind mirror
+        logger.debug("Append %d rows to %s", len(rows), sheet_name)
+        return self.storage.append_rows(sheet_name, rows)
+
     # -------- Registration --------
 
     def append_registration_row(
@@ -34,9 +41,40 @@ class SheetWriter:
             chat_id=chat_id,
         )
 
+    def update_registration_row(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: Optional[int],
+    ) -> None:
+        logger.debug("Update registration row for user_id=%s", user_id)
+        self.storage.update_registration(
+            user_id=user_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            chat_id=chat_id,
+        )
+
+    def update_registration_location(self, user_id: int, latitude: float, longitude: float) -> None:
+        logger.debug("Update location of user_id=%s", user_id)
+        self.storage.update_registration_location(
+            user_id=user_id,
+            latitude=latitude,
+            longitude=longitude,
+        )
+
     # -------- SOS sessions --------
 
-    def log_new_sos_session(self, event_id: int, chat_id: int, requester_user_id: int) -> None:
+    def log_new_sos_session(
+        self,
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+    ) -> None:
         logger.info(
             "Log new SOS session event_id=%s chat_id=%s requester=%s",
             event_id,
@@ -47,27 +85,35 @@ class SheetWriter:
             event_id=event_id,
             chat_id=chat_id,
             requester_user_id=requester_user_id,
+            message_id=message_id,
         )
 
-    def close_sos_session(self, event_id: int, closed_by_user_id: int) -> None:
+    def close_sos_session(self, event_id: str, closed_by_user_id: int) -> None:
         logger.info("Close SOS session event_id=%s closed_by=%s", event_id, closed_by_user_id)
         self.storage.close_sos_session(event_id=event_id, closed_by_user_id=closed_by_user_id)
 
+    def expire_sos_sessions(self, event_ids: List[str]) -> None:
+        logger.info("Expire %d SOS sessions", len(event_ids))
+        self.storage.expire_sos_sessions(event_ids=event_ids)
+
     # -------- Resource requests --------
 
-    def log_resource_request(self, event_id: int, user_id: int, resource_type: str) -> None:
+    def log_resource_request(
+        self, event_id: str, user_id: int, resource_type: str, count: int = 1
+    ) -> None:
         logger.info(
-            "Resource request: event_id=%s user_id=%s type=%s",
+            "Resource request: event_id=%s user_id=%s type=%s count=%s",
             event_id,
             user_id,
             resource_type,
+            count,
         )
         self.storage.log_resource_request(
-            event_id=event_id, user_id=user_id, resource_type=resource_type
+            event_id=event_id, user_id=user_id, resource_type=resource_type, count=count
         )
 
     # -------- Helpers --------
 
-    def log_helper_optin(self, event_id: int, helper_user_id: int) -> None:
+    def log_helper_optin(self, event_id: str, helper_user_id: int) -> None:
         logger.info("Helper opt-in: event_id=%s helper=%s", event_id, helper_user_id)
         self.storage.log_helper_optin(event_id=event_id, helper_user_id=helper_user_id)
@@ -0,0 +1,399 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    user_id     INTEGER PRIMARY KEY,
+    username    TEXT,
+    first_name  TEXT,
+    last_name   TEXT,
+    chat_id     INTEGER NOT NULL,
+    updated_at  REAL NOT NULL,
+    latitude    REAL,
+    longitude   REAL
+);
+
+CREATE TABLE IF NOT EXISTS sos_sessions (
+    event_id           TEXT PRIMARY KEY,
+    chat_id            INTEGER NOT NULL,
+    requester_user_id  INTEGER NOT NULL,
+    status             TEXT NOT NULL,
+    closed_by          INTEGER,
+    created_at         REAL NOT NULL,
+    message_id         INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_sos_sessions_status ON sos_sessions (status);
+
+CREATE TABLE IF NOT EXISTS helpers (
+    event_id        TEXT NOT NULL,
+    helper_user_id  INTEGER NOT NULL,
+    created_at      REAL NOT NULL,
+    PRIMARY KEY (event_id, helper_user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_helpers_user ON helpers (helper_user_id);
+
+CREATE TABLE IF NOT EXISTS resource_requests (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id       TEXT NOT NULL,
+    user_id        INTEGER NOT NULL,
+    resource_type  TEXT NOT NULL,
+    count          INTEGER NOT NULL DEFAULT 1,
+    created_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_resource_requests_event ON resource_requests (event_id);
+
+CREATE TABLE IF NOT EXISTS medical (
+    user_id  INTEGER NOT NULL,
+    label    TEXT NOT NULL,
+    value    TEXT NOT NULL,
+    PRIMARY KEY (user_id, label)
+);
+
+CREATE TABLE IF NOT EXISTS seeded (
+    name       TEXT PRIMARY KEY,
+    seeded_at  REAL NOT NULL
+);
+"""
+
+
+class SQLiteStorage:
+    """
+    Local SQLite implementation of StorageBackend.
+    Used as the primary store; Google Sheets is kept as an async mirror.
+
+    One connection guarded by a lock; safe to call from worker threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+        logger.info("SQLiteStorage initialized at %s", path)
+
+    def _migrate(self) -> None:
+        # databases created before resource_requests.count existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(resource_requests)")}
+        if "count" not in columns:
+            self._conn.execute(
+                "ALTER TABLE resource_requests ADD COLUMN count INTEGER NOT NULL DEFAULT 1"
+            )
+
+        # databases created before shared locations existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(registrations)")}
+        for column in ("latitude", "longitude"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE registrations ADD COLUMN {column} REAL")
+
+        # databases created before event ids stopped embedding the message_id
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sos_sessions)")}
+        if "message_id" not in columns:
+            self._conn.execute("ALTER TABLE sos_sessions ADD COLUMN message_id INTEGER")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # -------- Seeding from Sheets --------
+
+    def is_seeded(self, name: str) -> bool:
+        """
+        True once `name` ("registrations", "sos_sessions") has been copied
+        from the sheet. Rows written locally before that say nothing about
+        whether the table is complete.
+        """
+        return bool(self._query("SELECT 1 FROM seeded WHERE name = ?", (name,)))
+
+    def _seed(self, name: str, statements: List[tuple]) -> None:
+        # all rows and the marker in one transaction: a crash re-seeds from scratch
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, rows in statements:
+                    self._conn.executemany(sql, rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO seeded (name, seeded_at) VALUES (?, ?)", (name, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def seed_registrations(self, registrations: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Copy the sheet's users in. Users already registered locally keep
+        their (newer) row.
+        """
+        now = time.time()
+        rows = [
+            (
+                user_id,
+                reg.get("username") or "",
+                reg.get("first_name") or "",
+                reg.get("last_name") or "",
+                reg["chat_id"],
+                now,
+                reg.get("latitude"),
+                reg.get("longitude"),
+            )
+            for user_id, reg in registrations.items()
+        ]
+        self._seed(
+            "registrations",
+            [
+                (
+                    "INSERT INTO registrations "
+                    "(user_id, username, first_name, last_name, chat_id, updated_at, latitude, longitude) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (user_id) DO NOTHING",
+                    rows,
+                )
+            ],
+        )
+
+    def seed_sos_sessions(self, sessions: List[Dict[str, Any]]) -> None:
+        """
+        Copy the sheet's active sessions in (as returned by
+        get_active_sos_sessions), with their helpers and resource tallies.
+        Sessions already known locally are kept.
+        """
+        now = time.time()
+        known = {row[0] for row in self._query("SELECT event_id FROM sos_sessions")}
+        sessions = [s for s in sessions if s["event_id"] not in known]
+        self._seed(
+            "sos_sessions",
+            [
+                (
+                    "INSERT OR IGNORE INTO sos_sessions "
+                    "(event_id, chat_id, requester_user_id, status, created_at, message_id) "
+                    "VALUES (?, ?, ?, 'ACTIVE', ?, ?)",
+                    [
+                        (
+                            s["event_id"],
+                            s["chat_id"],
+                            s["requester_user_id"],
+                            s.get("created_at") or now,
+                            s.get("message_id"),
+                        )
+                        for s in sessions
+                    ],
+                ),
+                (
+                    "INSERT OR IGNORE INTO helpers (event_id, helper_user_id, created_at) VALUES (?, ?, ?)",
+                    [(s["event_id"], helper_id, now) for s in sessions for helper_id in s.get("helpers", ())],
+                ),
+                (
+                    # a tally counts request rows; who asked is not in the record (user_id 0)
+                    "INSERT INTO resource_requests (event_id, user_id, resource_type, count, created_at) "
+                    "VALUES (?, 0, ?, 1, ?)",
+                    [
+                        (s["event_id"], resource_type, now)
+                        for s in sessions
+                        for resource_type, tally in s.get("resources", {}).items()
+                        for _ in range(tally)
+                    ],
+                ),
+            ],
+        )
+
+    # -------- Registrations --------
+
+    def append_registration(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: int,
+    ) -> None:
+        self._execute(
+            "INSERT INTO registrations (user_id, username, first_name, last_name, chat_id, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, "
+            "first_name = excluded.first_name, last_name = excluded.last_name, "
+            "chat_id = excluded.chat_id, updated_at = excluded.updated_at",
+            (user_id, username or "", first_name or "", last_name or "", chat_id, time.time()),
+        )
+
+    def update_registration(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        chat_id: Optional[int],
+    ) -> None:
+        # one row per user already: the upsert is the update
+        if chat_id is not None:
+            self.append_registration(user_id, username, first_name, last_name, chat_id)
+            return
+        # keep the stored chat_id (0 on a new row)
+        self._execute(
+            "INSERT INTO registrations (user_id, username, first_name, last_name, chat_id, updated_at) "
+            "VALUES (?, ?, ?, ?, 0, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, "
+            "first_name = excluded.first_name, last_name = excluded.last_name, "
+            "updated_at = excluded.updated_at",
+            (user_id, username or "", first_name or "", last_name or "", time.time()),
+        )
+
+    def update_registration_location(self, user_id: int, latitude: float, longitude: float) -> None:
+        self._execute(
+            "UPDATE registrations SET latitude = ?, longitude = ? WHERE user_id = ?",
+            (latitude, longitude, user_id),
+        )
+
+    def get_all_registrations(self) -> Dict[int, Dict[str, Any]]:
+        res: Dict[int, Dict[str, Any]] = {}
+        for user_id, username, first_name, last_name, chat_id, latitude, longitude in self._query(
+            "SELECT user_id, username, first_name, last_name, chat_id, latitude, longitude "
+            "FROM registrations"
+        ):
+            res[user_id] = {
+                "username": username,
+                "first_name": first_name,
+                "last_name": last_name,
+                "chat_id": chat_id,
+            }
+            if latitude is not None and longitude is not None:
+                res[user_id]["latitude"] = latitude
+                res[user_id]["longitude"] = longitude
+        return res
+
+    # -------- SOS sessions --------
+
+    def log_new_sos_session(
+        self,
+        event_id: str,
+        chat_id: int,
+        requester_user_id: int,
+        message_id: Optional[int] = None,
+    ) -> None:
+        self._execute(
+            "INSERT OR IGNORE INTO sos_sessions "
+            "(event_id, chat_id, requester_user_id, status, created_at, message_id) "
+            "VALUES (?, ?, ?, 'ACTIVE', ?, ?)",
+            (event_id, chat_id, requester_user_id, time.time(), message_id),
+        )
+
+    def close_sos_session(self, event_id: str, closed_by_user_id: int) -> None:
+        self._execute(
+            "UPDATE sos_sessions SET status = 'CLOSED', closed_by = ? WHERE event_id = ?",
+            (closed_by_user_id, event_id),
+        )
+
+    def expire_sos_sessions(self, event_ids: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE sos_sessions SET status = 'EXPIRED' WHERE event_id = ? AND status = 'ACTIVE'",
+                [(event_id,) for event_id in event_ids],
+            )
+
+    def get_active_sos_sessions(self) -> List[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT event_id, chat_id, requester_user_id, created_at, message_id FROM sos_sessions "
+            "WHERE status = 'ACTIVE'"
+        )
+        active: Dict[str, Dict[str, Any]] = {
+            event_id: {
+                "event_id": event_id,
+                "chat_id": chat_id,
+                "requester_user_id": requester_user_id,
+                "is_active": True,
+                "created_at": created_at,
+                "message_id": message_id,
+                "helpers": [],
+                "resources": {},
+            }
+            for event_id, chat_id, requester_user_id, created_at, message_id in rows
+        }
+
+        for event_id, helper_user_id in self._query(
+            "SELECT h.event_id, h.helper_user_id FROM helpers h "
+            "JOIN sos_sessions s ON s.event_id = h.event_id "
+            "WHERE s.status = 'ACTIVE' ORDER BY h.created_at"
+        ):
+            active[event_id]["helpers"].append(helper_user_id)
+
+        for event_id, resource_type, count in self._query(
+            "SELECT r.event_id, r.resource_type, COUNT(*) FROM resource_requests r "
+            "JOIN sos_sessions s ON s.event_id = r.event_id "
+            "WHERE s.status = 'ACTIVE' GROUP BY r.event_id, r.resource_type"
+        ):
+            active[event_id]["resources"][resource_type] = count
+
+        return list(active.values())
+
+    # -------- Resource requests --------
+
+    def log_resource_request(
+        self, event_id: str, user_id: int, resource_type: str, count: int = 1
+    ) -> None:
+        self._execute(
+            "INSERT INTO resource_requests (event_id, user_id, resource_type, count, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (event_id, user_id, resource_type, count, time.time()),
+        )
+
+    # -------- Helpers --------
+
+    def log_helper_optin(self, event_id: str, helper_user_id: int) -> None:
+        self._execute(
+            "INSERT OR IGNORE INTO helpers (event_id, helper_user_id, created_at) VALUES (?, ?, ?)",
+            (event_id, helper_user_id, time.time()),
+        )
+
+    # -------- Medical info --------
+
+    def get_user_medical_info(self, user_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT label, value FROM medical WHERE user_id = ?", (user_id,))
+        return dict(rows) or None
+
+    def get_all_medical_info(self) -> Dict[int, Dict[str, Any]]:
+        res: Dict[int, Dict[str, Any]] = {}
+        for user_id, label, value in self._query("SELECT user_id, label, value FROM medical"):
+            res.setdefault(user_id, {})[label] = value
+        return res
+
+    def replace_medical_info(self, all_info: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Replace the medical table with a fresh copy (coordinators edit it in Sheets).
+        """
+        rows = [
+            (user_id, label, str(value))
+            for user_id, info in all_info.items()
+            for label, value in info.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM medical")
+                self._conn.executemany(
+                    "INSERT INTO medical (user_id, label, value) VALUES (?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteJournal:
+    """
+    Local append-only write-ahead journal for outbound Sheets mutations.
+
+    Every mutation is written as one JSON line and fsync'd before the caller
+    continues; once it reached Sheets an {"ack": seq} line is appended.
+    On open, entries without an ack are returned for replay and the file is
+    rewritten to contain only those; the same compaction runs once the file
+    has `truncate_after` lines.
+
+    Methods block on disk I/O – call them off the event loop.
+    """
+
+    def __init__(self, path: str, truncate_after: int = 1000) -> None:
+        self.path = path
+        self.truncate_after = truncate_after
+
+        self._lock = threading.Lock()
+        self._fh = None
+        self._next_seq = 1
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._lines = 0
+
+    def open(self) -> List[Dict[str, Any]]:
+        """
+        Load the journal and return unacknowledged entries in seq order.
+        """
+        with self._lock:
+            entries: Dict[int, Dict[str, Any]] = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as fh:
+                    for line in fh:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # torn write at the tail of a crash
+                            logger.warning("Skipping corrupt journal line in %s", self.path)
+                            continue
+                        if "ack" in record:
+                            entries.pop(record["ack"], None)
+                        else:
+                            entries[record["seq"]] = record
+                            self._next_seq = max(self._next_seq, record["seq"] + 1)
+
+            self._pending = dict(sorted(entries.items()))
+            self._rewrite()
+            return list(self._pending.values())
+
+    def append(self, op: str, args: Dict[str, Any]) -> int:
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            record = {"seq": seq, "op": op, "args": args}
+            self._write(record)
+            self._pending[seq] = record
+            return seq
+
+    def ack(self, seqs: Iterable[Optional[int]]) -> None:
+        with self._lock:
+            for seq in seqs:
+                if seq is None or self._pending.pop(seq, None) is None:
+                    continue
+                self._write({"ack": seq})
+
+            # some entry is nearly always pending under steady traffic: compact
+            # to the pending entries instead of waiting for an empty journal.
+            # With a large backlog (Sheets down) wait until half the lines are
+            # dead, so every ack does not rewrite the whole file.
+            if self._lines >= max(self.truncate_after, 2 * len(self._pending)):
+                self._rewrite()
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    # -------- internals --------
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fsync()
+        self._lines += 1
+
+    def _fsync(self) -> None:
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def _rewrite(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for record in self._pending.values():
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
+
+        if self._fh is not None:
+            self._fh.close()
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._lines = len(self._pending)
@@ -0,0 +1,107 @@
+# Compact, versioned callback_data for SOS buttons.
+#
+# v1 layout:  s1<action><resource>:<event_id>
+#     s1rw:02t3z97nqygw0   request water
+#     s1o-:02t3z97nqygw0   opt in
+#
+# One byte per action/resource keeps payloads far below Telegram's 64-byte
+# limit. Pre-v1 payloads ("sos:<action>[:<resource>]:<event_id>") still
+# decode, so buttons on old messages keep working.
+import functools
+import re
+from typing import Dict, NamedTuple, Optional
+
+# Telegram rejects longer callback_data
+MAX_CALLBACK_DATA = 64
+
+VERSION = "1"
+_PREFIX = "s" + VERSION
+_LEGACY_PREFIX = "sos:"
+
+# matches every SOS payload (for CallbackQueryHandler(pattern=...))
+PATTERN = r"^(s1|sos:)"
+
+# -------- Actions --------
+
+REQ = "req"
+OPTIN = "optin"
+VIEW_HELPERS = "view_helpers"
+RESOLVED = "resolved"
+BACK = "back"
+
+_ACTION_CODES: Dict[str, str] = {
+    REQ: "r",
+    OPTIN: "o",
+    VIEW_HELPERS: "h",
+    RESOLVED: "x",
+    BACK: "b",
+}
+_ACTIONS_BY_CODE = {code: action for action, code in _ACTION_CODES.items()}
+
+# -------- Resources --------
+
+_RESOURCE_CODES: Dict[str, str] = {
+    "water": "w",
+    "medicine": "m",
+    "power": "p",
+}
+_RESOURCES_BY_CODE = {code: resource for resource, code in _RESOURCE_CODES.items()}
+_NO_RESOURCE = "-"
+
+# base36 snowflake, legacy composite "<chat_id>_<message_id>" or a bare legacy id
+_valid_event_id = re.compile(r"-?[0-9A-Za-z_]{1,48}").fullmatch
+
+
+class InvalidCallback(ValueError):
+    pass
+
+
+class SOSCallback(NamedTuple):
+    action: str
+    event_id: str
+    resource: Optional[str] = None
+
+
+def encode(action: str, event_id: str, resource: Optional[str] = None) -> str:
+    try:
+        action_code = _ACTION_CODES[action]
+        resource_code = _RESOURCE_CODES[resource] if action == REQ else _NO_RESOURCE
+    except KeyError:
+        raise ValueError(f"Cannot encode SOS callback action={action!r} resource={resource!r}")
+
+    data = f"{_PREFIX}{action_code}{resource_code}:{event_id}"
+    if len(data.encode("utf-8")) > MAX_CALLBACK_DATA or not _valid_event_id(event_id):
+        raise ValueError(f"Invalid event_id for callback_data: {event_id!r}")
+    return data
+
+
+@functools.lru_cache(maxsize=4096)
+def decode(data: str) -> SOSCallback:
+    """
+    Parse and validate an SOS payload; the only place that does.
+    Raises InvalidCallback for anything malformed.
+    Cached: the same few buttons per active SOS are tapped over and over.
+    """
+    if data.startswith(_PREFIX):
+        head, sep, event_id = data[len(_PREFIX):].partition(":")
+        if not sep or len(head) != 2:
+            raise InvalidCallback(data)
+        action = _ACTIONS_BY_CODE.get(head[0])
+        resource = _RESOURCES_BY_CODE.get(head[1]) if action == REQ else None
+        if action is None or (action == REQ and resource is None):
+            raise InvalidCallback(data)
+    elif data.startswith(_LEGACY_PREFIX):
+        parts = data.split(":")
+        action = parts[1] if len(parts) > 1 else None
+        if action == REQ and len(parts) == 4 and parts[2] in _RESOURCE_CODES:
+            resource, event_id = parts[2], parts[3]
+        elif action in _ACTION_CODES and action != REQ and len(parts) == 3:
+            resource, event_id = None, parts[2]
+        else:
+            raise InvalidCallback(data)
+    else:
+        raise InvalidCallback(data)
+
+    if not _valid_event_id(event_id):
+        raise InvalidCallback(data)
+    return SOSCallback(action, event_id, resource)
@@ -1,28 +1,48 @@
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
+from utils.callback_codec import BACK, OPTIN, REQ, RESOLVED, VIEW_HELPERS, encode
 
-def sos_main_keyboard(event_id: int) -> InlineKeyboardMarkup:
+
+def sos_main_keyboard(event_id: str) -> InlineKeyboardMarkup:
     """
     Keyboard shown under SOS message in گروه/سوپرگروه.
     """
     kb = [
         [
-            InlineKeyboardButton("💧 آب", callback_data=f"sos:req:water:{event_id}"),
-            InlineKeyboardButton("💊 دارو", callback_data=f"sos:req:medicine:{event_id}"),
-            InlineKeyboardButton("💪 نیرو", callback_data=f"sos:req:power:{event_id}"),
+            InlineKeyboardButton("💧 آب", callback_data=encode(REQ, event_id, "water")),
+            InlineKeyboardButton("💊 دارو", callback_data=encode(REQ, event_id, "medicine")),
+            InlineKeyboardButton("💪 نیرو", callback_data=encode(REQ, event_id, "power")),
         ],
         [
-            InlineKeyboardButton("✅ کمک می‌کنم", callback_data=f"sos:optin:{event_id}"),
-            InlineKeyboardButton("👥 یاری‌دهندگان", callback_data=f"sos:view_helpers:{event_id}"),
+            InlineKeyboardButton("✅ کمک می‌کنم", callback_data=encode(OPTIN, event_id)),
+            InlineKeyboardButton("👥 یاری‌دهندگان", callback_data=encode(VIEW_HELPERS, event_id)),
         ],
         [
-            InlineKeyboardButton("🚫 خطر رفع شد", callback_data=f"sos:resolved:{event_id}"),
+            InlineKeyboardButton("🚫 خطر رفع شد", callback_data=encode(RESOLVED, event_id)),
         ],
     ]
     return InlineKeyboardMarkup(kb)
 
 
-def back_to_sos_keyboard(event_id: int) -> InlineKeyboardMarkup:
+def back_to_sos_keyboard(event_id: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
-        [[InlineKeyboardButton("⬅️ بازگشت", callback_data=f"sos:back:{event_id}")]]
+        [[InlineKeyboardButton("⬅️ بازگشت", callback_data=encode(BACK, event_id))]]
+    )
+
+
+def sos_alert_keyboard(link: str) -> InlineKeyboardMarkup:
+    """
+    Under the SOS alert DM: opens the SOS message in its group.
+    """
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🚨 مشاهده درخواست کمک", url=link)]])
+
+
+def share_location_keyboard() -> ReplyKeyboardMarkup:
+    """
+    Private chat only: Telegram asks the user before sending the location.
+    """
+    return ReplyKeyboardMarkup(
+        [[KeyboardButton("📍 ارسال موقعیت من", request_location=True)]],
+        resize_keyboard=True,
+        one_time_keyboard=True,
     )
@@ -0,0 +1,307 @@
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# seconds; covers a dict hit up to a Sheets call stuck in backoff
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        # updated from the event loop and from storage worker threads
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels: Any) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+            plain = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{plain} {series[-1]:g}")
+            lines.append(f"{self.name}_count{plain} {cumulative:g}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]) -> None:
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+
+
+class Registry:
+    """
+    Holds every metric plus collectors: coroutines run right before each
+    scrape to refresh gauges that are cheaper to read than to track.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]) -> None:
+        self._collectors.append(collector)
+
+    async def collect(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception:
+                logger.exception("Metrics collector %s failed", collector)
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# -------- Metrics --------
+
+HANDLER_SECONDS = REGISTRY.register(
+    Histogram("sos_handler_seconds", "Telegram handler latency.", ["handler"])
+)
+CALLBACK_SECONDS = REGISTRY.register(
+    Histogram("sos_callback_seconds", "SOS button latency by callback action.", ["action"])
+)
+SHEETS_CALLS = REGISTRY.register(
+    Counter("sheets_calls_total", "Google Sheets API calls.", ["worksheet", "op", "outcome"])
+)
+SHEETS_CALL_SECONDS = REGISTRY.register(
+    Histogram("sheets_call_seconds", "Google Sheets API call latency.", ["worksheet", "op"])
+)
+TIME_TO_FIRST_HELPER = REGISTRY.register(
+    Histogram(
+        "sos_time_to_first_helper_seconds",
+        "Time from /sos to its first helper opt-in.",
+        buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+    )
+)
+ACTIVE_SESSIONS = REGISTRY.register(Gauge("sos_active_sessions", "Open SOS sessions."))
+ACTIVE_HELPERS = REGISTRY.register(
+    Gauge("sos_active_helpers", "Helpers opted in to open SOS sessions.")
+)
+SHEETS_QUEUE_DEPTH = REGISTRY.register(
+    Gauge("sheets_queue_depth", "Sheets calls waiting for quota.", ["kind"])
+)
+SHEETS_BUFFERED_ROWS = REGISTRY.register(
+    Gauge("sheets_buffered_rows", "Rows waiting in the write-behind append buffer.")
+)
+SHEETS_JOURNAL_PENDING = REGISTRY.register(
+    Gauge("sheets_journal_pending", "Journaled writes not yet acknowledged by Sheets.")
+)
+SESSIONS_EXPIRED = REGISTRY.register(
+    Counter("sos_sessions_expired_total", "SOS sessions closed by inactivity / max TTL.")
+)
+BROADCAST_MESSAGES = REGISTRY.register(
+    Counter("sos_broadcast_messages_total", "SOS alert DMs by outcome.", ["outcome"])
+)
+
+
+def track_handler(name: str) -> Callable:
+    """
+    Decorator recording an async handler's latency in sos_handler_seconds.
+    """
+
+    def decorator(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with HANDLER_SECONDS.time(handler=name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MeteredProxy:
+    """
+    Wraps a gspread Worksheet / Spreadsheet: every method call is counted
+    and timed under (worksheet, op). Attributes pass through unchanged.
+    """
+
+    def __init__(self, target: Any, worksheet: str) -> None:
+        self._target = target
+        self._worksheet = worksheet
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = attr(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                SHEETS_CALL_SECONDS.observe(
+                    time.perf_counter() - started, worksheet=self._worksheet, op=name
+                )
+                SHEETS_CALLS.inc(worksheet=self._worksheet, op=name, outcome=outcome)
+
+        return call
+
+
+# -------- HTTP endpoint --------
+
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+        # drain headers
+        while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = (await REGISTRY.collect()).encode("utf-8")
+            status = "200 OK"
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+            content_type = "text/plain"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Serve GET /metrics (Prometheus text format) on the bot's event loop.
+    """
+    server = await asyncio.start_server(_serve, host, port)
+    logger.info("Metrics endpoint on http://%s:%s/metrics", host, port)
+    return server
+